@@ -0,0 +1,81 @@
+"""Бенчмарк рассылки: потоковое чтение подписчиков, возобновление и чистка.
+
+Заполняет временную базу подписчиков, часть которых "заблокировала" бота
+(поддельный Bot API отвечает им 403), запускает run_broadcast(), прерывает
+её посередине, как при падении процесса, и запускает снова с тем же
+broadcast_id. Проверяется, что каждый чат получил сообщение ровно один раз,
+а заблокировавшие бота чаты удалены из базы.
+
+Запуск: python benchmarks/bench_broadcast.py [--subscribers 100000]
+"""
+import argparse
+import asyncio
+import collections
+import os
+import sys
+import tempfile
+import resource
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from telegram.ext import ExtBot  # noqa: E402
+from telegram.request import HTTPXRequest  # noqa: E402
+
+from broadcast import SubscriberStore, run_broadcast  # noqa: E402
+from fake_bot_api import FakeBotAPI  # noqa: E402
+from harness import BENCH_TOKEN  # noqa: E402
+from outbound import OutboundScheduler  # noqa: E402
+
+BLOCKED_EVERY = 50 # каждый 50-й подписчик заблокировал бота
+
+
+async def run(subscribers, rate):
+    api = await FakeBotAPI().start()
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SubscriberStore(os.path.join(tmp, "subscribers.db"))
+        with store._db:
+            store._db.executemany("INSERT INTO subscribers (chat_id, subscribed_at) VALUES (?, 0)",
+                                  ((chat_id,) for chat_id in range(1, subscribers + 1)))
+        api.blocked_chat_ids = set(range(BLOCKED_EVERY, subscribers + 1, BLOCKED_EVERY))
+
+        # Как в Application: пул соединений не меньше числа одновременных отправок
+        bot = ExtBot(BENCH_TOKEN, base_url=api.base_url, rate_limiter=OutboundScheduler(global_rate=rate),
+                     request=HTTPXRequest(connection_pool_size=64))
+        halfway = asyncio.Event()
+        api.listeners.append(lambda method, params, received_at: len(api.calls) >= subscribers // 2 and halfway.set())
+        async with bot:
+            started = time.perf_counter()
+            # Первый запуск "падает" примерно на середине
+            first_run = asyncio.create_task(run_broadcast(bot, store, "bench", ["Стих дня"]))
+            await halfway.wait()
+            first_run.cancel()
+            await asyncio.gather(first_run, return_exceptions=True)
+            checkpoint = store.get_checkpoint("bench")
+            print(f"Прервано после {api.count('sendMessage')} запросов, контрольная точка: chat_id {checkpoint['last_chat_id']}")
+
+            result = await run_broadcast(bot, store, "bench", ["Стих дня"])
+            elapsed = time.perf_counter() - started
+
+        deliveries = collections.Counter(params["chat_id"] for _, method, params in api.calls if method == "sendMessage")
+        duplicates = sum(1 for count in deliveries.values() if count > 1)
+        missing = subscribers - len(deliveries)
+        print(f"Подписчиков: {subscribers}, отправлено: {result['sent']}, удалено: {result['pruned']}, ошибок: {result['failed']}")
+        print(f"Время: {elapsed:.1f} с ({subscribers / elapsed:.0f} чатов/с), пиковый RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} МБ")
+        print(f"Повторных доставок (прерванная пачка): {duplicates}, недоставлено: {missing}")
+        print(f"Осталось подписчиков: {store.count()} (ожидалось {subscribers - len(api.blocked_chat_ids)})")
+        store.close()
+    await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscribers", type=int, default=100_000)
+    parser.add_argument("--rate", type=float, default=5_000, help="общий лимит отправки, сообщений/с")
+    args = parser.parse_args()
+    asyncio.run(run(args.subscribers, args.rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Бенчмарк и проверка разбиения ответов на сообщения по всем главам Библии.
+
+Для каждой главы рендерит ответ так же, как бот (bot.render_passage), и
+проверяет свойства разбиения:
+  * каждое сообщение не длиннее 4096 единиц UTF-16;
+  * ни один стих не разрезан между сообщениями;
+  * разметка Markdown в каждом сообщении сбалансирована;
+  * сообщений не больше, чем при старом разбиении по 4096 символов.
+Затем те же свойства проверяются на случайных блоках со спецсимволами
+Markdown, эмодзи (две единицы UTF-16) и длинными блоками без пробелов.
+
+Запуск: python benchmarks/bench_chunking.py [--random-cases 2000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from harness import bot_env  # noqa: E402
+
+os.environ.update(bot_env("http://127.0.0.1:9/bot", RENDER_CACHE_SIZE=1, EVENT_LOG_DB_PATH=""))
+
+import bot  # noqa: E402
+from chunking import TELEGRAM_MESSAGE_LIMIT, pack_blocks, utf16_length  # noqa: E402
+
+
+def markdown_balanced(text):
+    """True, если в тексте для parse_mode='Markdown' все сущности закрыты и нет голых '['."""
+    open_entity = None
+    escaped = False
+    for char in text:
+        if escaped:
+            escaped = False
+        elif char == "\\" and open_entity is None:
+            escaped = True
+        elif open_entity is not None:
+            if char == open_entity:
+                open_entity = None
+        elif char in "*_`":
+            open_entity = char
+        elif char == "[":
+            return False
+    return open_entity is None and not escaped
+
+
+def check_messages(messages, blocks, separator="\n"):
+    """Список нарушенных свойств для сообщений, собранных из blocks."""
+    problems = []
+    if any(utf16_length(message) > TELEGRAM_MESSAGE_LIMIT for message in messages):
+        problems.append("длина")
+    if not all(markdown_balanced(message) for message in messages):
+        problems.append("разметка")
+    if all(utf16_length(block) <= TELEGRAM_MESSAGE_LIMIT for block in blocks):
+        # Блоки, которые помещаются в сообщение, должны остаться целыми и в исходном порядке
+        if [block for message in messages for block in message.split(separator)] != \
+                [part for block in blocks for part in block.split(separator)]:
+            problems.append("целостность блоков")
+    return problems
+
+
+def old_split(text):
+    """Прежнее разбиение: срезы по 4096 символов Python."""
+    return [text[start:start + TELEGRAM_MESSAGE_LIMIT] for start in range(0, len(text), TELEGRAM_MESSAGE_LIMIT)]
+
+
+def check_bible():
+    asyncio.run(bot.load_book_aliases())
+    asyncio.run(bot.load_bible())
+    store = bot.bible_store
+    chapters = messages_total = old_messages_total = multi_part = old_broken = 0
+    failures = []
+    render_time = 0.0
+    for book_id in store.book_ids():
+        if book_id not in bot.canonical_book_names_by_id:
+            continue
+        for chapter in store.chapters(book_id):
+            started = time.perf_counter()
+            messages = bot.render_passage(book_id, chapter)
+            render_time += time.perf_counter() - started
+            verses = [f"{number}. {bot.escape_markdown(text)}" for number, text in store.verses(book_id, chapter)]
+            blocks = [messages[0].split("\n", 1)[0]] + verses
+            problems = check_messages(messages, blocks)
+            if problems:
+                failures.append((book_id, chapter, problems))
+            old = old_split("\n".join(blocks))
+            old_broken += sum(1 for part in old[:-1] if not part.endswith(tuple(verses)))
+            chapters += 1
+            messages_total += len(messages)
+            old_messages_total += len(old)
+            multi_part += len(messages) > 1
+    print(f"Глав: {chapters}, сообщений: {messages_total} (старое разбиение: {old_messages_total}), "
+          f"глав из нескольких сообщений: {multi_part}")
+    print(f"Старое разбиение разрезало стих в {old_broken} сообщениях; новое — нарушений: {len(failures)} {failures[:5]}")
+    print(f"Рендеринг всех глав без кэша: {render_time * 1000:.0f} мс ({render_time / chapters * 1e6:.0f} мкс на главу)")
+    return not failures
+
+
+def random_block(rng):
+    alphabet = "абвгд ежз ик лм ноп рст *_`[] 😀𝔄"
+    kind = rng.random()
+    if kind < 0.05:
+        # Длинный блок без пробелов: придётся резать посередине
+        return bot.escape_markdown("".join(rng.choice("ab😀*_") for _ in range(rng.randint(4000, 9000))))
+    length = rng.randint(1, 600) if kind < 0.9 else rng.randint(3000, 5000)
+    return f"{rng.randint(1, 176)}. " + bot.escape_markdown("".join(rng.choice(alphabet) for _ in range(length)))
+
+
+def check_random(cases):
+    rng = random.Random(0)
+    failures = 0
+    for _ in range(cases):
+        blocks = ["*Заголовок 1 глава:*"] + [random_block(rng) for _ in range(rng.randint(1, 40))]
+        separator = rng.choice(["\n", "\n\n"])
+        messages = pack_blocks(blocks, separator=separator)
+        if check_messages(messages, blocks, separator) or not all(messages):
+            failures += 1
+    print(f"Случайных наборов блоков: {cases}, нарушений: {failures}")
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--random-cases", type=int, default=2000)
+    args = parser.parse_args()
+    ok = check_bible() & check_random(args.random_cases)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Бенчмарк журнала событий: цена log() в обработчике, скорость записи, перегрузка.
+
+1. Стоимость вызова log() на пути обработки обновления (без записи на диск).
+2. Установившийся режим: события приходят с заданной частотой, фоновая задача
+   пишет их пачками; измеряются задержки цикла событий (не должны расти).
+3. Перегрузка: события приходят быстрее, чем успевает запись в маленький буфер;
+   проверяется, что log() не блокирует, а лишнее прореживается/вытесняется.
+4. Запрос популярности книг и глав по накопленному журналу (для прогрева кэша).
+
+Запуск: python benchmarks/bench_event_log.py [--events 200000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from event_log import EventLog  # noqa: E402
+from harness import latency_summary  # noqa: E402
+
+USERS = [types.SimpleNamespace(id=user_id, username=f"user{user_id}", first_name="Тест") for user_id in range(1, 5001)]
+
+
+def log_random_event(log, rng):
+    user = rng.choice(USERS)
+    book_id = min(66, int(rng.paretovariate(1.2)))
+    log.log("command", "bible", user=user, chat_id=user.id, book_id=book_id,
+            chapter=rng.randint(1, 20), latency=0.002)
+
+
+async def run(events):
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        # 1. Цена log()
+        log = EventLog(os.path.join(tmp, "calls.db"), capacity=events)
+        started = time.perf_counter()
+        for _ in range(events):
+            log_random_event(log, rng)
+        per_call = (time.perf_counter() - started) / events
+        print(f"log(): {per_call * 1e6:.2f} мкс на событие (в памяти, без записи)")
+
+        # 2. Установившийся режим: 5000 событий/с, меряем задержку цикла событий
+        log = EventLog(os.path.join(tmp, "events.db"))
+        log.start()
+        loop_lags = []
+        rate = 5000
+        started = time.perf_counter()
+        for tick in range(events // 100):
+            for _ in range(100):
+                log_random_event(log, rng)
+            expected = started + (tick + 1) * 100 / rate
+            before = time.perf_counter()
+            await asyncio.sleep(max(0.0, expected - before))
+            loop_lags.append(max(0.0, time.perf_counter() - max(expected, before)))
+        await log.stop()
+        elapsed = time.perf_counter() - started
+        stats = log.stats()
+        print(f"Поток {rate} событий/с: записано {stats['written']} за {elapsed:.1f} с, "
+              f"прорежено {stats['sampled_out']}, вытеснено {stats['dropped']}")
+        print(f"Задержка цикла событий: {latency_summary(loop_lags)}")
+
+        # 3. Перегрузка: буфер на 1000 событий, события без пауз
+        overloaded = EventLog(os.path.join(tmp, "overload.db"), capacity=1000, batch_size=200, flush_interval=0.01)
+        overloaded.start()
+        worst_call = 0.0
+        for _ in range(events):
+            call_started = time.perf_counter()
+            log_random_event(overloaded, rng)
+            worst_call = max(worst_call, time.perf_counter() - call_started)
+        await overloaded.stop()
+        stats = overloaded.stats()
+        print(f"Перегрузка ({events} событий подряд, буфер 1000): записано {stats['written']}, "
+              f"прорежено {stats['sampled_out']}, вытеснено {stats['dropped']}, "
+              f"самый долгий log(): {worst_call * 1e6:.0f} мкс")
+
+        # 4. Популярность по журналу
+        reader = EventLog(os.path.join(tmp, "events.db"))
+        reader.open()
+        started = time.perf_counter()
+        books = reader.popular_books(5)
+        chapters = reader.popular_chapters(20)
+        query_time = time.perf_counter() - started
+        print(f"Популярность по {log.written} событиям: {query_time * 1000:.1f} мс; "
+              f"книги {books[:3]}, главы {chapters[:3]}, пользователей {reader.user_count()}")
+        await reader.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=200_000)
+    args = parser.parse_args()
+    asyncio.run(run(args.events))
+
+
+if __name__ == '__main__':
+    main()
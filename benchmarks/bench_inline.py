@@ -0,0 +1,106 @@
+"""Нагрузочный стенд inline-режима: тысячи последовательностей нажатий клавиш.
+
+Запускает bot.py в режиме polling против поддельного Bot API и воспроизводит
+набор запросов "@bot ...": каждый синтетический пользователь печатает ссылку
+или слова по одной букве, и на каждое нажатие приходит inline-запрос, как в
+настоящем Telegram. Задержка — время от выдачи обновления в getUpdates до
+answerInlineQuery с тем же id. Бот должен отвечать на последний запрос
+каждой последовательности, а промежуточные может пропускать.
+
+Запуск: python benchmarks/bench_inline.py [--sequences 2000] [--concurrency 100] [--p99-target-ms 500]
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import signal
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_bot_api import FakeBotAPI, inline_query_update  # noqa: E402
+from harness import bot_env, latency_summary, percentile, start_bot_process  # noqa: E402
+
+TARGETS = [
+    "Ин 3:16", "Иоанна 1:1", "Пс 22", "Псалом 90:1-4", "Быт 1:1", "1 Кор 13:4-7", "Мф 5:3-12",
+    "Рим 8:28", "Откр 21", "Еккл 3:1", "Ис 53:5", "Евр 11:1", "любовь", "свет земля", "благодать и истина",
+]
+STARTUP_TIMEOUT = 120
+
+
+async def run(sequences, concurrency, p99_target_ms, debounce_ms):
+    api = await FakeBotAPI().start()
+    env = bot_env(api.base_url, INLINE_DEBOUNCE_MS=debounce_ms, EVENT_LOG_DB_PATH="")
+    ready = asyncio.Event()
+    fed_at = {} # id запроса -> время выдачи в getUpdates
+    answered_at = {}
+
+    def on_call(method, params, received_at):
+        if method == "getUpdates":
+            ready.set()
+        elif method == "answerInlineQuery":
+            answered_at[str(params["inline_query_id"])] = received_at
+
+    api.listeners.append(on_call)
+    process = await start_bot_process(env, quiet=os.getenv('BENCH_VERBOSE') is None)
+    try:
+        await asyncio.wait_for(ready.wait(), STARTUP_TIMEOUT)
+        rng = random.Random(0)
+        update_ids = itertools.count(1)
+        final_ids = []
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def type_query(user_id):
+            target = rng.choice(TARGETS)
+            async with semaphore:
+                for length in range(1, len(target) + 1):
+                    update_id = next(update_ids)
+                    fed_at[str(update_id)] = time.perf_counter()
+                    api.feed(inline_query_update(update_id, user_id, target[:length]))
+                    # Пауза между нажатиями: 40-250 мс, иногда задумывается подольше
+                    await asyncio.sleep(rng.uniform(0.04, 0.25) if rng.random() > 0.05 else rng.uniform(0.4, 1.0))
+                final_ids.append(str(update_id))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(type_query(1_000 + i) for i in range(sequences)))
+        await asyncio.sleep(1 + debounce_ms / 1000) # последние ответы
+        elapsed = time.perf_counter() - started
+
+        latencies = [answered_at[query_id] - fed_at[query_id] for query_id in answered_at if query_id in fed_at]
+        final_latencies = [answered_at[query_id] - fed_at[query_id] for query_id in final_ids if query_id in answered_at]
+        unanswered_final = sum(1 for query_id in final_ids if query_id not in answered_at)
+        print(f"Последовательностей: {sequences}, inline-запросов: {len(fed_at)} за {elapsed:.1f} с "
+              f"({len(fed_at) / elapsed:.0f} запросов/с)")
+        print(f"Ответов: {len(answered_at)}, пропущено промежуточных: {len(fed_at) - len(answered_at)}, "
+              f"без ответа на последний запрос: {unanswered_final}")
+        print(f"Задержка ответа (все): {latency_summary(latencies)}")
+        print(f"Задержка ответа на последний запрос: {latency_summary(final_latencies)}")
+        p99 = percentile(sorted(final_latencies), 0.99) * 1000
+        passed = p99 <= p99_target_ms and unanswered_final == 0
+        print(f"Цель p99 <= {p99_target_ms} мс (пауза в наборе {debounce_ms} мс): {'OK' if passed else 'НЕ ДОСТИГНУТА'}")
+
+        process.send_signal(signal.SIGTERM)
+        await asyncio.wait_for(process.wait(), 60)
+        return passed
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sequences", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100, help="сколько пользователей печатают одновременно")
+    parser.add_argument("--p99-target-ms", type=float, default=500)
+    parser.add_argument("--debounce-ms", type=int, default=250)
+    args = parser.parse_args()
+    passed = asyncio.run(run(args.sequences, args.concurrency, args.p99_target_ms, args.debounce_ms))
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
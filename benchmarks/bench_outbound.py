@@ -0,0 +1,120 @@
+"""Бенчмарк планировщика исходящих сообщений против поддельного Bot API.
+
+Одновременно запускает массовую рассылку (по одному сообщению в много чатов,
+приоритет PRIORITY_BULK) и интерактивные ответы (несколько сообщений подряд в
+небольшое число чатов). Поддельный Bot API отвечает 429 на часть запросов.
+Отчёт: задержки по приоритетам, число повторов, фактическая пиковая скорость
+отправки за любую секунду (не больше общего лимита, иначе код выхода 1). Правки
+сообщения в группе (как при навигации по меню) не должны ждать лимита группы.
+
+Запуск: python benchmarks/bench_outbound.py [--bulk 600] [--interactive 40] [--retry-rate 0.02]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from telegram.ext import ExtBot  # noqa: E402
+
+from fake_bot_api import FakeBotAPI  # noqa: E402
+from harness import BENCH_TOKEN, latency_summary  # noqa: E402
+from outbound import PRIORITY_BULK, OutboundScheduler  # noqa: E402
+
+
+def peak_rate(timestamps, window=1.0):
+    """Наибольшее число событий в любом окне длиной window секунд."""
+    timestamps = sorted(timestamps)
+    peak = start = 0
+    for end, moment in enumerate(timestamps):
+        while moment - timestamps[start] > window:
+            start += 1
+        peak = max(peak, end - start + 1)
+    return peak
+
+
+class RecordingScheduler(OutboundScheduler):
+    """Планировщик, запоминающий момент, когда каждая отправка выпущена в Bot API."""
+
+    def __init__(self):
+        super().__init__()
+        self.dispatched = []
+
+    async def _call(self, callback, args, kwargs, endpoint):
+        if endpoint == "sendMessage":
+            self.dispatched.append(time.perf_counter())
+        return await super()._call(callback, args, kwargs, endpoint)
+
+
+async def run(bulk, interactive, retry_rate):
+    api = await FakeBotAPI(retry_after_rate=retry_rate, retry_after=1).start()
+    scheduler = RecordingScheduler()
+    bot = ExtBot(BENCH_TOKEN, base_url=api.base_url, rate_limiter=scheduler)
+    async with bot:
+        bulk_latencies = []
+        interactive_latencies = []
+
+        async def send_bulk(chat_id):
+            started = time.perf_counter()
+            await bot.send_message(chat_id, "Стих дня", rate_limit_args={"priority": PRIORITY_BULK})
+            bulk_latencies.append(time.perf_counter() - started)
+
+        async def send_interactive(chat_id):
+            # Глава из трёх частей подряд, как в обработчике chapter:
+            for part in range(3):
+                started = time.perf_counter()
+                await bot.send_message(chat_id, f"Часть {part + 1}")
+                interactive_latencies.append(time.perf_counter() - started)
+
+        edit_latencies = []
+
+        async def group_menu_edits():
+            # Нажатия кнопок меню в группе: правки одного сообщения, лимит 20 сообщений в минуту их не касается
+            await asyncio.sleep(1)
+            for _ in range(10):
+                started = time.perf_counter()
+                await bot.edit_message_text("Выберите книгу:", chat_id=-100_500, message_id=1)
+                edit_latencies.append(time.perf_counter() - started)
+
+        async def interactive_burst():
+            # Интерактивные запросы приходят, когда рассылка уже заполнила очередь
+            await asyncio.sleep(1)
+            await asyncio.gather(*(send_interactive(500_000 + i) for i in range(interactive)))
+
+        started = time.perf_counter()
+        await asyncio.gather(interactive_burst(), group_menu_edits(), *(send_bulk(1_000 + i) for i in range(bulk)))
+        elapsed = time.perf_counter() - started
+
+    await api.stop()
+    send_times = [received_at for received_at, method, _ in api.calls if method == "sendMessage"]
+    stats = scheduler.stats()
+    print(f"Рассылка: {bulk} сообщений, интерактивных: {interactive * 3}, доля 429: {retry_rate:.0%}")
+    print(f"Всего за {elapsed:.1f} с, запросов к API: {len(send_times)}, повторов после 429: {stats['retries']}")
+    peak = peak_rate(scheduler.dispatched)
+    print(f"Пиковая скорость: {peak} сообщений за 1 с при выпуске (лимит {scheduler.global_rate:g}), "
+          f"{peak_rate(send_times)} по времени получения поддельным API (с разбросом HTTP), "
+          f"максимум в очереди: {stats['max_waiting']}")
+    print(f"Интерактивные: {latency_summary(interactive_latencies)}")
+    print(f"Рассылка:      {latency_summary(bulk_latencies)}")
+    print(f"Правки в группе: {latency_summary(edit_latencies)}")
+    if peak > scheduler.global_rate:
+        print(f"Ошибка: пиковая скорость {peak} выше общего лимита {scheduler.global_rate:g} сообщений/с")
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bulk", type=int, default=600)
+    parser.add_argument("--interactive", type=int, default=40)
+    parser.add_argument("--retry-rate", type=float, default=0.02)
+    args = parser.parse_args()
+    passed = asyncio.run(run(args.bulk, args.interactive, args.retry_rate))
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
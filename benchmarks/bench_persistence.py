@@ -0,0 +1,212 @@
+"""Бенчмарк сохранения состояния пользователей: задержка обработчиков при 100 000+ пользователей.
+
+Заранее заполняет базу состояния (позиция чтения, закладки, перевод) для
+--users пользователей, затем запускает bot.py в режиме polling против
+поддельного Bot API дважды: без сохранения состояния и с ним (с частой
+записью на диск, USER_STATE_UPDATE_INTERVAL=1). С постоянной частотой
+приходят /bible, /continue, /bookmark и нажатия кнопок глав от случайных
+пользователей; задержка — от выдачи обновления в getUpdates до первого
+ответа в тот же чат. Отчёт: время запуска, память процесса бота и
+перцентили задержки для обоих прогонов, а после остановки проверяется, что
+состояние затронутых пользователей записано в базу.
+
+Затем бот запускается с --workers рабочими процессами, и --group-users
+пользователей ставят закладку командой в общей группе (chat_id < 0 не совпадает
+с ID пользователя). Проверяется, что у каждого из них в базе сохранились
+прежние закладки и позиция и добавилась новая закладка, то есть обновление
+обработал процесс, загрузивший состояние пользователя.
+
+Запуск: python benchmarks/bench_persistence.py [--users 100000] [--updates 3000] [--rate 80]
+        [--workers 2] [--group-users 200]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_bot_api import FakeBotAPI, callback_update, message_update  # noqa: E402
+from harness import bot_env, latency_summary, rss_mb, start_bot_process  # noqa: E402
+
+REFERENCES = ["Ин 3:16", "Пс 22", "1 Кор 13:4-7", "Быт 1:1", "Мф 5", "Рим 8:28", "Откр 21"]
+STARTUP_TIMEOUT = 300
+FIRST_USER_ID = 10_000
+GROUP_CHAT_ID = -1001234567
+GROUP_BOOKMARK = [43, 3, 16] # "Ин 3:16"; в заполненной базе все закладки на первые главы
+
+
+def populate(db_path, users):
+    """База состояния с users пользователями в формате SQLitePersistence."""
+    rng = random.Random(0)
+    db = sqlite3.connect(db_path)
+    db.execute("CREATE TABLE user_data (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)")
+    rows = []
+    for user_id in range(FIRST_USER_ID, FIRST_USER_ID + users):
+        data = {
+            "position": [rng.randint(1, 66), 1, 0],
+            "bookmarks": [[rng.randint(1, 66), 1, rng.randint(0, 10)] for _ in range(rng.randint(0, 5))],
+        }
+        if rng.random() < 0.2:
+            data["translation"] = "rst"
+        rows.append((user_id, json.dumps(data, ensure_ascii=False, separators=(",", ":"), sort_keys=True), time.time()))
+    db.executemany("INSERT INTO user_data VALUES (?, ?, ?)", rows)
+    db.commit()
+    db.close()
+
+
+def make_update(update_id, user_id, rng):
+    kind = rng.random()
+    if kind < 0.4:
+        return message_update(update_id, user_id, "/bible " + rng.choice(REFERENCES))
+    if kind < 0.6:
+        return message_update(update_id, user_id, "/continue")
+    if kind < 0.7:
+        return message_update(update_id, user_id, "/bookmark")
+    return callback_update(update_id, user_id, f"chapter:{rng.choice((19, 40, 43, 45))}:{rng.randint(1, 5)}")
+
+
+async def run_once(label, env_overrides, users, updates, rate):
+    api = await FakeBotAPI().start()
+    env = bot_env(api.base_url, EVENT_LOG_DB_PATH="", DAILY_VERSE_TIME="", **env_overrides)
+    polling = asyncio.Event()
+    fed_at = {} # chat_id -> время выдачи обновления
+    latencies = []
+
+    def on_call(method, params, received_at):
+        if method == "getUpdates":
+            polling.set()
+        elif method in ("sendMessage", "editMessageText"):
+            started = fed_at.pop(params.get("chat_id"), None)
+            if started is not None:
+                latencies.append(received_at - started)
+
+    api.listeners.append(on_call)
+    launched = time.perf_counter()
+    process = await start_bot_process(env)
+    try:
+        await asyncio.wait_for(polling.wait(), STARTUP_TIMEOUT)
+        startup = time.perf_counter() - launched
+        rng = random.Random(1)
+        # Каждый пользователь присылает одно обновление, чтобы ответ однозначно относился к нему
+        user_ids = rng.sample(range(FIRST_USER_ID, FIRST_USER_ID + users), updates)
+        started = time.perf_counter()
+        for i, user_id in enumerate(user_ids):
+            await asyncio.sleep(max(0.0, started + i / rate - time.perf_counter()))
+            fed_at[user_id] = time.perf_counter()
+            api.feed(make_update(i + 1, user_id, rng))
+        deadline = time.perf_counter() + 30
+        while fed_at and time.perf_counter() < deadline:
+            await asyncio.sleep(0.1)
+        memory = rss_mb(process.pid)
+        process.send_signal(signal.SIGTERM)
+        await asyncio.wait_for(process.wait(), 60)
+        print(f"{label}: запуск {startup:.1f} с, RSS {memory:.0f} МБ, ответов {len(latencies)}/{updates}, "
+              f"без ответа {len(fed_at)}")
+        print(f"  задержка: {latency_summary(latencies)}")
+        return user_ids
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        await api.stop()
+
+
+async def check_group_chats(db_path, users, workers, group_users):
+    """Закладки из группы в многопроцессном режиме дописываются к сохранённому состоянию пользователя."""
+    user_ids = random.Random(2).sample(range(FIRST_USER_ID, FIRST_USER_ID + users), group_users)
+    db = sqlite3.connect(db_path)
+    before = {user_id: json.loads(data) for user_id, data in db.execute(
+        f"SELECT user_id, data FROM user_data WHERE user_id IN ({','.join('?' * len(user_ids))})", user_ids)}
+    db.close()
+
+    api = await FakeBotAPI().start()
+    env = bot_env(api.base_url, EVENT_LOG_DB_PATH="", DAILY_VERSE_TIME="", WORKERS=workers,
+                  USER_STATE_DB_PATH=db_path, USER_STATE_UPDATE_INTERVAL=1,
+                  # Все закладки идут в одну группу: лимит группы проверяет bench_outbound.py
+                  RATE_LIMIT_GROUP_PER_MIN=1_000_000)
+    polling = asyncio.Event()
+    replied = asyncio.Event()
+    replies = 0
+
+    def on_call(method, params, received_at):
+        nonlocal replies
+        if method == "getUpdates":
+            polling.set()
+        elif method == "sendMessage" and params.get("chat_id") == GROUP_CHAT_ID:
+            replies += 1
+            if replies == len(user_ids):
+                replied.set()
+
+    api.listeners.append(on_call)
+    process = await start_bot_process(env)
+    try:
+        await asyncio.wait_for(polling.wait(), STARTUP_TIMEOUT)
+        for i, user_id in enumerate(user_ids):
+            api.feed(message_update(i + 1, GROUP_CHAT_ID, "/bookmark Ин 3:16", user_id=user_id))
+        await asyncio.wait_for(replied.wait(), 60)
+        process.send_signal(signal.SIGTERM)
+        await asyncio.wait_for(process.wait(), 60)
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        await api.stop()
+
+    db = sqlite3.connect(db_path)
+    after = {user_id: json.loads(data) for user_id, data in db.execute(
+        f"SELECT user_id, data FROM user_data WHERE user_id IN ({','.join('?' * len(user_ids))})", user_ids)}
+    db.close()
+    broken = 0
+    for user_id in user_ids:
+        expected = dict(before[user_id])
+        expected["bookmarks"] = expected.get("bookmarks", []) + [GROUP_BOOKMARK]
+        broken += after.get(user_id) != expected
+    print(f"Группа, {workers} процесса: {len(user_ids)} пользователей поставили закладку, "
+          f"состояние сохранено верно у {len(user_ids) - broken}, потеряно или перезаписано у {broken}")
+    return broken == 0
+
+
+async def run(users, updates, rate, workers, group_users):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "users.db")
+        started = time.perf_counter()
+        populate(db_path, users)
+        print(f"База состояния: {users} пользователей, {os.path.getsize(db_path) / 2 ** 20:.1f} МБ "
+              f"(заполнена за {time.perf_counter() - started:.1f} с)")
+        await run_once("Без сохранения состояния", {"USER_STATE_DB_PATH": ""}, users, updates, rate)
+        persisted_from = time.time()
+        touched = await run_once("С сохранением состояния",
+                                 {"USER_STATE_DB_PATH": db_path, "USER_STATE_UPDATE_INTERVAL": 1},
+                                 users, updates, rate)
+
+        db = sqlite3.connect(db_path)
+        stored = db.execute("SELECT COUNT(*) FROM user_data").fetchone()[0]
+        fresh = db.execute("SELECT COUNT(*) FROM user_data WHERE updated >= ?", (persisted_from,)).fetchone()[0]
+        db.close()
+        print(f"После остановки: в базе {stored} пользователей, перезаписано {fresh} "
+              f"(обновления были от {len(touched)} пользователей; без изменений записи не повторяются)")
+        group_passed = await check_group_chats(db_path, users, workers, group_users) if workers > 1 else True
+        return stored >= users and group_passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--updates", type=int, default=3000)
+    parser.add_argument("--rate", type=float, default=80, help="обновлений в секунду (ниже предела пропускной способности)")
+    parser.add_argument("--workers", type=int, default=2, help="рабочих процессов для проверки групп (1 — пропустить)")
+    parser.add_argument("--group-users", type=int, default=200)
+    args = parser.parse_args()
+    passed = asyncio.run(run(args.users, args.updates, args.rate, args.workers, args.group_users))
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
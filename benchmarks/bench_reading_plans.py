@@ -0,0 +1,113 @@
+"""Бенчмарк планировщика доставки планов чтения (reading_plans.DeliveryScheduler).
+
+1. Ставит --timers таймеров на случайное время в ближайшие сутки и
+   переносит часть из них (как при смене времени доставки): время на
+   операцию и память кучи.
+2. Живой прогон: --live таймеров со сроками, равномерно распределёнными по
+   --window секундам, срабатывают через run(); callback переносит таймер на
+   сутки вперёд, как настоящая доставка. Отчёт: опоздание срабатываний
+   относительно срока (p50/p95/p99/max) и загрузка CPU — одна задача asyncio
+   на все таймеры, без периодического обхода.
+3. Построение планов "Библия за год" и "Новый Завет за 90 дней" по
+   синтетической Библии: время и разброс объёма дней в стихах.
+
+Запуск: python benchmarks/bench_reading_plans.py [--timers 300000] [--live 100000] [--window 10]
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from harness import ROOT, latency_summary  # noqa: E402
+from synthetic_bible import bible_json_path  # noqa: E402
+
+from bible_store import open_store  # noqa: E402
+from reading_plans import DeliveryScheduler, build_plan  # noqa: E402
+
+DAY = 24 * 3600
+
+
+def bench_schedule(timers):
+    rng = random.Random(0)
+    now = time.time()
+    tracemalloc.start()
+    scheduler = DeliveryScheduler()
+    started = time.perf_counter()
+    for user_id in range(timers):
+        scheduler.schedule(user_id, now + rng.uniform(0, DAY))
+    schedule_time = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for user_id in rng.sample(range(timers), timers // 10):
+        scheduler.schedule(user_id, now + rng.uniform(0, DAY))
+    reschedule_time = time.perf_counter() - started
+    print(f"Таймеров: {timers}: постановка {schedule_time / timers * 1e6:.2f} мкс, "
+          f"перенос {reschedule_time / (timers // 10) * 1e6:.2f} мкс на таймер, "
+          f"память {peak / 2 ** 20:.1f} МБ ({peak / timers:.0f} байт на таймер), "
+          f"записей в куче после переносов: {scheduler.stats()['heap']}")
+
+
+async def bench_live(timers, window):
+    scheduler = DeliveryScheduler()
+    rng = random.Random(1)
+    start = time.time() + 0.5
+    due = {}
+    for user_id in range(timers):
+        due[user_id] = start + rng.uniform(0, window)
+        scheduler.schedule(user_id, due[user_id])
+    lateness = []
+    fired = asyncio.Event()
+
+    async def deliver(user_id):
+        lateness.append(time.time() - due[user_id])
+        scheduler.schedule(user_id, due[user_id] + DAY) # следующая доставка — завтра
+        if len(lateness) == timers:
+            fired.set()
+
+    cpu_before = resource.getrusage(resource.RUSAGE_SELF)
+    runner = asyncio.create_task(scheduler.run(deliver, concurrency=30))
+    await asyncio.wait_for(fired.wait(), window + 60)
+    cpu_after = resource.getrusage(resource.RUSAGE_SELF)
+    runner.cancel()
+    await asyncio.gather(runner, return_exceptions=True)
+    cpu = (cpu_after.ru_utime + cpu_after.ru_stime) - (cpu_before.ru_utime + cpu_before.ru_stime)
+    print(f"Живой прогон: {timers} срабатываний за {window} с ({timers / window:.0f}/с), CPU {cpu:.1f} с "
+          f"({cpu / timers * 1e6:.1f} мкс на срабатывание с переносом), таймеров после: {len(scheduler)}")
+    print(f"  опоздание: {latency_summary(lateness)}")
+
+
+def bench_plans():
+    json_path = bible_json_path()
+    store = open_store(json_path, os.path.join(ROOT, "data", "book_aliases.json"),
+                       os.path.splitext(json_path)[0] + ".bin")
+    for title, book_ids, days in (("Библия за год", range(1, 67), 365), ("Новый Завет за 90 дней", range(40, 67), 90)):
+        started = time.perf_counter()
+        plan = build_plan(store, book_ids, days)
+        elapsed = time.perf_counter() - started
+        weights = [sum(len(store.verses(book_id, chapter)) for book_id, chapter in day) for day in plan]
+        print(f"{title}: {len(plan)} дней за {elapsed * 1000:.0f} мс, стихов в день: "
+              f"среднее {sum(weights) / len(weights):.0f}, мин {min(weights)}, макс {max(weights)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--timers", type=int, default=300_000)
+    parser.add_argument("--live", type=int, default=100_000)
+    parser.add_argument("--window", type=float, default=10)
+    args = parser.parse_args()
+    bench_schedule(args.timers)
+    asyncio.run(bench_live(args.live, args.window))
+    bench_plans()
+
+
+if __name__ == '__main__':
+    main()
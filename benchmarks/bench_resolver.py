@@ -0,0 +1,56 @@
+"""Микробенчмарк BookResolver: стоимость запроса при росте таблицы алиасов.
+
+Таблица строится из канонических названий data/book_aliases.json и дополняется
+случайными синтетическими алиасами. Для каждого размера измеряется среднее
+время resolve() на фиксированном наборе запросов (точные, префиксы, опечатки,
+неизвестные слова) — оно должно оставаться примерно постоянным.
+
+Запуск: python benchmarks/bench_resolver.py
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from references import BookResolver  # noqa: E402
+
+ALIASES_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "data", "book_aliases.json")
+TABLE_SIZES = (100, 1_000, 10_000, 50_000)
+QUERIES = ["Ин", "Иоанн", "1кор", "1 Кор", "Откровение", "Иоан", "Матф", "Быите",
+           "откровенее", "филипп", "Псалтирь", "2цар", "неизвестно", "xyz"]
+ROUNDS = 2_000
+ALPHABET = "абвгдежзийклмнопрстуфхцчшщыэюя"
+
+
+def build_mapping(size, rng):
+    with open(ALIASES_PATH, 'r', encoding='utf-8') as f:
+        canonical_names = list(json.load(f))
+    mapping = {name.lower(): name for name in canonical_names}
+    while len(mapping) < size:
+        alias = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(4, 14)))
+        mapping.setdefault(alias, rng.choice(canonical_names))
+    return mapping
+
+
+def main():
+    rng = random.Random(42)
+    print(f"{'алиасов':>10} {'сборка, мс':>12} {'мкс/запрос':>12}")
+    for size in TABLE_SIZES:
+        mapping = build_mapping(size, rng)
+        started = time.perf_counter()
+        resolver = BookResolver(mapping)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        for _ in range(ROUNDS):
+            for query in QUERIES:
+                resolver.resolve(query)
+        per_query_us = (time.perf_counter() - started) / (ROUNDS * len(QUERIES)) * 1e6
+        print(f"{resolver.alias_count:>10} {build_ms:>12.1f} {per_query_us:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
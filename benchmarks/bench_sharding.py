@@ -0,0 +1,114 @@
+"""Бенчмарк многопроцессного режима: пропускная способность от числа рабочих процессов.
+
+Для каждого значения WORKERS запускает bot.py в режиме polling против
+поддельного Bot API, выдаёт через getUpdates пачку команд /bible из разных
+чатов и ждёт ответа sendMessage на каждое обновление. Отчёт: обновлений в
+секунду, ускорение относительно одного процесса, суммарная память процессов
+бота (PSS — разделяемые страницы делятся между процессами) и загрузка CPU
+самого стенда (если он близок к 100% одного ядра, упираемся в стенд, а не в бота).
+
+Запуск: python benchmarks/bench_sharding.py [--workers 1,2,4] [--updates 4000]
+"""
+import argparse
+import asyncio
+import os
+import resource
+import signal
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_bot_api import FakeBotAPI, message_update  # noqa: E402
+from harness import bot_env, start_bot_process  # noqa: E402
+
+REFERENCES = ["Ин 3:16", "Пс 22", "1 Кор 13:4-7", "Быт 1:1", "Мф 5:3-12", "Рим 8:28", "Откр 21"]
+STARTUP_TIMEOUT = 120
+
+
+def process_tree(pid):
+    """pid и все его потомки (по /proc/<pid>/task/*/children)."""
+    pids = [pid]
+    for current in pids:
+        try:
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def memory_mb(pids):
+    """Суммарные RSS и PSS процессов в МБ (PSS делит разделяемые страницы между процессами)."""
+    rss = pss = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Rss:"):
+                        rss += int(line.split()[1])
+                    elif line.startswith("Pss:"):
+                        pss += int(line.split()[1])
+        except OSError:
+            pass
+    return rss / 1024, pss / 1024
+
+
+async def run_once(workers, updates):
+    api = await FakeBotAPI().start()
+    env = bot_env(api.base_url, WORKERS=workers, EVENT_LOG_DB_PATH="", DAILY_VERSE_TIME="")
+    polling = asyncio.Event()
+    replied = set()
+    all_replied = asyncio.Event()
+
+    def on_call(method, params, received_at):
+        if method == "getUpdates":
+            polling.set()
+        elif method == "sendMessage":
+            replied.add(params.get("chat_id"))
+            if len(replied) >= updates:
+                all_replied.set()
+
+    api.listeners.append(on_call)
+    process = await start_bot_process(env)
+    try:
+        await asyncio.wait_for(polling.wait(), STARTUP_TIMEOUT)
+        await asyncio.sleep(1) # рабочие процессы заканчивают initialize()
+        cpu_before = resource.getrusage(resource.RUSAGE_SELF)
+        started = time.perf_counter()
+        for i in range(updates):
+            api.feed(message_update(i + 1, 100_000 + i, "/bible " + REFERENCES[i % len(REFERENCES)]))
+        await asyncio.wait_for(all_replied.wait(), 600)
+        elapsed = time.perf_counter() - started
+        cpu_after = resource.getrusage(resource.RUSAGE_SELF)
+        harness_cpu = (cpu_after.ru_utime + cpu_after.ru_stime - cpu_before.ru_utime - cpu_before.ru_stime) / elapsed
+        pids = process_tree(process.pid)
+        rss, pss = memory_mb(pids)
+
+        process.send_signal(signal.SIGTERM)
+        return_code = await asyncio.wait_for(process.wait(), 120)
+        return updates / elapsed, rss, pss, len(pids), harness_cpu, return_code
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4", help="значения WORKERS через запятую")
+    parser.add_argument("--updates", type=int, default=4000)
+    args = parser.parse_args()
+    print(f"Ядер CPU: {os.cpu_count()}")
+    baseline = None
+    for workers in (int(value) for value in args.workers.split(",")):
+        rate, rss, pss, processes, harness_cpu, return_code = asyncio.run(run_once(workers, args.updates))
+        baseline = baseline or rate
+        print(f"WORKERS={workers}: {rate:.0f} обновлений/с (x{rate / baseline:.2f}), процессов: {processes}, "
+              f"RSS {rss:.0f} МБ, PSS {pss:.0f} МБ, CPU стенда {harness_cpu:.0%}, код выхода {return_code}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,384 @@
+"""Сводный нагрузочный прогон бота против поддельного Bot API.
+
+Запускает bot.py (то же Application со всеми обработчиками, что и в
+production: build_application, post_init, лимиты, журнал событий и сохранение
+состояния во временном каталоге) в режиме polling против поддельного Bot API и
+воспроизводит реалистичные смеси обновлений:
+
+    bible  — /bible со стихами, диапазонами, главами и сокращениями с опечатками
+    menu   — цепочки навигации /bible_menu → Завет → книга (→ страница) → глава
+    long   — длинные главы (Пс 118) командой и кнопкой, ответ из нескольких сообщений
+    text   — свободный текст: поиск по словам и фразам и просто сообщения
+    mixed  — всё вместе в пропорциях MIX
+
+Каждый сценарий — отдельный процесс бота. --concurrency виртуальных
+пользователей работают по замкнутому циклу: отправить обновление, дождаться
+первого ответа в свой чат, отправить следующее. Каждая сессия (одна команда или
+одна цепочка меню) идёт в новом чате, поэтому ответы однозначно относятся к
+обновлению. Отчёт по сценарию: время запуска (до первого getUpdates),
+пропускная способность, p50/p95/p99 до первого ответа и до последнего
+сообщения, сообщений на обновление, CPU на обновление, текущая и пиковая
+память процесса бота. Генератор нагрузки и поддельный Bot API делят процессор
+с ботом, поэтому при сравнении прогонов на одной машине CPU на обновление
+стабильнее пропускной способности и задержек.
+
+Отдельно в чистых процессах измеряется запуск: импорт bot.py, load_book_aliases()
+и load_bible() — с компиляцией хранилища из bible.json (холодный) и с готовым
+хранилищем (тёплый).
+
+--save сохраняет результаты в JSON, --baseline сравнивает с сохранёнными ранее
+и завершается с кодом 1, если пропускная способность упала, а задержка p95,
+CPU на обновление или время запуска выросли больше чем на --tolerance.
+
+Запуск: python benchmarks/bench_suite.py [--scenarios bible,menu,long,text,mixed]
+        [--updates 2000] [--concurrency 20] [--save result.json] [--baseline result.json]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import signal
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_bot_api import FakeBotAPI, callback_update, message_update  # noqa: E402
+from harness import (ROOT, bot_env, cpu_seconds, latency_summary, percentile, rss_mb,  # noqa: E402
+                     start_bot_process)
+from synthetic_bible import CHAPTER_COUNTS  # noqa: E402
+
+REFERENCES = [
+    "Ин 3:16", "Пс 22", "1 Кор 13:4-7", "Быт 1:1", "Мф 5:3-12", "Рим 8:28", "Откр 21",
+    "Иоан 1:1-5", "1кор 13", "Евр 11:1", "Пс 90:1-7", "Лк 15", "Еккл 3:1-8", "Фил 4:13",
+]
+LONG_PASSAGES = [("message", "/bible Пс 118"), ("button", "chapter:19:118"),
+                 ("message", "/bible Пс 118:1-120"), ("message", "/bible Числ 7")]
+FREE_TEXT = [
+    "любовь долготерпит", "в начале было слово", "свет миру", "хлеб", "Господь пастырь",
+    "милость и истина", "привет", "спасибо за стих", "где почитать про веру", "как дела",
+]
+# Доли сценариев в смешанной нагрузке
+MIX = (("bible", 0.5), ("menu", 0.2), ("text", 0.2), ("long", 0.1))
+OLD_TESTAMENT = range(1, 40)
+NEW_TESTAMENT = range(40, 67)
+CHAPTER_GRID_PAGE_SIZE = 50 # как в bot.py
+
+STARTUP_TIMEOUT = 300
+STEP_TIMEOUT = 30
+FIRST_CHAT_ID = 1_000_000
+REPLY_METHODS = ("sendMessage", "editMessageText")
+
+
+# --- Сценарии: сессия — список шагов (вид обновления, текст или callback_data) ---
+
+def bible_session(rng):
+    return [("message", "/bible " + rng.choice(REFERENCES))]
+
+
+def long_session(rng):
+    return [rng.choice(LONG_PASSAGES)]
+
+
+def text_session(rng):
+    return [("message", rng.choice(FREE_TEXT))]
+
+
+def menu_session(rng):
+    """Цепочка навигации по меню, как её проходит пользователь; заканчивается открытием главы."""
+    category, book_ids = rng.choice((("old_testament", OLD_TESTAMENT), ("new_testament", NEW_TESTAMENT)))
+    steps = [("message", "/bible_menu"), ("button", f"show_books:{category}")]
+    if rng.random() < 0.3:
+        # Заглянул в одну книгу и вернулся к списку
+        steps += [("button", f"book:{rng.choice(book_ids)}"), ("button", f"show_books:{category}")]
+    book_id = rng.choice(book_ids)
+    steps.append(("button", f"book:{book_id}"))
+    chapters = CHAPTER_COUNTS[book_id - 1]
+    first, last = 1, min(chapters, CHAPTER_GRID_PAGE_SIZE)
+    if chapters > CHAPTER_GRID_PAGE_SIZE and rng.random() < 0.5:
+        steps.append(("button", f"book:{book_id}:2"))
+        first, last = CHAPTER_GRID_PAGE_SIZE + 1, min(chapters, 2 * CHAPTER_GRID_PAGE_SIZE)
+    steps.append(("button", f"chapter:{book_id}:{rng.randint(first, last)}"))
+    return steps
+
+
+SCENARIOS = {"bible": bible_session, "menu": menu_session, "long": long_session, "text": text_session}
+
+
+def mixed_session(rng):
+    names, weights = zip(*MIX)
+    name = rng.choices(names, weights)[0]
+    return name, SCENARIOS[name](rng)
+
+
+# --- Прогон сценария ---
+
+class Replies:
+    """Ответы бота по чатам: ожидание первого ответа, время последнего и их число."""
+
+    def __init__(self):
+        self.waiters = {} # chat_id -> future с временем первого ответа
+        self.last = {} # chat_id -> время последнего ответа
+        self.count = {} # chat_id -> число ответов
+        self.last_reply_at = 0.0
+
+    def on_call(self, method, params, received_at):
+        if method not in REPLY_METHODS:
+            return
+        chat_id = params.get("chat_id")
+        self.last[chat_id] = received_at
+        self.count[chat_id] = self.count.get(chat_id, 0) + 1
+        self.last_reply_at = received_at
+        waiter = self.waiters.pop(chat_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(received_at)
+
+
+async def run_scenario(name, updates, concurrency, warmup, tmp):
+    api = await FakeBotAPI().start()
+    env = bot_env(
+        api.base_url,
+        # Поддельный Bot API лимитов не имеет, а цепочки меню идут быстрее, чем жмёт человек
+        RATE_LIMIT_CHAT_PER_SEC="100000",
+        DAILY_VERSE_TIME="",
+        EVENT_LOG_DB_PATH=os.path.join(tmp, f"{name}-events.db"),
+        USER_STATE_DB_PATH=os.path.join(tmp, f"{name}-users.db"),
+        SUBSCRIBERS_DB_PATH=os.path.join(tmp, f"{name}-subscribers.db"),
+    )
+    replies = Replies()
+    polling = asyncio.Event()
+
+    def on_call(method, params, received_at):
+        if method == "getUpdates":
+            polling.set()
+        replies.on_call(method, params, received_at)
+
+    api.listeners.append(on_call)
+    launched = time.perf_counter()
+    process = await start_bot_process(env)
+    try:
+        await asyncio.wait_for(polling.wait(), STARTUP_TIMEOUT)
+        startup = time.perf_counter() - launched
+
+        rng = random.Random(2)
+        sequence = itertools.count()
+        update_ids = itertools.count(1)
+        chat_ids = itertools.count(FIRST_CHAT_ID)
+        loop = asyncio.get_running_loop()
+        latencies = {} # вид сессии -> задержки первого ответа
+        final_steps = [] # (вид сессии, chat_id, время отправки, ответов до шага) последнего шага сессии
+        lost = 0
+        measured = {}
+
+        async def virtual_user():
+            nonlocal lost
+            while True:
+                if name == "mixed":
+                    kind, steps = mixed_session(rng)
+                else:
+                    kind, steps = name, SCENARIOS[name](rng)
+                chat_id = next(chat_ids)
+                for position, (update_kind, payload) in enumerate(steps):
+                    number = next(sequence)
+                    if number >= warmup + updates:
+                        return
+                    if number == warmup:
+                        measured["started"] = time.perf_counter()
+                        measured["cpu"] = cpu_seconds(process.pid)
+                    update_id = next(update_ids)
+                    if update_kind == "message":
+                        update = message_update(update_id, chat_id, payload)
+                    else:
+                        update = callback_update(update_id, chat_id, payload)
+                    waiter = replies.waiters[chat_id] = loop.create_future()
+                    replies_before = replies.count.get(chat_id, 0)
+                    fed_at = time.perf_counter()
+                    api.feed(update)
+                    try:
+                        answered_at = await asyncio.wait_for(waiter, STEP_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        lost += 1
+                        break
+                    if number >= warmup:
+                        latencies.setdefault(kind, []).append(answered_at - fed_at)
+                        if position == len(steps) - 1:
+                            final_steps.append((kind, chat_id, fed_at, replies_before))
+
+        await asyncio.gather(*(virtual_user() for _ in range(concurrency)))
+        # Дожидаемся хвостов многосообщенческих ответов: полсекунды без новых ответов
+        while time.perf_counter() - replies.last_reply_at < 0.5:
+            await asyncio.sleep(0.1)
+        elapsed = replies.last_reply_at - measured["started"]
+        cpu = cpu_seconds(process.pid) - measured["cpu"]
+        memory, peak_memory = rss_mb(process.pid), rss_mb(process.pid, "VmHWM")
+        process.send_signal(signal.SIGTERM)
+        await asyncio.wait_for(process.wait(), 60)
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        await api.stop()
+
+    first_reply = [value for values in latencies.values() for value in values]
+    full_reply = [replies.last[chat_id] - fed_at for _, chat_id, fed_at, _ in final_steps]
+    messages = [replies.count[chat_id] - before for _, chat_id, _, before in final_steps]
+    values = sorted(first_reply)
+    result = {
+        "startup_s": startup,
+        "updates": len(first_reply),
+        "lost": lost,
+        "throughput": len(first_reply) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(values, 0.5) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "max_ms": percentile(values, 1.0) * 1000,
+        "messages_per_update": sum(messages) / len(messages) if messages else 0.0,
+        "cpu_ms_per_update": cpu / len(first_reply) * 1000 if first_reply else 0.0,
+        "rss_mb": memory,
+        "peak_rss_mb": peak_memory,
+    }
+    print(f"[{name}] запуск {startup:.1f} с; {result['updates']} обновлений, без ответа {lost}; "
+          f"{result['throughput']:.0f} обн./с; CPU {result['cpu_ms_per_update']:.2f} мс на обновление; "
+          f"RSS {memory:.0f} МБ (пик {peak_memory:.0f} МБ)")
+    print(f"  первый ответ: {latency_summary(first_reply)}")
+    print(f"  весь ответ (последнее сообщение, {result['messages_per_update']:.1f} сообщ. на обновление): "
+          f"{latency_summary(full_reply)}")
+    if len(latencies) > 1:
+        for kind, kind_latencies in sorted(latencies.items()):
+            print(f"    {kind}: {len(kind_latencies)} обновлений, {latency_summary(kind_latencies)}")
+    return result
+
+
+# --- Запуск: load_book_aliases + load_bible в чистом процессе ---
+
+def startup_child():
+    """Выполняется в отдельном процессе: время импорта bot.py, load_book_aliases() и load_bible()."""
+    sys.path.insert(0, ROOT)
+    started = time.perf_counter()
+    import bot
+    imported = time.perf_counter()
+    asyncio.run(bot.load_book_aliases())
+    aliases_loaded = time.perf_counter()
+    asyncio.run(bot.load_bible())
+    bible_loaded = time.perf_counter()
+    print(json.dumps({
+        "ok": bot.bible_store is not None,
+        "import_s": imported - started,
+        "aliases_s": aliases_loaded - imported,
+        "bible_s": bible_loaded - aliases_loaded,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+async def measure_startup_once(store_path):
+    env = bot_env("http://127.0.0.1:9/bot", BIBLE_STORE_PATH=store_path, EVENT_LOG_DB_PATH="")
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.abspath(__file__), "--startup-child", cwd=ROOT, env=env,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+    )
+    output, _ = await process.communicate()
+    # Последняя строка — результат, до неё — сообщения bot.py о загрузке
+    result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+    if not result["ok"]:
+        raise RuntimeError("bot.load_bible() не загрузил Библию")
+    return result
+
+
+async def measure_startup(tmp, repeat):
+    store_path = os.path.join(tmp, "bible.bin")
+    cold = await measure_startup_once(store_path)
+    warm = [await measure_startup_once(store_path) for _ in range(repeat)]
+    result = {"cold_" + key: value for key, value in cold.items() if key != "ok"}
+    for key in ("import_s", "aliases_s", "bible_s", "max_rss_mb"):
+        result["warm_" + key] = statistics.median(run[key] for run in warm)
+    result["load_s"] = result["warm_aliases_s"] + result["warm_bible_s"]
+    print(f"Запуск (медиана из {repeat}): импорт bot.py {result['warm_import_s'] * 1000:.0f} мс, "
+          f"load_book_aliases {result['warm_aliases_s'] * 1000:.1f} мс, "
+          f"load_bible {result['warm_bible_s'] * 1000:.1f} мс, пик RSS {result['warm_max_rss_mb']:.0f} МБ")
+    print(f"  холодный (сборка хранилища из bible.json): load_bible {result['cold_bible_s'] * 1000:.0f} мс, "
+          f"пик RSS {result['cold_max_rss_mb']:.0f} МБ")
+    return result
+
+
+# --- Сравнение с сохранёнными результатами ---
+
+def compare(results, baseline, tolerance):
+    """Печатает изменения относительно baseline и возвращает число регрессий."""
+    regressions = 0
+
+    def check(label, old, new, higher_is_better, min_delta=0.0):
+        nonlocal regressions
+        if not old:
+            return
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        regressed = worse > tolerance and abs(new - old) > min_delta
+        regressions += regressed
+        print(f"  {label}: {old:.2f} → {new:.2f} ({change:+.0%}){'  РЕГРЕССИЯ' if regressed else ''}")
+
+    print(f"Сравнение с сохранёнными результатами (допуск {tolerance:.0%}):")
+    old_startup, new_startup = baseline.get("startup"), results.get("startup")
+    if old_startup and new_startup:
+        check("load_book_aliases + load_bible, мс", old_startup["load_s"] * 1000, new_startup["load_s"] * 1000,
+              False, 5.0)
+    for name, new in results["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old is None:
+            continue
+        check(f"[{name}] обн./с", old["throughput"], new["throughput"], True)
+        # Задержки в доли миллисекунды шумят сильнее допуска, поэтому нужен и абсолютный рост
+        check(f"[{name}] p95, мс", old["p95_ms"], new["p95_ms"], False, 1.0)
+        check(f"[{name}] CPU на обновление, мс", old["cpu_ms_per_update"], new["cpu_ms_per_update"], False, 0.1)
+        check(f"[{name}] запуск, с", old["startup_s"], new["startup_s"], False, 0.2)
+    return regressions
+
+
+async def run(args):
+    results = {"scenarios": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.skip_startup:
+            results["startup"] = await measure_startup(tmp, args.repeat)
+        for name in args.scenarios.split(","):
+            name = name.strip()
+            if name not in SCENARIOS and name != "mixed":
+                raise SystemExit(f"Неизвестный сценарий: {name} (есть: {', '.join([*SCENARIOS, 'mixed'])})")
+            results["scenarios"][name] = await run_scenario(name, args.updates, args.concurrency, args.warmup, tmp)
+    return results
+
+
+def main():
+    if sys.argv[1:] == ["--startup-child"]:
+        startup_child()
+        return
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default="bible,menu,long,text,mixed")
+    parser.add_argument("--updates", type=int, default=2000, help="обновлений на сценарий (без прогрева)")
+    parser.add_argument("--concurrency", type=int, default=20, help="виртуальных пользователей")
+    parser.add_argument("--warmup", type=int, default=200, help="первые обновления не учитываются")
+    parser.add_argument("--repeat", type=int, default=3, help="повторов замера запуска")
+    parser.add_argument("--skip-startup", action="store_true", help="не замерять load_book_aliases + load_bible")
+    parser.add_argument("--save", help="сохранить результаты в JSON")
+    parser.add_argument("--baseline", help="сравнить с результатами, сохранёнными через --save")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимое ухудшение (доля)")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.save}")
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        print(f"Регрессий: {regressions}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
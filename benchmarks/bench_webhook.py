@@ -0,0 +1,107 @@
+"""Нагрузочный стенд режима webhook без настоящего Telegram.
+
+Запускает bot.py в режиме webhook, направив его на поддельный Bot API, и
+отправляет на локальный webhook синтетические обновления (/bible с разными
+ссылками) с заданным параллелизмом. Задержка обновления — время от POST на
+webhook до получения поддельным Bot API ответа sendMessage в тот же чат.
+В конце бот останавливается сигналом SIGTERM и проверяется, что он корректно
+дообработал обновления и завершился.
+
+Запуск: python benchmarks/bench_webhook.py [--updates 2000] [--concurrency 40]
+"""
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_bot_api import FakeBotAPI, message_update  # noqa: E402
+from harness import bot_env, free_port, latency_summary, start_bot_process  # noqa: E402
+
+SECRET_TOKEN = "bench-secret"
+REFERENCES = ["Ин 3:16", "Пс 22", "1 Кор 13:4-7", "Быт 1:1", "Мф 5:3-12", "Рим 8:28", "Откр 21"]
+STARTUP_TIMEOUT = 120
+
+
+async def run(updates, concurrency):
+    api = await FakeBotAPI().start()
+    port = free_port()
+    webhook_url = f"http://127.0.0.1:{port}/webhook"
+    env = bot_env(api.base_url, WEBHOOK_URL=webhook_url, WEBHOOK_LISTEN="127.0.0.1", WEBHOOK_PORT=port,
+                  WEBHOOK_PATH="webhook", WEBHOOK_SECRET_TOKEN=SECRET_TOKEN)
+
+    webhook_set = asyncio.Event()
+    replies = {} # chat_id -> future с временем первого ответа
+
+    def on_call(method, params, received_at):
+        if method == "setWebhook":
+            webhook_set.set()
+        elif method == "sendMessage":
+            future = replies.get(params.get("chat_id"))
+            if future is not None and not future.done():
+                future.set_result(received_at)
+
+    api.listeners.append(on_call)
+    started = time.perf_counter()
+    process = await start_bot_process(env)
+    try:
+        await asyncio.wait_for(webhook_set.wait(), STARTUP_TIMEOUT)
+        print(f"Бот запущен и зарегистрировал webhook за {time.perf_counter() - started:.2f} с")
+
+        async with httpx.AsyncClient(timeout=30) as client:
+            response = await client.post(webhook_url, json=message_update(1, 1, "/start"),
+                                         headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+            print(f"Запрос с неверным секретом: HTTP {response.status_code}")
+
+            semaphore = asyncio.Semaphore(concurrency)
+            latencies = []
+            errors = 0
+
+            async def send(i):
+                nonlocal errors
+                chat_id = 100_000 + i
+                update = message_update(10 + i, chat_id, "/bible " + REFERENCES[i % len(REFERENCES)])
+                replies[chat_id] = asyncio.get_running_loop().create_future()
+                async with semaphore:
+                    sent_at = time.perf_counter()
+                    response = await client.post(webhook_url, json=update,
+                                                 headers={"X-Telegram-Bot-Api-Secret-Token": SECRET_TOKEN})
+                    if response.status_code != 200:
+                        errors += 1
+                        return
+                    latencies.append(await replies[chat_id] - sent_at)
+
+            bench_started = time.perf_counter()
+            await asyncio.gather(*(send(i) for i in range(updates)))
+            elapsed = time.perf_counter() - bench_started
+
+        print(f"Обновлений: {updates}, параллелизм: {concurrency}, ошибок HTTP: {errors}")
+        print(f"Пропускная способность: {len(latencies) / elapsed:.1f} обновлений/с")
+        print(f"Задержка: {latency_summary(latencies)}")
+
+        stop_started = time.perf_counter()
+        process.send_signal(signal.SIGTERM)
+        return_code = await asyncio.wait_for(process.wait(), 60)
+        print(f"Остановка по SIGTERM: код {return_code}, {time.perf_counter() - stop_started:.2f} с")
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=40)
+    args = parser.parse_args()
+    asyncio.run(run(args.updates, args.concurrency))
+
+
+if __name__ == '__main__':
+    main()
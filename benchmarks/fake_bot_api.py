@@ -0,0 +1,198 @@
+"""Локальный поддельный Bot API для бенчмарков без настоящего Telegram.
+
+Сервер принимает запросы вида POST /bot<token>/<method>, как их отправляет
+python-telegram-bot (через TELEGRAM_API_BASE_URL=http://127.0.0.1:<port>/bot),
+отвечает правдоподобными объектами и записывает каждый вызов. getUpdates
+отдаёт обновления, положенные в очередь через feed(), поэтому бота можно
+гонять и в режиме polling. Можно добавить задержку ответа, долю ответов 429 и чаты, заблокировавшие бота (403).
+
+Здесь же лежат фабрики синтетических обновлений Telegram.
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from urllib.parse import parse_qsl
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "TGbot", "username": "tgbot_bench_bot"}
+
+
+class FakeBotAPI:
+    """Поддельный Bot API на asyncio.start_server (HTTP/1.1 с keep-alive)."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, retry_after_rate=0.0, retry_after=1):
+        self.host = host
+        self.port = port
+        self.latency = latency # Искусственная задержка каждого ответа, секунды
+        self.retry_after_rate = retry_after_rate # Доля отправок, на которые отвечаем 429
+        self.retry_after = retry_after
+        self.blocked_chat_ids = set() # На отправку в эти чаты отвечаем 403
+        self.calls = [] # (время получения, метод, параметры)
+        self.listeners = [] # Функции (метод, параметры, время), вызываются на каждый запрос
+        self._updates = asyncio.Queue()
+        self._message_ids = itertools.count(1000)
+        self._rng = random.Random(0)
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def feed(self, update):
+        """Кладёт обновление в очередь для getUpdates."""
+        self._updates.put_nowait(update)
+
+    def count(self, method):
+        return sum(1 for _, called, _ in self.calls if called == method)
+
+    # --- HTTP ---
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, path, _ = request_line.decode('latin-1').split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode('latin-1').partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, payload = await self._dispatch(path, headers.get("content-type", ""), body)
+                data = json.dumps(payload).encode('utf-8')
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n\r\n".encode('latin-1') + data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass # клиент отключился или сервер остановлен посреди long polling
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _parse_params(content_type, body):
+        if not body:
+            return {}
+        if content_type.startswith("application/json"):
+            return json.loads(body)
+        params = {}
+        for name, value in parse_qsl(body.decode('utf-8'), keep_blank_values=True):
+            try:
+                params[name] = json.loads(value)
+            except ValueError:
+                params[name] = value
+        return params
+
+    async def _dispatch(self, path, content_type, body):
+        method = path.rstrip("/").rsplit("/", 1)[-1]
+        params = self._parse_params(content_type, body)
+        received_at = time.perf_counter()
+        self.calls.append((received_at, method, params))
+        for listener in self.listeners:
+            listener(method, params, received_at)
+
+        if method == "getUpdates":
+            return "200 OK", {"ok": True, "result": await self._get_updates(params)}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if params.get("chat_id") in self.blocked_chat_ids:
+            return "403 Forbidden", {"ok": False, "error_code": 403,
+                                     "description": "Forbidden: bot was blocked by the user"}
+        if (self.retry_after_rate and "chat_id" in params
+                and self._rng.random() < self.retry_after_rate):
+            return "429 Too Many Requests", {
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+        return "200 OK", {"ok": True, "result": self._result(method, params)}
+
+    async def _get_updates(self, params):
+        offset = params.get("offset") or 0
+        timeout = params.get("timeout") or 0
+        updates = []
+        try:
+            if self._updates.empty() and timeout:
+                updates.append(await asyncio.wait_for(self._updates.get(), timeout))
+            while not self._updates.empty() and len(updates) < (params.get("limit") or 100):
+                updates.append(self._updates.get_nowait())
+        except asyncio.TimeoutError:
+            pass
+        return [update for update in updates if update["update_id"] >= offset]
+
+    def _result(self, method, params):
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = params.get("chat_id", 0)
+            return {
+                "message_id": params.get("message_id") or next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if int(chat_id) > 0 else "group"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        return True
+
+
+# --- Синтетические обновления ---
+
+def _user(chat_id):
+    return {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}", "language_code": "ru"}
+
+
+def message_update(update_id, chat_id, text, user_id=None):
+    """Текстовое сообщение в личном чате (или от user_id в группе chat_id < 0); команды размечаются entity bot_command."""
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+        "from": _user(user_id or chat_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        command = text.split(" ", 1)[0]
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    return {"update_id": update_id, "message": message}
+
+
+def callback_update(update_id, chat_id, data, message_id=1):
+    """Нажатие inline-кнопки с callback_data под сообщением бота."""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(chat_id),
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": "Выберите раздел Библии:",
+            },
+        },
+    }
+
+
+def inline_query_update(update_id, user_id, query):
+    """Inline-запрос "@bot <query>" от пользователя."""
+    return {
+        "update_id": update_id,
+        "inline_query": {"id": str(update_id), "from": _user(user_id), "query": query, "offset": ""},
+    }
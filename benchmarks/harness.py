@@ -0,0 +1,73 @@
+"""Общие помощники бенчмарков: окружение бота, запуск процесса, перцентили."""
+import asyncio
+import os
+import socket
+import sys
+
+from synthetic_bible import bible_json_path
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+BOT_PATH = os.path.join(ROOT, "bot.py")
+BENCH_TOKEN = "123456:BENCHMARK-TOKEN"
+
+
+def bot_env(api_base_url, **overrides):
+    """Переменные окружения для bot.py, направленного на поддельный Bot API."""
+    env = dict(os.environ)
+    env.update(
+        TOKEN=BENCH_TOKEN,
+        BIBLE_JSON_PATH=bible_json_path(),
+        BOOK_ALIASES_PATH=os.path.join(ROOT, "data", "book_aliases.json"),
+        TELEGRAM_API_BASE_URL=api_base_url,
+        PYTHONUNBUFFERED="1",
+        # Поддельный Bot API лимитов не имеет: меряем сам бот, а не лимиты Telegram
+        RATE_LIMIT_GLOBAL_PER_SEC="100000",
+    )
+    env.update({name: str(value) for name, value in overrides.items()})
+    return env
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def start_bot_process(env, quiet=True):
+    """Запускает bot.py отдельным процессом с заданным окружением."""
+    return await asyncio.create_subprocess_exec(
+        sys.executable, BOT_PATH, cwd=ROOT, env=env,
+        stdout=asyncio.subprocess.DEVNULL if quiet else None,
+        stderr=asyncio.subprocess.DEVNULL if quiet else None,
+    )
+
+
+def rss_mb(pid, field="VmRSS"):
+    """Память процесса из /proc/<pid>/status в МБ (VmRSS — текущая, VmHWM — пиковая)."""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def cpu_seconds(pid):
+    """Процессорное время процесса (user + system) из /proc/<pid>/stat."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def percentile(sorted_values, fraction):
+    """Перцентиль по уже отсортированному списку (метод ближайшего ранга)."""
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def latency_summary(latencies):
+    """Строка с p50/p95/p99/max в миллисекундах."""
+    values = sorted(latencies)
+    return ("p50 {:.1f} мс, p95 {:.1f} мс, p99 {:.1f} мс, max {:.1f} мс".format(
+        *(percentile(values, fraction) * 1000 for fraction in (0.5, 0.95, 0.99, 1.0))))
@@ -0,0 +1,56 @@
+"""Генератор синтетического bible.json для бенчмарков.
+
+Настоящий текст Библии не хранится в репозитории, поэтому бенчмарки, если
+BIBLE_JSON_PATH не задан, используют файл той же структуры и близкого размера:
+66 книг с реальным числом глав, 10-45 стихов в главе (176 в Пс 118/119).
+"""
+import json
+import os
+import random
+import tempfile
+
+# Число глав в каждой из 66 книг, по порядку BookId
+CHAPTER_COUNTS = [
+    50, 40, 27, 36, 34, 24, 21, 4, 31, 24, 22, 25, 29, 36, 10, 13, 10, 42, 150, 31, 12, 8,
+    66, 52, 5, 48, 12, 14, 3, 9, 1, 4, 7, 3, 3, 3, 2, 14, 4, 28, 16, 24, 21, 28, 16, 16,
+    13, 6, 6, 4, 4, 5, 3, 6, 4, 3, 1, 13, 5, 5, 3, 5, 1, 1, 1, 22,
+]
+WORDS = """
+    и в не на он с что а по это она этот к но они мы как из у который то за свой весь
+    год от так о для ты же все тот мочь вы человек такой его сказать только или ещё бы
+    себя один уже до время если сам когда другой вот говорить наш мой знать стать при
+    чтобы дело жизнь кто первый день её новый рука даже во со раз где там под можно
+    после их без самый потом надо хотеть слово идти большой место иметь Господь Бог
+    любовь вера свет земля небо дух сын отец народ закон путь сердце слава мир царь дом
+    благодать истина пророк храм вода хлеб огонь жертва завет праведный грех милость
+""".split()
+
+
+def generate(path, seed=1):
+    """Записывает синтетический bible.json в path."""
+    rng = random.Random(seed)
+    books = []
+    for book_id, chapter_count in enumerate(CHAPTER_COUNTS, 1):
+        chapters = []
+        for chapter_id in range(1, chapter_count + 1):
+            verse_count = 176 if (book_id, chapter_id) == (19, 118) else rng.randint(10, 45)
+            verses = []
+            for verse_id in range(1, verse_count + 1):
+                text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 30)))
+                verses.append({"VerseId": verse_id, "Text": text.capitalize() + "."})
+            chapters.append({"ChapterId": chapter_id, "Verses": verses})
+        books.append({"BookId": book_id, "Chapters": chapters})
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"Books": books}, f, ensure_ascii=False)
+
+
+def bible_json_path():
+    """Путь к bible.json для бенчмарка: BIBLE_JSON_PATH или сгенерированный файл во временном каталоге."""
+    path = os.getenv("BIBLE_JSON_PATH")
+    if path:
+        return os.path.abspath(path)
+    path = os.path.join(tempfile.gettempdir(), "tgbot_bench", "bible.json")
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        generate(path)
+    return path
@@ -0,0 +1,281 @@
+"""Компактное бинарное хранилище текста Библии.
+
+Файл хранилища собирается один раз из bible.json и book_aliases.json и затем
+открывается ботом через mmap. Весь текст стихов лежит одним непрерывным
+UTF-8 блоком, а навигация по книгам, главам и стихам идёт по целочисленным
+массивам смещений, поэтому поиск стиха — это срез по смещениям, а не обход
+вложенных словарей. Страницы mmap разделяются между процессами бота.
+
+Сборка вручную:
+    python bible_store.py data/bible.json data/book_aliases.json data/bible.bin
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+
+# Версия формата в magic: хранилище старой версии пересобирается в open_store()
+STORE_MAGIC = b"TGBIBLE2"
+# magic, book_slots, n_chapters, n_verses, text_len
+_HEADER = struct.Struct("<8sIIII")
+
+
+def _uint32_bytes(values):
+    arr = array("I", values)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def compile_store(bible_json_path, aliases_path, store_path):
+    """Компилирует bible.json и book_aliases.json в бинарное хранилище.
+
+    Книги без канонического названия в book_aliases.json пропускаются, как и
+    раньше при загрузке bible.json. Файл записывается атомарно через уникальный временный
+файл в том же каталоге, поэтому несколько процессов могут собирать его одновременно.
+    Возвращает количество записанных книг.
+    """
+    with open(aliases_path, 'r', encoding='utf-8') as f:
+        aliases_raw = json.load(f)
+    names_by_id = {book_id: name for name, book_id in aliases_raw.items()}
+
+    with open(bible_json_path, 'r', encoding='utf-8') as f:
+        raw_bible_data = json.load(f)
+    if "Books" not in raw_bible_data:
+        raise ValueError(f"Не найдена секция 'Books' в файле Библии: {bible_json_path}")
+
+    books = {}
+    for book_raw in raw_bible_data["Books"]:
+        book_id = book_raw.get("BookId")
+        if book_id not in names_by_id:
+            print(f"Предупреждение: Не удалось найти каноническое название для BookId: {book_id} в book_aliases.json. Эта книга будет проигнорирована.")
+            continue
+        chapters = {}
+        for chapter in book_raw.get("Chapters", []):
+            verses = {}
+            for verse in chapter.get("Verses", []):
+                verse_text = verse.get("Text")
+                if verse_text:
+                    verses[int(verse.get("VerseId"))] = verse_text
+            chapters[int(chapter.get("ChapterId"))] = verses
+        books[book_id] = chapters
+
+    book_slots = max(names_by_id) + 1 if names_by_id else 1
+    book_chapter_start = []
+    chapter_numbers = []
+    chapter_verse_start = []
+    verse_numbers = []
+    verse_text_start = []
+    text_blob = bytearray()
+
+    for book_id in range(book_slots):
+        book_chapter_start.append(len(chapter_numbers))
+        for chapter_num in sorted(books.get(book_id, {})):
+            chapter_numbers.append(chapter_num)
+            chapter_verse_start.append(len(verse_numbers))
+            verses = books[book_id][chapter_num]
+            for verse_num in sorted(verses):
+                verse_numbers.append(verse_num)
+                verse_text_start.append(len(text_blob))
+                text_blob += verses[verse_num].encode('utf-8')
+    book_chapter_start.append(len(chapter_numbers))
+    chapter_verse_start.append(len(verse_numbers))
+    verse_text_start.append(len(text_blob))
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(store_path) or ".",
+                                    prefix=os.path.basename(store_path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(STORE_MAGIC, book_slots, len(chapter_numbers), len(verse_numbers), len(text_blob)))
+            for values in (book_chapter_start, chapter_numbers, chapter_verse_start, verse_numbers, verse_text_start):
+                f.write(_uint32_bytes(values))
+            f.write(text_blob)
+        os.replace(tmp_path, store_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return len(books)
+
+
+class BibleStore:
+    """Открытое через mmap хранилище, собранное compile_store().
+
+    Книги адресуются по BookId (int), главы и стихи — по своим номерам (int).
+    Стихи также имеют сквозной индекс 0..verse_count-1 в каноническом порядке.
+    """
+
+    def __init__(self, store_path):
+        self.path = store_path
+        self._file = open(store_path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        magic, book_slots, n_chapters, n_verses, text_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != STORE_MAGIC:
+            self.close()
+            raise ValueError(f"Файл {store_path} не является хранилищем Библии.")
+        self.book_slots = book_slots
+        self.chapter_count = n_chapters
+        self.verse_count = n_verses
+        self.text_size = text_len
+
+        view = memoryview(self._mm)
+        self._views = [view]
+        offset = _HEADER.size
+        arrays = []
+        for length in (book_slots + 1, n_chapters, n_chapters + 1, n_verses, n_verses + 1):
+            arrays.append(self._uint32_view(view, offset, length))
+            offset += length * 4
+        (self._book_chapter_start, self._chapter_numbers,
+         self._chapter_verse_start, self._verse_numbers, self._verse_text_start) = arrays
+        self._text_base = offset
+
+    def _uint32_view(self, view, offset, length):
+        raw = view[offset:offset + length * 4]
+        if sys.byteorder == "little":
+            arr = raw.cast("I")
+            self._views.append(raw)
+            self._views.append(arr)
+            return arr
+        # На big-endian платформах копируем массив, т.к. файл записан в little-endian
+        arr = array("I")
+        arr.frombytes(raw)
+        arr.byteswap()
+        raw.release()
+        return arr
+
+    def close(self):
+        for view in reversed(getattr(self, "_views", [])):
+            view.release()
+        self._views = []
+        if getattr(self, "_mm", None) is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    # --- Книги ---
+
+    def has_book(self, book_id):
+        """True, если книга есть в хранилище и содержит хотя бы одну главу."""
+        if not 0 <= book_id < self.book_slots:
+            return False
+        return self._book_chapter_start[book_id + 1] > self._book_chapter_start[book_id]
+
+    def book_ids(self):
+        """BookId всех книг, присутствующих в хранилище, по возрастанию."""
+        return [book_id for book_id in range(self.book_slots) if self.has_book(book_id)]
+
+    # --- Главы ---
+
+    def _chapter_range(self, book_id):
+        if not 0 <= book_id < self.book_slots:
+            return 0, 0
+        return self._book_chapter_start[book_id], self._book_chapter_start[book_id + 1]
+
+    def _chapter_index(self, book_id, chapter):
+        lo, hi = self._chapter_range(book_id)
+        i = bisect_left(self._chapter_numbers, chapter, lo, hi)
+        if i < hi and self._chapter_numbers[i] == chapter:
+            return i
+        return None
+
+    def chapters(self, book_id):
+        """Номера глав книги по возрастанию."""
+        lo, hi = self._chapter_range(book_id)
+        return self._chapter_numbers[lo:hi].tolist()
+
+    def has_chapter(self, book_id, chapter):
+        return self._chapter_index(book_id, chapter) is not None
+
+    # --- Стихи ---
+
+    def _verse_range(self, book_id, chapter):
+        i = self._chapter_index(book_id, chapter)
+        if i is None:
+            return 0, 0
+        return self._chapter_verse_start[i], self._chapter_verse_start[i + 1]
+
+    def verse_text_at(self, index):
+        """Текст стиха по его сквозному индексу."""
+        start = self._text_base + self._verse_text_start[index]
+        end = self._text_base + self._verse_text_start[index + 1]
+        return self._mm[start:end].decode('utf-8')
+
+    def verses(self, book_id, chapter):
+        """Список (номер стиха, текст) главы по возрастанию номеров."""
+        lo, hi = self._verse_range(book_id, chapter)
+        return [(self._verse_numbers[i], self.verse_text_at(i)) for i in range(lo, hi)]
+
+    def verse_span(self, book_id, chapter, start, end):
+        """Список (номер стиха, текст) стихов главы с номерами от start до end включительно.
+
+        Границы ищутся бинарным поиском, поэтому цена не зависит от ширины диапазона.
+        """
+        lo, hi = self._verse_range(book_id, chapter)
+        first = bisect_left(self._verse_numbers, start, lo, hi)
+        last = bisect_right(self._verse_numbers, end, first, hi)
+        return [(self._verse_numbers[i], self.verse_text_at(i)) for i in range(first, last)]
+
+    def last_verse(self, book_id, chapter):
+        """Номер последнего стиха главы или None, если главы нет или она пуста."""
+        lo, hi = self._verse_range(book_id, chapter)
+        return self._verse_numbers[hi - 1] if hi > lo else None
+
+    def verse(self, book_id, chapter, verse):
+        """Текст стиха или None, если такого стиха нет."""
+        lo, hi = self._verse_range(book_id, chapter)
+        i = bisect_left(self._verse_numbers, verse, lo, hi)
+        if i < hi and self._verse_numbers[i] == verse:
+            return self.verse_text_at(i)
+        return None
+
+    def locate(self, index):
+        """Возвращает (BookId, глава, стих) для сквозного индекса стиха."""
+        chapter_index = bisect_right(self._chapter_verse_start, index, 0, self.chapter_count) - 1
+        book_id = bisect_right(self._book_chapter_start, chapter_index, 0, self.book_slots) - 1
+        return book_id, self._chapter_numbers[chapter_index], self._verse_numbers[index]
+
+
+def open_store(bible_json_path, aliases_path, store_path):
+    """Открывает хранилище, пересобирая его, если исходные JSON новее файла хранилища
+    или файл собран в старом формате.
+
+    Если bible.json отсутствует, но хранилище уже собрано, используется готовое хранилище.
+    """
+    try:
+        store_mtime = os.path.getmtime(store_path)
+    except OSError:
+        store_mtime = None
+
+    sources = [path for path in (bible_json_path, aliases_path) if os.path.exists(path)]
+    if store_mtime is None or (os.path.exists(bible_json_path)
+                               and any(os.path.getmtime(path) > store_mtime for path in sources)):
+        if not os.path.exists(bible_json_path):
+            raise FileNotFoundError(bible_json_path)
+        print(f"Сборка хранилища Библии {store_path} из {bible_json_path}...")
+        compile_store(bible_json_path, aliases_path, store_path)
+    try:
+        return BibleStore(store_path)
+    except ValueError:
+        if not os.path.exists(bible_json_path):
+            raise
+        print(f"Хранилище {store_path} собрано в старом формате, пересборка из {bible_json_path}...")
+        compile_store(bible_json_path, aliases_path, store_path)
+        return BibleStore(store_path)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4:
+        print("Использование: python bible_store.py <bible.json> <book_aliases.json> <bible.bin>")
+        sys.exit(1)
+    books_written = compile_store(sys.argv[1], sys.argv[2], sys.argv[3])
+    print(f"Хранилище {sys.argv[3]} собрано. Книг: {books_written}")
@@ -1,13 +1,28 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters, CallbackQueryHandler
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent
+from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters, CallbackQueryHandler, InlineQueryHandler, TypeHandler
+from telegram.error import Forbidden
 import os
 from dotenv import load_dotenv
 import json
 import asyncio
-import re
+import random
+import time
+from datetime import date, datetime, timedelta, timezone
 
-# Максимальная длина сообщения в Telegram (4096 символов)
-TELEGRAM_MESSAGE_LIMIT = 4096
+from bible_store import open_store
+from broadcast import SubscriberStore, run_broadcast
+from cache import LRUCache
+from chunking import escape_markdown, pack_blocks
+from event_log import EventLog, annotate_event
+from metrics import Gauge, SamplingProfiler, instrument_handler, monitor_event_loop_lag, start_http_server
+from outbound import PRIORITY_BULK, OutboundScheduler
+from persistence import SQLitePersistence
+from reading_plans import (DeliveryScheduler, build_plan, delivery_time, format_utc_offset, local_date, parse_time,
+                           parse_utc_offset)
+from references import BookResolver, parse_reference
+from search_index import open_index
+from sharding import UpdateDispatcher, fork_workers, serve_updates, wait_workers
+from translations import Translation, TranslationRegistry
 
 # Загружаем переменные окружения из файла .env
 load_dotenv()
@@ -16,8 +31,96 @@ load_dotenv()
 TOKEN = os.getenv("TOKEN")
 # Получаем путь к файлу JSON из переменной окружения. В .env должно быть BIBLE_JSON_PATH=data/bible.json
 BIBLE_JSON_PATH = os.getenv("BIBLE_JSON_PATH")
+# Код и название перевода из BIBLE_JSON_PATH (основной перевод бота)
+DEFAULT_TRANSLATION = os.getenv("DEFAULT_TRANSLATION", "rst")
+DEFAULT_TRANSLATION_TITLE = os.getenv("DEFAULT_TRANSLATION_TITLE", "Синодальный перевод")
+# Дополнительные переводы (тот же формат bible.json и те же BookId): "код:Название:путь" через точку с запятой,
+# например BIBLE_TRANSLATIONS=kjv:King James Version:data/kjv.json;ubio:Біблія Огієнка:data/ubio.json
+BIBLE_TRANSLATIONS = os.getenv("BIBLE_TRANSLATIONS", "")
+# Сколько памяти (МБ) могут занимать открытые переводы и через сколько секунд без обращений
+# дополнительный перевод можно выгрузить, если бюджет превышен
+TRANSLATIONS_MEMORY_BUDGET_MB = float(os.getenv("TRANSLATIONS_MEMORY_BUDGET_MB", "64"))
+TRANSLATIONS_IDLE_SECONDS = float(os.getenv("TRANSLATIONS_IDLE_SECONDS", "600"))
 # Получаем путь к файлу с алиасами книг. В .env должно быть BOOK_ALIASES_PATH=data/book_aliases.json
 BOOK_ALIASES_PATH = os.getenv("BOOK_ALIASES_PATH")
+# Путь к скомпилированному хранилищу Библии (по умолчанию рядом с bible.json, с расширением .bin).
+# Хранилище собирается автоматически, если его нет или bible.json новее.
+BIBLE_STORE_PATH = os.getenv("BIBLE_STORE_PATH")
+# Сколько готовых (уже разбитых на сообщения) отрывков держать в кэше рендеринга
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "512"))
+# Сколько популярных глав отрендерить заранее в post_init (0 — не прогревать кэш)
+RENDER_CACHE_WARMUP = int(os.getenv("RENDER_CACHE_WARMUP", "0"))
+# Путь к поисковому индексу (по умолчанию рядом с хранилищем, с расширением .idx)
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH")
+# Сколько стихов показывать в ответе на поисковый запрос
+SEARCH_RESULTS_LIMIT = int(os.getenv("SEARCH_RESULTS_LIMIT", "10"))
+# Inline-режим (@bot Ин 3:16): пауза после последнего нажатия клавиши перед ответом (мс),
+# размер локального кэша результатов и сколько секунд Telegram может кэшировать ответ у себя
+INLINE_DEBOUNCE_MS = int(os.getenv("INLINE_DEBOUNCE_MS", "250"))
+INLINE_CACHE_SIZE = int(os.getenv("INLINE_CACHE_SIZE", "2048"))
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "300"))
+# Адрес Bot API (например, локальный telegram-bot-api сервер): http://127.0.0.1:8081/bot
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL")
+
+# Режим webhook: включается, если задан публичный адрес WEBHOOK_URL (https://example.com/webhook)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+# Адрес и порт локального HTTP-сервера, принимающего обновления
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+# Путь, по которому сервер принимает обновления
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "webhook")
+# Секрет, который Telegram передаёт в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")
+# Сколько одновременных соединений Telegram может открыть к webhook (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# Лимиты исходящих сообщений (по умолчанию — рекомендации Bot FAQ Telegram)
+RATE_LIMIT_GLOBAL_PER_SEC = float(os.getenv("RATE_LIMIT_GLOBAL_PER_SEC", "30"))
+RATE_LIMIT_CHAT_PER_SEC = float(os.getenv("RATE_LIMIT_CHAT_PER_SEC", "1"))
+RATE_LIMIT_GROUP_PER_MIN = float(os.getenv("RATE_LIMIT_GROUP_PER_MIN", "20"))
+# Сколько раз повторять запрос после ответа 429 (RetryAfter)
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "3"))
+
+# База подписчиков рассылки (SQLite)
+SUBSCRIBERS_DB_PATH = os.getenv("SUBSCRIBERS_DB_PATH", "data/subscribers.db")
+# Время ежедневной рассылки стиха дня по UTC, ЧЧ:ММ (пустое значение отключает рассылку)
+DAILY_VERSE_TIME = os.getenv("DAILY_VERSE_TIME", "07:00")
+# Сколько подписчиков читать из базы за раз и сколько отправок держать одновременно
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "500"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "30"))
+
+# Планы чтения: время доставки по умолчанию (местное, ЧЧ:ММ) и часовой пояс пользователя по умолчанию
+READING_PLAN_TIME = os.getenv("READING_PLAN_TIME", "07:00")
+READING_PLAN_UTC_OFFSET = os.getenv("READING_PLAN_UTC_OFFSET", "+3")
+# Сколько доставок планов чтения отправлять одновременно
+READING_PLAN_CONCURRENCY = int(os.getenv("READING_PLAN_CONCURRENCY", "30"))
+
+# Журнал событий (SQLite): кто и что запрашивал; пустое значение отключает журнал
+EVENT_LOG_DB_PATH = os.getenv("EVENT_LOG_DB_PATH", "data/events.db")
+# Сколько событий держать в памяти до записи и как часто сбрасывать их в базу (секунды)
+EVENT_LOG_BUFFER_SIZE = int(os.getenv("EVENT_LOG_BUFFER_SIZE", "10000"))
+EVENT_LOG_FLUSH_INTERVAL = float(os.getenv("EVENT_LOG_FLUSH_INTERVAL", "1"))
+
+# Состояние пользователей (позиция чтения, закладки, выбранный перевод) в SQLite;
+# пустое значение отключает сохранение между перезапусками
+USER_STATE_DB_PATH = os.getenv("USER_STATE_DB_PATH", "data/users.db")
+# Как часто (секунды) записывать изменившееся состояние пользователей на диск
+USER_STATE_UPDATE_INTERVAL = float(os.getenv("USER_STATE_UPDATE_INTERVAL", "10"))
+
+# Локальный HTTP-порт метрик Prometheus (/metrics) и профилировщика (/profile/start, /profile/stop);
+# пустое значение отключает сервер. Рабочие процессы слушают METRICS_PORT + номер процесса
+METRICS_PORT = os.getenv("METRICS_PORT", "")
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# Каталог для профилей (collapsed stacks) и период выборки стеков профилировщиком (мс)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "data")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+
+# Число рабочих процессов. При WORKERS > 1 фронтальный процесс получает обновления
+# и раздаёт их рабочим процессам по chat_id (см. sharding.py)
+WORKERS = max(1, int(os.getenv("WORKERS", "1")))
+
+# ID пользователей Telegram через запятую, которым доступны служебные команды (/stats)
+ADMIN_IDS = {int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id.strip()}
 
 # Проверяем, что токен и пути к файлам загружены
 if not TOKEN:
@@ -26,24 +129,137 @@ if not BIBLE_JSON_PATH:
     raise ValueError("BIBLE_JSON_PATH не найден. Убедитесь, что он установлен в .env файле или как переменная окружения.")
 if not BOOK_ALIASES_PATH:
     raise ValueError("BOOK_ALIASES_PATH не найден. Убедитесь, что он установлен в .env файле или как переменная окружения.")
+if parse_time(READING_PLAN_TIME) is None or parse_utc_offset(READING_PLAN_UTC_OFFSET) is None:
+    raise ValueError("READING_PLAN_TIME должен быть в формате ЧЧ:ММ, а READING_PLAN_UTC_OFFSET — вида +3 или -5:30.")
+if ":" in DEFAULT_TRANSLATION:
+    raise ValueError("DEFAULT_TRANSLATION не может содержать двоеточие.")
 
 
 # Глобальные переменные для хранения данных Библии и алиасов
-bible_data_processed = {}
+bible_store = None # BibleStore (mmap) основного перевода, открывается в load_bible()
+# Все переводы по коду; основной регистрируется в load_bible() и не выгружается,
+# дополнительные открываются при первом обращении (см. translations.py)
+translations = TranslationRegistry(
+    os.path.join(os.path.dirname(__file__), BOOK_ALIASES_PATH),
+    memory_budget=TRANSLATIONS_MEMORY_BUDGET_MB * 2 ** 20,
+    idle_seconds=TRANSLATIONS_IDLE_SECONDS,
+)
+search_index = None # SearchIndex по стихам bible_store, открывается в load_search_index()
+subscriber_store = None # SubscriberStore, открывается в post_init
+WORKER_INDEX = 0 # Номер рабочего процесса (в однопроцессном режиме всегда 0)
+background_tasks = [] # Фоновые задачи (рассылки), отменяются в post_shutdown
 canonical_book_names_by_id = {} # Ключ: BookId (int), Значение: Каноническое название книги (str)
 canonical_book_ids_by_name = {} # Ключ: Каноническое название книги (str, нижний регистр), Значение: BookId (int)
 BOOK_MAPPING = {} # Ключ: Пользовательский ввод (str, нижний регистр), Значение: Каноническое название книги (str)
+book_resolver = BookResolver({}) # Префиксное дерево по BOOK_MAPPING, строится в load_book_aliases()
 
 # Для разделения на Ветхий и Новый Завет
 OLD_TESTAMENT_IDS = set(range(1, 40))
 NEW_TESTAMENT_IDS = set(range(40, 67))
 
+# Сетка глав в меню: по 5 кнопок в ряд, не больше 50 глав на странице
+# (в клавиатуре Telegram не больше 100 кнопок, а в Псалтири 150 глав)
+CHAPTER_GRID_COLUMNS = 5
+CHAPTER_GRID_PAGE_SIZE = 50
+
+# Планы чтения. Ключ: код плана, Значение: (название, BookId книг по порядку, число дней)
+READING_PLANS = {
+    "year": ("Библия за год", sorted(OLD_TESTAMENT_IDS | NEW_TESTAMENT_IDS), 365),
+    "nt90": ("Новый Завет за 90 дней", sorted(NEW_TESTAMENT_IDS), 90),
+}
+# Чтения по дням, строятся в build_reading_plans(). Ключ: код плана, Значение: [[(BookId, глава), ...], ...]
+READING_PLAN_DAYS = {}
+# Таймеры доставки планов чтения. Ключ: ID пользователя (состояние плана — в user_data["plan"])
+plan_scheduler = DeliveryScheduler()
+
+# Главное меню /bible_menu не зависит от данных и строится сразу
+MAIN_MENU_TEXT = "Выберите раздел Библии:"
+MAIN_MENU_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Ветхий Завет", callback_data="show_books:old_testament")],
+    [InlineKeyboardButton("Новый Завет", callback_data="show_books:new_testament")],
+])
+
+# Готовые экраны меню навигации, строятся в build_menu_screens() после загрузки Библии.
+# Ключ: callback_data кнопки, Значение: (текст, InlineKeyboardMarkup, parse_mode)
+MENU_SCREENS = {"back_to_main_menu": (MAIN_MENU_TEXT, MAIN_MENU_MARKUP, None)}
+# Клавиатура "Назад к главам" под текстом главы. Ключ: (BookId, глава)
+CHAPTER_BACK_MARKUPS = {}
+
+# Кэш готовых ответов. Ключ: (BookId, глава, первый стих, последний стих, parse_mode, перевод),
+# Значение: кортеж сообщений, уже разбитых по лимиту Telegram
+render_cache = LRUCache(RENDER_CACHE_SIZE)
+
+# Кэш ответов на inline-запросы. Ключ: нормализованный запрос, Значение: кортеж InlineQueryResultArticle
+inline_cache = LRUCache(INLINE_CACHE_SIZE)
+# Inline-запросы, ожидающие паузы в наборе. Ключ: ID пользователя, Значение: asyncio.Task обработчика
+inline_pending = {}
+# Сколько результатов показывать в inline-режиме (больше 50 Telegram не принимает)
+INLINE_RESULTS_LIMIT = 10
+# Сколько стихов диапазона показывать в inline-режиме: запрос рендерится на каждую паузу в наборе,
+# а отправляется всё равно одно сообщение
+INLINE_MAX_VERSES = 30
+# Сколько стихов можно сравнить за один запрос /compare
+COMPARE_MAX_VERSES = 10
+# Сколько закладок может быть у пользователя (в клавиатуре /bookmarks по две кнопки на закладку)
+MAX_BOOKMARKS = 30
+
+# Планировщик исходящих запросов: через него идут все вызовы Bot API (см. build_application).
+# Обновления раздаются процессам по пользователю (см. sharding.shard_key): личный чат
+# всегда в одном процессе, и его лимит точный, а сообщения в группу могут отправлять
+# все процессы, поэтому лимит группы, как и общий лимит бота, делится между ними
+outbound_scheduler = OutboundScheduler(
+    global_rate=RATE_LIMIT_GLOBAL_PER_SEC / WORKERS,
+    private_chat_rate=RATE_LIMIT_CHAT_PER_SEC,
+    group_chat_rate=RATE_LIMIT_GROUP_PER_MIN / 60 / WORKERS,
+    max_retries=RATE_LIMIT_MAX_RETRIES,
+)
+
+# Журнал событий; база открывается в post_init, до этого события копятся в буфере
+event_log = EventLog(
+    os.path.join(os.path.dirname(__file__), EVENT_LOG_DB_PATH),
+    capacity=EVENT_LOG_BUFFER_SIZE,
+    flush_interval=EVENT_LOG_FLUSH_INTERVAL,
+) if EVENT_LOG_DB_PATH else None
+
+def button_handler_label(update):
+    """Имя обработчика нажатия кнопки в метриках: тип кнопки по callback_data ("button:chapter")."""
+    data = update.callback_query.data if update.callback_query else None
+    return "button:" + data.split(":", 1)[0] if data else "button"
+
+def tracked(kind, command=None):
+    """Оборачивает обработчик метриками (см. metrics.py) и записью события в журнал (если журнал включён)."""
+    instrument = instrument_handler(button_handler_label if kind == "button" else command or kind)
+    if event_log is None:
+        return instrument
+    log = event_log.track(kind, command)
+    return lambda callback: instrument(log(callback))
+
+# Метрики состояния, вычисляемые при каждом запросе /metrics
+Gauge("tgbot_render_cache_entries", "Отрывков в кэше рендеринга", function=lambda: len(render_cache))
+Gauge("tgbot_render_cache_hit_ratio", "Доля попаданий в кэш рендеринга", function=lambda: render_cache.stats()["hit_ratio"])
+Gauge("tgbot_inline_cache_entries", "Ответов в кэше inline-запросов", function=lambda: len(inline_cache))
+Gauge("tgbot_event_log_pending", "События журнала, ожидающие записи",
+      function=lambda: event_log.pending if event_log is not None else 0)
+Gauge("tgbot_reading_plan_timers", "Запланированные доставки планов чтения", function=lambda: len(plan_scheduler))
+Gauge("tgbot_translations_loaded_bytes", "Размер открытых хранилищ переводов", function=lambda: translations.loaded_bytes())
+# HTTP-сервер метрик, запускается в post_init
+metrics_server = None
+
+# Самые востребованные главы (BookId, глава) для прогрева кэша, в порядке убывания популярности.
+# Если журнал событий уже накопил статистику, в первую очередь прогреваются главы из неё.
+POPULAR_CHAPTERS = [
+    (19, 22), (19, 90), (43, 3), (46, 13), (19, 23), (40, 5), (40, 6), (1, 1),
+    (45, 8), (43, 1), (19, 50), (40, 7), (19, 1), (43, 14), (49, 6), (19, 51),
+    (45, 12), (20, 3), (23, 53), (58, 11), (43, 15), (42, 15), (19, 103), (19, 91),
+    (1, 3), (62, 4), (19, 139), (40, 28), (44, 2), (66, 21),
+]
+
 
 # --- Функции загрузки данных ---
 
 async def load_book_aliases():
     """Загружает алиасы книг из book_aliases.json и заполняет глобальные словари."""
-    global canonical_book_names_by_id, canonical_book_ids_by_name, BOOK_MAPPING
+    global canonical_book_names_by_id, canonical_book_ids_by_name, BOOK_MAPPING, book_resolver
     file_path = os.path.join(os.path.dirname(__file__), BOOK_ALIASES_PATH)
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
@@ -117,6 +333,9 @@ async def load_book_aliases():
             "откр": "Откровение", "откровение иоанна": "Откровение"
         })
 
+        # Строим распознаватель названий книг (префиксы, опечатки, "1кор" / "1 кор")
+        book_resolver = BookResolver(BOOK_MAPPING)
+
         print(f"Алиасы книг успешно загружены из {file_path}. Найдено канонических названий: {len(aliases_raw)}")
     except FileNotFoundError:
         print(f"Ошибка: Файл алиасов книг не найден по пути: {file_path}")
@@ -126,68 +345,888 @@ async def load_book_aliases():
         print(f"Произошла непредвиденная ошибка при загрузке алиасов книг: {e}")
 
 async def load_bible():
-    """Загружает данные Библии из bible.json и преобразует их в удобный для поиска формат."""
-    global bible_data_processed
-    file_path = os.path.join(os.path.dirname(__file__), BIBLE_JSON_PATH)
+    """Открывает скомпилированное хранилище Библии, при необходимости собирая его из bible.json."""
+    global bible_store
+    base_dir = os.path.dirname(__file__)
+    file_path = os.path.join(base_dir, BIBLE_JSON_PATH)
+    aliases_path = os.path.join(base_dir, BOOK_ALIASES_PATH)
+    store_path = os.path.join(base_dir, BIBLE_STORE_PATH) if BIBLE_STORE_PATH else os.path.splitext(file_path)[0] + ".bin"
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            raw_bible_data = json.load(f)
-
-        if "Books" in raw_bible_data:
-            for book_raw in raw_bible_data["Books"]:
-                book_id = book_raw.get("BookId")
-                book_name_canonical = canonical_book_names_by_id.get(book_id)
-
-                if book_name_canonical:
-                    bible_data_processed[book_name_canonical] = {}
-                    for chapter in book_raw.get("Chapters", []):
-                        chapter_id = str(chapter.get("ChapterId"))
-                        bible_data_processed[book_name_canonical][chapter_id] = {}
-                        for verse in chapter.get("Verses", []):
-                            verse_id = str(verse.get("VerseId"))
-                            verse_text = verse.get("Text")
-                            if verse_text:
-                                bible_data_processed[book_name_canonical][chapter_id][verse_id] = verse_text
-                else:
-                    print(f"Предупреждение: Не удалось найти каноническое название для BookId: {book_id} в book_aliases.json. Эта книга будет проигнорирована.")
-            print(f"Библия успешно загружена и обработана из {file_path}. Найдено книг: {len(bible_data_processed)}")
-        else:
-            print(f"Ошибка: Не найдена секция 'Books' в файле Библии: {file_path}. Проверьте его формат.")
-
+        bible_store = open_store(file_path, aliases_path, store_path)
+        print(f"Библия успешно загружена из {store_path}. Найдено книг: {len(bible_store.book_ids())}")
+        translations.register(Translation(DEFAULT_TRANSLATION, DEFAULT_TRANSLATION_TITLE, file_path, store_path),
+                              store=bible_store)
+        register_translations(base_dir)
     except FileNotFoundError:
         print(f"Ошибка: Файл Библии не найден по пути: {file_path}")
     except json.JSONDecodeError:
         print(f"Ошибка: Не удалось декодировать JSON из файла: {file_path}. Проверьте его формат.")
+    except ValueError as e:
+        print(f"Ошибка: {e} Проверьте его формат.")
     except Exception as e:
         print(f"Произошла непредвиденная ошибка при загрузке Библии: {e}")
 
-async def post_init(application: Application):
-    """Вызывается после инициализации Application, чтобы загрузить данные."""
+def register_translations(base_dir):
+    """Регистрирует дополнительные переводы из BIBLE_TRANSLATIONS (сами файлы открываются при первом обращении)."""
+    for entry in BIBLE_TRANSLATIONS.split(";"):
+        if not entry.strip():
+            continue
+        try:
+            code, title, json_path = (field.strip() for field in entry.split(":", 2))
+        except ValueError:
+            print(f"Ошибка: Неверное описание перевода '{entry}' в BIBLE_TRANSLATIONS (ожидается код:Название:путь).")
+            continue
+        translations.register(Translation(code.lower(), title, os.path.join(base_dir, json_path)))
+    print(f"Зарегистрировано переводов: {len(translations.codes())} ({', '.join(translations.codes())})")
+
+# --- Рендеринг отрывков ---
+
+def render_passage(book_id, chapter, verse_start=None, verse_end=None, parse_mode='Markdown', translation=None):
+    """Возвращает кортеж готовых к отправке сообщений для главы или диапазона стихов.
+
+    Результат берётся из render_cache, а при промахе рендерится и кладётся в кэш.
+    Сообщения разбиваются только между стихами (см. chunking.pack_blocks), а для
+    parse_mode='Markdown' текст стихов экранируется.
+    Конец диапазона ограничивается последним стихом главы, а стихи берутся
+    срезом по смещениям хранилища, поэтому "Ин 3:1-2000000000" стоит не больше
+    главы. Если диапазон пуст (начало после конца или после последнего стиха),
+    возвращается пустой кортеж, и в кэш ничего не записывается.
+    translation — код дополнительного перевода (None — основной); такой перевод
+    должен быть уже загружен через translations.load(), а книга и глава —
+    существовать в его хранилище.
+    """
+    store = bible_store if translation is None else translations.get(translation)
+    if verse_start is not None:
+        verse_end = verse_end or verse_start
+        last_verse = store.last_verse(book_id, chapter)
+        if last_verse is None or verse_start > verse_end or verse_start > last_verse:
+            return ()
+        verse_end = min(verse_end, last_verse)
+
+    cache_key = (book_id, chapter, verse_start, verse_end, parse_mode, translation)
+    messages = render_cache.get(cache_key)
+    if messages is not None:
+        return messages
+
+    book_name_canonical = canonical_book_names_by_id[book_id]
+    escape = escape_markdown if parse_mode == 'Markdown' else str
+    if verse_start is None:
+        verses = [f"{v_num}. {escape(v_text)}" for v_num, v_text in store.verses(book_id, chapter)]
+        header = f"{book_name_canonical} {chapter} глава:"
+    else:
+        verses = [f"{v_num}. {escape(v_text)}" for v_num, v_text in store.verse_span(book_id, chapter, verse_start, verse_end)]
+        verse_range_str = f":{verse_start}"
+        if verse_end != verse_start:
+            verse_range_str += f"-{verse_end}"
+        header = f"{book_name_canonical} {chapter}{verse_range_str}:"
+    if translation is not None:
+        header = f"{header[:-1]} ({translation.upper()}):"
+    if parse_mode == 'Markdown':
+        header = f"*{header}*"
+
+    messages = tuple(pack_blocks([header] + verses)) if verses else ()
+    render_cache.put(cache_key, messages)
+    return messages
+
+def warm_render_cache(top_n):
+    """Заранее рендерит top_n самых популярных глав (по журналу событий, затем по POPULAR_CHAPTERS)."""
+    observed = [(book_id, chapter) for book_id, chapter, _ in event_log.popular_chapters(top_n)] if event_log else []
+    candidates = observed + [key for key in POPULAR_CHAPTERS if key not in observed]
+    warmed = 0
+    for book_id, chapter in candidates[:top_n]:
+        if book_id in canonical_book_names_by_id and bible_store.has_chapter(book_id, chapter):
+            render_passage(book_id, chapter)
+            warmed += 1
+    print(f"Кэш рендеринга прогрет: {warmed} глав (из журнала событий: {min(len(observed), top_n)}).")
+
+def render_comparison(book_id, chapter, verse_start, verse_end, stores):
+    """Параллельный текст стихов в нескольких переводах: список сообщений (пустой, если стихов нет).
+
+    stores — список (код перевода, BibleStore). Каждый стих — отдельный блок со
+    строками всех переводов, поэтому сообщения разбиваются только между стихами.
+    """
+    verse_range_str = f"{verse_start}" + (f"-{verse_end}" if verse_end != verse_start else "")
+    legend = ", ".join(f"{code.upper()} — {escape_markdown(translations.title(code))}" for code, _ in stores)
+    blocks = [f"*{canonical_book_names_by_id[book_id]} {chapter}:{verse_range_str}*\n{legend}"]
+    for verse in range(verse_start, verse_end + 1):
+        lines = []
+        for code, store in stores:
+            text = store.verse(book_id, chapter, verse)
+            if text is not None:
+                lines.append(f"_{code.upper()}_ {escape_markdown(text)}")
+        if lines:
+            blocks.append("\n".join([f"*{verse}.*"] + lines))
+    return pack_blocks(blocks, separator="\n\n") if len(blocks) > 1 else []
+
+async def load_search_index():
+    """Открывает поисковый индекс, строя его заново, если он отсутствует или устарел."""
+    global search_index
+    if SEARCH_INDEX_PATH:
+        index_path = os.path.join(os.path.dirname(__file__), SEARCH_INDEX_PATH)
+    else:
+        index_path = os.path.splitext(bible_store.path)[0] + ".idx"
+    try:
+        search_index = open_index(bible_store, index_path)
+        print(f"Поисковый индекс загружен из {index_path}. Слов в словаре: {search_index.term_count}")
+    except Exception as e:
+        print(f"Произошла непредвиденная ошибка при загрузке поискового индекса: {e}")
+
+def render_search_results(query):
+    """Возвращает список сообщений с результатами поиска или пустой список, если ничего не найдено."""
+    total, results = search_index.search(query, SEARCH_RESULTS_LIMIT)
+    if not results:
+        return []
+    lines = [f"🔎 Найдено стихов: {total}. Лучшие совпадения:"]
+    for verse_index, _ in results:
+        book_id, chapter, verse = bible_store.locate(verse_index)
+        lines.append(f"*{canonical_book_names_by_id.get(book_id, book_id)} {chapter}:{verse}* {escape_markdown(bible_store.verse_text_at(verse_index))}")
+    return pack_blocks(lines, separator="\n\n")
+
+# --- Inline-режим ---
+
+def normalize_inline_query(text):
+    """Ключ кэша inline-запроса: нижний регистр, "ё" -> "е", одиночные пробелы."""
+    return " ".join(text.lower().replace('ё', 'е').split())
+
+def passage_article(book_id, chapter, verse_start=None, verse_end=None):
+    """InlineQueryResultArticle с отрывком или None, если стихов нет."""
+    messages = render_passage(book_id, chapter, verse_start, verse_end)
+    if not messages:
+        return None
+    title = f"{canonical_book_names_by_id[book_id]} {chapter}"
+    if verse_start is not None:
+        verse_end = min(verse_end or verse_start, bible_store.last_verse(book_id, chapter))
+        title += f":{verse_start}" + (f"-{verse_end}" if verse_end != verse_start else "")
+    first_verse = bible_store.verse(book_id, chapter, verse_start or bible_store.verses(book_id, chapter)[0][0]) or ""
+    return InlineQueryResultArticle(
+        id=f"{book_id}:{chapter}:{verse_start}:{verse_end}",
+        title=title,
+        description=first_verse[:120] + (" (продолжение в боте)" if len(messages) > 1 else ""),
+        # Inline-ответ — одно сообщение; для длинной главы это её первая часть
+        input_message_content=InputTextMessageContent(messages[0], parse_mode='Markdown'),
+    )
+
+def build_inline_results(query):
+    """Результаты inline-запроса: ссылка на отрывок, книги по началу названия или поиск по словам."""
+    results = []
+    reference = parse_reference(query.rstrip(":,.-–— "))
+    if reference:
+        book_raw, chapter, verse_start, verse_end = reference
+        if verse_start is not None and verse_end is not None and verse_end - verse_start >= INLINE_MAX_VERSES:
+            verse_end = verse_start + INLINE_MAX_VERSES - 1
+        book_name_canonical = book_resolver.resolve(book_raw)
+        book_id = canonical_book_ids_by_name.get(book_name_canonical.lower()) if book_name_canonical else None
+        if book_id is not None and bible_store.has_chapter(book_id, chapter):
+            article = passage_article(book_id, chapter, verse_start, verse_end)
+            if article is not None:
+                results.append(article)
+    elif query:
+        # Название книги без главы (пользователь ещё набирает): предлагаем первые главы подходящих книг
+        book_name_canonical = book_resolver.resolve(query)
+        candidates = [book_name_canonical] if book_name_canonical else book_resolver.suggest(query)
+        for name in candidates:
+            book_id = canonical_book_ids_by_name.get(name.lower())
+            if book_id is not None and bible_store.has_book(book_id):
+                article = passage_article(book_id, bible_store.chapters(book_id)[0])
+                if article is not None:
+                    results.append(article)
+
+    if not results and query and search_index is not None:
+        _, found = search_index.search(query, INLINE_RESULTS_LIMIT)
+        for verse_index, _ in found:
+            book_id, chapter, verse = bible_store.locate(verse_index)
+            text = bible_store.verse_text_at(verse_index)
+            title = f"{canonical_book_names_by_id.get(book_id, book_id)} {chapter}:{verse}"
+            results.append(InlineQueryResultArticle(
+                id=f"v{verse_index}",
+                title=title,
+                description=text[:120],
+                input_message_content=InputTextMessageContent(f"*{title}* {escape_markdown(text)}", parse_mode='Markdown'),
+            ))
+    return tuple(results[:INLINE_RESULTS_LIMIT])
+
+# --- Меню навигации ---
+
+def build_menu_screens():
+    """Строит все экраны /bible_menu (списки книг и сетки глав с постраничной навигацией).
+
+    Меню не меняется после загрузки Библии, поэтому нажатие кнопки сводится
+    к поиску готового экрана в MENU_SCREENS и одному запросу к Bot API.
+    """
+    testaments = (("old_testament", "Ветхий Завет", OLD_TESTAMENT_IDS),
+                  ("new_testament", "Новый Завет", NEW_TESTAMENT_IDS))
+    for category, title, book_ids in testaments:
+        book_buttons = []
+        current_row = []
+        for book_id in sorted(book_ids):
+            book_name = canonical_book_names_by_id.get(book_id)
+            if book_name and bible_store.has_book(book_id): # Проверяем, что книга есть в загруженной Библии
+                current_row.append(InlineKeyboardButton(book_name, callback_data=f"book:{book_id}"))
+                if len(current_row) == 2: # По 2 кнопки в ряд для книг
+                    book_buttons.append(current_row)
+                    current_row = []
+                build_chapter_screens(book_id, book_name, category)
+        if current_row:
+            book_buttons.append(current_row)
+        book_buttons.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main_menu")])
+        MENU_SCREENS[f"show_books:{category}"] = (f"Выберите книгу из {title}:", InlineKeyboardMarkup(book_buttons), None)
+    print(f"Меню навигации построено: {len(MENU_SCREENS)} экранов.")
+
+def build_chapter_screens(book_id, book_name, category):
+    """Строит страницы сетки глав книги: "book:{id}" (первая) и "book:{id}:{страница}"."""
+    chapters = bible_store.chapters(book_id)
+    pages = [chapters[start:start + CHAPTER_GRID_PAGE_SIZE] for start in range(0, len(chapters), CHAPTER_GRID_PAGE_SIZE)]
+    for page_number, page_chapters in enumerate(pages, 1):
+        callback_data = f"book:{book_id}:{page_number}"
+        chapter_buttons = [
+            [InlineKeyboardButton(str(chapter_num), callback_data=f"chapter:{book_id}:{chapter_num}")
+             for chapter_num in page_chapters[start:start + CHAPTER_GRID_COLUMNS]]
+            for start in range(0, len(page_chapters), CHAPTER_GRID_COLUMNS)
+        ]
+        text = f"Выберите главу для книги *{book_name}*:"
+        if len(pages) > 1:
+            text = f"Выберите главу для книги *{book_name}* (главы {page_chapters[0]}–{page_chapters[-1]}):"
+            navigation = []
+            if page_number > 1:
+                navigation.append(InlineKeyboardButton("◀️", callback_data=f"book:{book_id}:{page_number - 1}"))
+            if page_number < len(pages):
+                navigation.append(InlineKeyboardButton("▶️", callback_data=f"book:{book_id}:{page_number + 1}"))
+            chapter_buttons.append(navigation)
+        chapter_buttons.append([InlineKeyboardButton("⬅️ Назад к книгам", callback_data=f"show_books:{category}")])
+        screen = (text, InlineKeyboardMarkup(chapter_buttons), 'Markdown')
+        MENU_SCREENS[callback_data] = screen
+        if page_number == 1:
+            MENU_SCREENS[f"book:{book_id}"] = screen
+
+        # Под текстом главы — возврат на ту же страницу сетки
+        back_markup = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад к главам", callback_data=callback_data)]])
+        for chapter_num in page_chapters:
+            CHAPTER_BACK_MARKUPS[(book_id, chapter_num)] = back_markup
+
+# --- Стих дня и рассылка ---
+
+def pick_daily_verse(day):
+    """Выбирает стих дня по дате: один и тот же для всех подписчиков и после перезапуска."""
+    verse_index = random.Random(day.toordinal()).randrange(bible_store.verse_count)
+    return bible_store.locate(verse_index)
+
+def render_daily_verse(day):
+    """Список сообщений со стихом дня для рассылки."""
+    book_id, chapter, verse = pick_daily_verse(day)
+    messages = list(render_passage(book_id, chapter, verse, verse))
+    messages[0] = "📖 Стих дня\n\n" + messages[0]
+    return messages
+
+async def daily_verse_loop(application: Application):
+    """Каждый день в DAILY_VERSE_TIME (UTC) рассылает стих дня всем подписчикам.
+
+    Рассылка за день идентифицируется датой, поэтому после перезапуска
+    незавершённая рассылка продолжается с контрольной точки, а завершённая не повторяется.
+    В многопроцессном режиме каждый процесс рассылает свою часть подписчиков
+    (chat_id % WORKERS) со своей контрольной точкой: у каждого процесса 1/WORKERS
+    общего лимита отправки, и вместе они рассылают с полным лимитом.
+    """
+    shard = (WORKER_INDEX, WORKERS) if WORKERS > 1 else None
+    hour, minute = map(int, DAILY_VERSE_TIME.split(":"))
+    while True:
+        try:
+            now = datetime.now(timezone.utc)
+            send_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            broadcast_id = f"daily:{now.date().isoformat()}"
+            if shard is not None:
+                broadcast_id += f":{WORKER_INDEX}/{WORKERS}"
+            checkpoint = subscriber_store.get_checkpoint(broadcast_id)
+            if now < send_at or (checkpoint and checkpoint["finished"]):
+                if now >= send_at:
+                    send_at += timedelta(days=1)
+                await asyncio.sleep((send_at - now).total_seconds())
+                continue
+
+            print(f"Рассылка стиха дня {broadcast_id} для {subscriber_store.count(shard)} подписчиков...")
+            result = await run_broadcast(application.bot, subscriber_store, broadcast_id, render_daily_verse(now.date()),
+                                         parse_mode='Markdown', batch_size=BROADCAST_BATCH_SIZE,
+                                         concurrency=BROADCAST_CONCURRENCY, shard=shard)
+            print(f"Рассылка {broadcast_id} завершена: отправлено {result['sent']}, ошибок {result['failed']}, удалено заблокировавших бота {result['pruned']}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Произошла непредвиденная ошибка при рассылке стиха дня: {e}")
+            await asyncio.sleep(60)
+
+# --- Планы чтения ---
+# Состояние плана пользователя — context.user_data["plan"]: код плана, чат доставки,
+# дата начала (местная), время доставки "ЧЧ:ММ", смещение от UTC в минутах,
+# номер последнего отправленного дня, число прочитанных дней и номер последнего из них
+
+def build_reading_plans():
+    """Делит главы на дни для каждого плана из READING_PLANS (по числу стихов в главах bible_store)."""
+    for plan_id, (title, book_ids, days) in READING_PLANS.items():
+        READING_PLAN_DAYS[plan_id] = build_plan(bible_store, book_ids, days)
+    print("Планы чтения построены: " + ", ".join(f"{plan_id} ({len(days)} дн.)" for plan_id, days in READING_PLAN_DAYS.items()))
+
+def plan_day_index(plan, now):
+    """Номер дня плана (с 0) на момент now по местному времени пользователя."""
+    return (local_date(now, plan["utc_offset"]) - date.fromisoformat(plan["start"])).days
+
+def owns_user(application, user_id):
+    """Хранит ли этот процесс состояние пользователя (см. SQLitePersistence.owns).
+
+    Без persistence состояние пользователя есть только у процесса, которому фронт
+    передаёт его обновления (sharding.shard_key), поэтому оно всегда своё.
+    """
+    persistence = application.persistence
+    return persistence is None or persistence.owns(user_id)
+
+def schedule_plan(application, user_id, plan, now=None):
+    """Ставит таймер следующей доставки: сегодня в plan["time"] или сразу, если сегодняшнее чтение пропущено.
+
+    Прежний таймер пользователя (например, заменённого плана) снимается. Таймер
+    ставит только процесс, который хранит план пользователя, иначе чтение
+    доставлялось бы из двух процессов.
+    """
+    plan_scheduler.cancel(user_id)
+    if not owns_user(application, user_id):
+        return
+    now = now or time.time()
+    hour, minute = parse_time(plan["time"])
+    today = local_date(now, plan["utc_offset"])
+    send_at = delivery_time(today, hour, minute, plan["utc_offset"])
+    if now >= send_at:
+        # После перезапуска бота сегодняшнее чтение досылается, если его ещё не отправили
+        send_at = now if plan["sent"] < plan_day_index(plan, now) else delivery_time(today + timedelta(days=1), hour, minute, plan["utc_offset"])
+    plan_scheduler.schedule(user_id, send_at)
+
+def render_plan_day(plan, day, with_read_button=True):
+    """Текст и кнопки чтения дня day плана: главы (кнопки read:) и "Прочитано"."""
+    title, _, _ = READING_PLANS[plan["id"]]
+    days = READING_PLAN_DAYS[plan["id"]]
+    chapters = days[day]
+    # Подряд идущие главы одной книги — одним диапазоном: "Бытие 1–3, Исход 1"
+    ranges = []
+    for book_id, chapter in chapters:
+        if ranges and ranges[-1][0] == book_id and ranges[-1][2] == chapter - 1:
+            ranges[-1][2] = chapter
+        else:
+            ranges.append([book_id, chapter, chapter])
+    reading = ", ".join(f"{canonical_book_names_by_id.get(book_id, book_id)} {first}" + (f"–{last}" if last != first else "")
+                        for book_id, first, last in ranges)
+    text = f"📅 {title}, день {day + 1} из {len(days)}:\n{reading}"
+    buttons = [InlineKeyboardButton(f"{canonical_book_names_by_id.get(book_id, book_id)} {chapter}",
+                                    callback_data=f"read:{book_id}:{chapter}") for book_id, chapter in chapters]
+    rows = [buttons[start:start + 2] for start in range(0, len(buttons), 2)]
+    if with_read_button:
+        rows.append([InlineKeyboardButton("✅ Прочитано", callback_data=f"plan_read:{day}")])
+    return text, InlineKeyboardMarkup(rows)
+
+async def deliver_plan_reading(application: Application, user_id):
+    """Срабатывание таймера плана: отправляет чтение дня (низкий приоритет) и ставит следующий таймер."""
+    if not owns_user(application, user_id):
+        return
+    user_data = application.user_data.get(user_id)
+    plan = user_data.get("plan") if user_data else None
+    if not plan or plan["id"] not in READING_PLAN_DAYS:
+        return
+    now = time.time()
+    day = plan_day_index(plan, now)
+    days = READING_PLAN_DAYS[plan["id"]]
+    try:
+        if day >= len(days):
+            title, _, _ = READING_PLANS[plan["id"]]
+            del user_data["plan"]
+            await application.bot.send_message(
+                plan["chat_id"], f"🎉 План «{title}» завершён! Прочитано дней: {plan['read']} из {len(days)}.",
+                rate_limit_args={"priority": PRIORITY_BULK})
+            return
+        if plan["sent"] < day:
+            text, reply_markup = render_plan_day(plan, day)
+            await application.bot.send_message(plan["chat_id"], text, reply_markup=reply_markup,
+                                               rate_limit_args={"priority": PRIORITY_BULK})
+            plan["sent"] = day
+    except Forbidden:
+        # Пользователь заблокировал бота: план больше не доставляется
+        user_data.pop("plan", None)
+        return
+    except Exception as e:
+        print(f"Не удалось доставить план чтения пользователю {user_id}: {e}")
+        plan_scheduler.schedule(user_id, now + 300) # повтор через 5 минут
+        return
+    finally:
+        # user_data изменён вне обработчика обновления — отмечаем его для сохранения
+        application.mark_data_for_update_persistence(user_ids=user_id)
+    schedule_plan(application, user_id, plan, now)
+
+async def load_data():
+    """Загружает алиасы, Библию и поисковый индекс, прогревает кэш и строит меню."""
     print("Выполняется post_init: Загрузка алиасов книг...")
     await load_book_aliases()
     print("Выполняется post_init: Загрузка данных Библии...")
     await load_bible()
+    if bible_store is not None:
+        if RENDER_CACHE_WARMUP > 0:
+            if event_log is not None:
+                event_log.open() # статистика популярности глав для прогрева
+            warm_render_cache(RENDER_CACHE_WARMUP)
+        build_menu_screens()
+        build_reading_plans()
+        print("Выполняется post_init: Загрузка поискового индекса...")
+        await load_search_index()
+
+async def post_init(application: Application):
+    """Вызывается после инициализации Application, чтобы загрузить данные."""
+    # В многопроцессном режиме данные уже загружены родительским процессом до fork
+    if bible_store is None:
+        await load_data()
+    if event_log is not None:
+        event_log.start()
+
+    global subscriber_store
+    subscriber_store = SubscriberStore(os.path.join(os.path.dirname(__file__), SUBSCRIBERS_DB_PATH))
+    # Стих дня рассылает каждый процесс своей части подписчиков (см. daily_verse_loop)
+    if DAILY_VERSE_TIME and bible_store is not None:
+        background_tasks.append(asyncio.create_task(daily_verse_loop(application)))
+    if METRICS_PORT:
+        await start_metrics_server()
+    background_tasks.append(asyncio.create_task(monitor_event_loop_lag()))
+    # Планы чтения доставляет каждый процесс своим пользователям (их user_data уже загружены persistence,
+    # а обновления этих пользователей приходят только сюда), см. owns_user
+    if READING_PLAN_DAYS:
+        for user_id, user_data in application.user_data.items():
+            if user_data.get("plan"):
+                schedule_plan(application, user_id, user_data["plan"])
+        print(f"Запланирована доставка планов чтения: {len(plan_scheduler)} пользователей")
+        background_tasks.append(asyncio.create_task(plan_scheduler.run(
+            lambda user_id: deliver_plan_reading(application, user_id), concurrency=READING_PLAN_CONCURRENCY)))
+
+async def start_metrics_server():
+    """Запускает локальный HTTP-сервер метрик и профилировщика (в рабочем процессе — на своём порту)."""
+    global metrics_server
+    port = int(METRICS_PORT) + WORKER_INDEX
+    try:
+        metrics_server = await start_http_server(
+            METRICS_HOST, port, profiler=SamplingProfiler(PROFILE_INTERVAL_MS / 1000),
+            profile_dir=os.path.join(os.path.dirname(__file__), PROFILE_DIR),
+        )
+        print(f"Метрики доступны на http://{METRICS_HOST}:{port}/metrics")
+    except OSError as e:
+        print(f"Ошибка: Не удалось запустить сервер метрик на порту {port}: {e}")
+
+async def post_shutdown(application: Application):
+    """Вызывается при остановке Application: останавливает фоновые задачи и закрывает базы."""
+    global metrics_server
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    if metrics_server is not None:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+        metrics_server = None
+    if subscriber_store is not None:
+        subscriber_store.close()
+    if event_log is not None:
+        await event_log.stop()
 
 # --- Обработчики команд и сообщений ---
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает команду /start."""
     if update.message: # Проверяем, что update.message не None
-        await update.message.reply_text("Привет! Я бот ✝️.\nИспользуйте команду /bible [Книга] [Глава]:[Стих] для чтения Библии или /bible_menu для интерактивной навигации.")
+        await update.message.reply_text("Привет! Я бот ✝️.\nИспользуйте команду /bible [Книга] [Глава]:[Стих] для чтения Библии, /bible_menu для интерактивной навигации или /search [слова] для поиска стихов.\nПеревод выбирается командой /translation, сравнить переводы: /compare Ин 3:16.\nПродолжить чтение: /continue, закладки: /bookmark и /bookmarks, планы чтения: /plan.")
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает все текстовые сообщения, которые не являются командами."""
     if update.message: # Проверяем, что update.message не None
         user_message = update.message.text
-        user = update.message.from_user # Получаем объект User
-        user_id = user.id if user else None
-        username = user.username if user else None
-        first_name = user.first_name if user else None
+        # Отправитель и время обработки записываются в журнал событий (см. tracked)
+        annotate_event(text=user_message)
 
-        print(f"Получено сообщение от {first_name} (@{username} / ID: {user_id}): {user_message}")
+        # Свободный текст ищем по стихам; если ничего не нашлось, подсказываем команды
+        if search_index is not None and user_message:
+            messages_to_send = render_search_results(user_message)
+            if messages_to_send:
+                for message_chunk in messages_to_send:
+                    await update.message.reply_text(message_chunk, parse_mode='Markdown')
+                return
 
         await update.message.reply_text(f"Я получил ваше сообщение: '{user_message}'. Для чтения Библии используйте /bible [Книга] [Глава]:[Стих] или /bible_menu для интерактивной навигации.")
 
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает команду /search для поиска стихов по словам."""
+    if not update.message:
+        return
+    if not context.args:
+        await update.message.reply_text("Укажите слова для поиска (например, `/search любовь долготерпит` или `/search \"в начале было слово\"`).", parse_mode='Markdown')
+        return
+    if search_index is None:
+        await update.message.reply_text("Поиск временно недоступен. Пожалуйста, сообщите администратору.")
+        return
+
+    messages_to_send = render_search_results(" ".join(context.args))
+    if not messages_to_send:
+        await update.message.reply_text("По вашему запросу ничего не найдено.")
+        return
+    for message_chunk in messages_to_send:
+        await update.message.reply_text(message_chunk, parse_mode='Markdown')
+
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает inline-запросы "@bot Ин 3:16" (регистрируется с block=False).
+
+    Запросы приходят на каждое нажатие клавиши, поэтому ответ откладывается на
+    INLINE_DEBOUNCE_MS: если за это время от того же пользователя пришёл новый
+    запрос, прежний отменяется без ответа. Результаты берутся из inline_cache.
+    """
+    query = update.inline_query
+    if query is None or bible_store is None:
+        return
+    user_id = query.from_user.id
+    previous = inline_pending.get(user_id)
+    if previous is not None:
+        previous.cancel()
+    inline_pending[user_id] = asyncio.current_task()
+    try:
+        await asyncio.sleep(INLINE_DEBOUNCE_MS / 1000)
+    except asyncio.CancelledError:
+        annotate_event(command="superseded")
+        raise
+    finally:
+        if inline_pending.get(user_id) is asyncio.current_task():
+            del inline_pending[user_id]
+
+    key = normalize_inline_query(query.query)
+    if not key:
+        # Пустой запрос: стих дня
+        key = f"daily:{datetime.now(timezone.utc).date().isoformat()}"
+    results = inline_cache.get(key)
+    if results is None:
+        if key.startswith("daily:"):
+            book_id, chapter, verse = pick_daily_verse(datetime.now(timezone.utc).date())
+            results = (passage_article(book_id, chapter, verse, verse),)
+        else:
+            results = build_inline_results(key)
+        inline_cache.put(key, results)
+    await query.answer(results, cache_time=INLINE_CACHE_TIME)
+
+async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает команду /subscribe: подписка чата на ежедневный стих."""
+    if not update.message:
+        return
+    if subscriber_store.subscribe(update.effective_chat.id):
+        await update.message.reply_text("Вы подписались на ежедневный стих дня. Отписаться: /unsubscribe")
+    else:
+        await update.message.reply_text("Вы уже подписаны на стих дня. Отписаться: /unsubscribe")
+
+async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает команду /unsubscribe: отписка чата от рассылки."""
+    if not update.message:
+        return
+    if subscriber_store.unsubscribe(update.effective_chat.id):
+        await update.message.reply_text("Вы отписались от стиха дня. Подписаться снова: /subscribe")
+    else:
+        await update.message.reply_text("Вы не подписаны на стих дня. Подписаться: /subscribe")
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает команду /stats: служебная статистика для администраторов."""
+    if not update.message:
+        return
+    user = update.message.from_user
+    if not user or user.id not in ADMIN_IDS:
+        return
+    cache_stats = render_cache.stats()
+    inline_cache_stats = inline_cache.stats()
+    outbound_stats = outbound_scheduler.stats()
+    translation_stats = translations.stats()
+    await update.message.reply_text(
+        "Кэш рендеринга:\n"
+        f"записей: {cache_stats['size']}/{cache_stats['maxsize']}\n"
+        f"попаданий: {cache_stats['hits']}, промахов: {cache_stats['misses']} ({cache_stats['hit_ratio']:.1%})\n"
+        f"вытеснено: {cache_stats['evictions']}\n"
+        f"inline-кэш: {inline_cache_stats['size']} запросов, попаданий {inline_cache_stats['hit_ratio']:.1%}\n\n"
+        "Исходящие сообщения:\n"
+        f"в очереди: {outbound_stats['waiting']} (максимум {outbound_stats['max_waiting']})\n"
+        f"отправлено: {outbound_stats['sent']}, повторов после 429: {outbound_stats['retries']}\n"
+        f"задержка: средняя {outbound_stats['latency_avg'] * 1000:.0f} мс, максимальная {outbound_stats['latency_max'] * 1000:.0f} мс\n\n"
+        f"Подписчиков стиха дня: {subscriber_store.count()}\n"
+        f"Переводов открыто: {translation_stats['loaded']}/{translation_stats['translations']} "
+        f"({translation_stats['loaded_bytes'] / 2 ** 20:.1f} из {translation_stats['memory_budget'] / 2 ** 20:.0f} МБ), "
+        f"выгружено: {translation_stats['evictions']}"
+        + persistence_report(context.application.persistence)
+        + f"\nПланы чтения: таймеров {plan_scheduler.stats()['timers']}, доставок {plan_scheduler.stats()['fired']}"
+        + event_log_report()
+    )
+
+def persistence_report(persistence):
+    """Строка /stats про сохранение состояния пользователей."""
+    if persistence is None:
+        return ""
+    state_stats = persistence.stats()
+    return (
+        f"\nСостояние пользователей: сохранено {state_stats['users']}, ждут записи {state_stats['pending']}, "
+        f"ошибок записи {state_stats['write_errors']}"
+        + (f", не записано чужих {state_stats['foreign']}" if state_stats['foreign'] else "")
+    )
+
+def event_log_report():
+    """Раздел /stats про журнал событий: очередь записи и самые читаемые книги."""
+    if event_log is None:
+        return ""
+    log_stats = event_log.stats()
+    top_books = ", ".join(f"{canonical_book_names_by_id.get(book_id, book_id)} ({hits})"
+                          for book_id, hits in event_log.popular_books(5))
+    return (
+        "\n\nЖурнал событий:\n"
+        f"в буфере: {log_stats['pending']}/{log_stats['capacity']}, записано: {log_stats['written']}\n"
+        f"прорежено: {log_stats['sampled_out']}, вытеснено: {log_stats['dropped']}, ошибок записи: {log_stats['write_errors']}\n"
+        f"пользователей: {event_log.user_count()}\n"
+        f"популярные книги: {top_books or 'нет данных'}"
+    )
+
+# --- Переводы ---
+
+def user_translation(context):
+    """Код перевода, выбранного пользователем через /translation, или None для основного перевода."""
+    code = context.user_data.get("translation") if context.user_data is not None else None
+    if code == DEFAULT_TRANSLATION or code not in translations:
+        return None
+    return code
+
+async def load_translation(translation):
+    """Хранилище перевода (None — основной); при первом обращении перевод открывается в отдельном потоке.
+
+    Возвращает None, если данные не загружены или перевод не удалось открыть.
+    """
+    if translation is None:
+        return bible_store
+    try:
+        return await translations.load(translation)
+    except Exception as e:
+        print(f"Произошла непредвиденная ошибка при загрузке перевода {translation}: {e}")
+        return None
+
+async def translation_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает команду /translation: выбор перевода для /bible и меню (кнопками или /translation kjv)."""
+    if not update.message:
+        return
+    current = user_translation(context) or DEFAULT_TRANSLATION
+    if context.args:
+        code = context.args[0].lower()
+        if code not in translations:
+            await update.message.reply_text(f"Перевод '{code}' не найден. Доступные переводы: {', '.join(translations.codes())}.")
+            return
+        context.user_data["translation"] = code
+        await update.message.reply_text(f"Перевод для /bible и меню: {translations.title(code)} ({code.upper()}).")
+        return
+
+    buttons = [[InlineKeyboardButton(("✅ " if code == current else "") + f"{translations.title(code)} ({code.upper()})",
+                                     callback_data=f"translation:{code}")]
+               for code in translations.codes()]
+    await update.message.reply_text(
+        f"Сейчас выбран перевод: {translations.title(current)} ({current.upper()}).\nВыберите перевод:",
+        reply_markup=InlineKeyboardMarkup(buttons),
+    )
+
+async def compare_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает команду /compare: стихи в нескольких переводах рядом (/compare Ин 3:16 или /compare Ин 3:16 rst kjv)."""
+    if not update.message:
+        return
+    args = list(context.args or [])
+    # Коды переводов в конце команды; без них сравниваются все переводы
+    codes = []
+    while args and args[-1].lower() in translations:
+        codes.insert(0, args.pop().lower())
+    reference = parse_reference(" ".join(args).strip())
+    if not reference or reference[2] is None:
+        await update.message.reply_text("Укажите стих или стихи для сравнения (например, `/compare Ин 3:16` или `/compare Ин 3:16-18 rst kjv`).", parse_mode='Markdown')
+        return
+    book_raw, chapter_num, verse_start, verse_end = reference
+    verse_end = verse_end or verse_start
+    book_name_canonical = book_resolver.resolve(book_raw)
+    book_id = canonical_book_ids_by_name.get(book_name_canonical.lower()) if book_name_canonical else None
+    if book_id is None or bible_store is None:
+        await update.message.reply_text(f"Неизвестная книга '{book_raw}'. Проверьте название или используйте сокращение.")
+        return
+    if verse_end - verse_start + 1 > COMPARE_MAX_VERSES:
+        await update.message.reply_text(f"Для сравнения можно указать не больше {COMPARE_MAX_VERSES} стихов.")
+        return
+
+    codes = codes or translations.codes()
+    # Ещё не открытые переводы открываются одновременно, каждый в своём потоке
+    stores = await asyncio.gather(*(load_translation(None if code == DEFAULT_TRANSLATION else code) for code in codes))
+    available = [(code, store) for code, store in zip(codes, stores) if store is not None]
+    annotate_event(book_id=book_id, chapter=chapter_num)
+    messages_to_send = render_comparison(book_id, chapter_num, verse_start, verse_end, available)
+    if not messages_to_send:
+        await update.message.reply_text(f"Стихи {verse_start}{'-' + str(verse_end) if verse_end != verse_start else ''} не найдены в {book_name_canonical} {chapter_num} главе.")
+        return
+    for message_chunk in messages_to_send:
+        await update.message.reply_text(message_chunk, parse_mode='Markdown')
+
+# --- Позиция чтения и закладки ---
+# Хранятся в context.user_data (сохраняется между перезапусками, см. persistence.py):
+# "position" — [BookId, глава, стих] последнего прочитанного отрывка, "bookmarks" — список таких же
+# троек; стих 0 означает главу целиком
+
+def remember_position(context, book_id, chapter, verse=None):
+    """Запоминает последний прочитанный отрывок пользователя (для /continue и /bookmark)."""
+    if context.user_data is not None:
+        context.user_data["position"] = [book_id, chapter, verse or 0]
+
+def format_position(book_id, chapter, verse):
+    """Ссылка вида "Иоанн 3:16" (или "Иоанн 3" для главы целиком)."""
+    reference = f"{canonical_book_names_by_id.get(book_id, book_id)} {chapter}"
+    return f"{reference}:{verse}" if verse else reference
+
+def bookmarks_markup(bookmarks):
+    """Клавиатура /bookmarks: открыть главу закладки (кнопка read:, список закладок остаётся) или удалить закладку."""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(format_position(book_id, chapter, verse), callback_data=f"read:{book_id}:{chapter}"),
+         InlineKeyboardButton("❌", callback_data=f"bookmark_del:{book_id}:{chapter}:{verse}")]
+        for book_id, chapter, verse in bookmarks
+    ])
+
+async def continue_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает команду /continue: снова открывает главу, которую пользователь читал последней."""
+    if not update.message:
+        return
+    position = context.user_data.get("position")
+    if not position:
+        await update.message.reply_text("Вы ещё ничего не читали. Начните с /bible [Книга] [Глава] или /bible_menu.")
+        return
+    book_id, chapter_num, _ = position
+    translation = user_translation(context)
+    store = await load_translation(translation)
+    if store is None or book_id not in canonical_book_names_by_id or not store.has_chapter(book_id, chapter_num):
+        await update.message.reply_text("Глава не найдена или не загружена.")
+        return
+    annotate_event(book_id=book_id, chapter=chapter_num)
+    messages_to_send = render_passage(book_id, chapter_num, translation=translation)
+    reply_markup = CHAPTER_BACK_MARKUPS.get((book_id, chapter_num))
+    for i, message_chunk in enumerate(messages_to_send):
+        last = i == len(messages_to_send) - 1
+        await update.message.reply_text(message_chunk, parse_mode='Markdown', reply_markup=reply_markup if last else None)
+
+async def bookmark_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает команду /bookmark: закладка на последний прочитанный отрывок или на /bookmark Ин 3:16."""
+    if not update.message:
+        return
+    if context.args:
+        reference = parse_reference(" ".join(context.args).strip())
+        book_name_canonical = book_resolver.resolve(reference[0]) if reference else None
+        book_id = canonical_book_ids_by_name.get(book_name_canonical.lower()) if book_name_canonical else None
+        if book_id is None or bible_store is None or not bible_store.has_chapter(book_id, reference[1]):
+            await update.message.reply_text("Не удалось найти такой отрывок. Пример: /bookmark Иоанн 3:16")
+            return
+        bookmark = [book_id, reference[1], reference[2] or 0]
+    else:
+        bookmark = context.user_data.get("position")
+        if not bookmark:
+            await update.message.reply_text("Вы ещё ничего не читали. Укажите отрывок: /bookmark Иоанн 3:16")
+            return
+
+    bookmarks = context.user_data.setdefault("bookmarks", [])
+    if bookmark in bookmarks:
+        await update.message.reply_text(f"Закладка {format_position(*bookmark)} уже есть. Все закладки: /bookmarks")
+        return
+    if len(bookmarks) >= MAX_BOOKMARKS:
+        await update.message.reply_text(f"У вас уже {MAX_BOOKMARKS} закладок. Удалите лишние в /bookmarks.")
+        return
+    bookmarks.append(list(bookmark))
+    await update.message.reply_text(f"Закладка добавлена: {format_position(*bookmark)}. Все закладки: /bookmarks")
+
+async def bookmarks_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает команду /bookmarks: список закладок с кнопками."""
+    if not update.message:
+        return
+    bookmarks = context.user_data.get("bookmarks")
+    if not bookmarks:
+        await update.message.reply_text("Закладок пока нет. Добавить: /bookmark (последний прочитанный отрывок) или /bookmark Иоанн 3:16")
+        return
+    await update.message.reply_text("Ваши закладки:", reply_markup=bookmarks_markup(bookmarks))
+
+# --- Команды планов чтения ---
+
+def plans_overview(context):
+    """Текст и кнопки /plan: текущий план с прогрессом и список планов для начала."""
+    plan = context.user_data.get("plan")
+    lines = []
+    if plan and plan["id"] in READING_PLAN_DAYS:
+        title, _, _ = READING_PLANS[plan["id"]]
+        days = READING_PLAN_DAYS[plan["id"]]
+        day = min(plan_day_index(plan, time.time()), len(days) - 1)
+        lines.append(f"Ваш план: {title}, день {day + 1} из {len(days)}, прочитано дней: {plan['read']}.\n"
+                     f"Чтение приходит в {plan['time']} ({format_utc_offset(plan['utc_offset'])}). "
+                     "Чтение на сегодня: /today, остановить план: /plan stop\n")
+    lines.append("Планы чтения (можно указать время и часовой пояс: /plan year 06:30 +3):")
+    buttons = []
+    for plan_id, (title, _, _) in READING_PLANS.items():
+        lines.append(f"{plan_id} — {title}")
+        buttons.append([InlineKeyboardButton(title, callback_data=f"plan:{plan_id}")])
+    return "\n".join(lines), InlineKeyboardMarkup(buttons)
+
+def start_plan(context, user_id, chat_id, plan_id, hour, minute, utc_offset):
+    """Начинает план с сегодняшнего дня (чтение первого дня отправляется сразу) и ставит таймер доставки."""
+    now = time.time()
+    plan = {
+        "id": plan_id, "chat_id": chat_id, "start": local_date(now, utc_offset).isoformat(),
+        "time": f"{hour:02d}:{minute:02d}", "utc_offset": utc_offset, "sent": 0, "read": 0, "last_read": -1,
+    }
+    context.user_data["plan"] = plan
+    schedule_plan(context.application, user_id, plan, now)
+    title, _, _ = READING_PLANS[plan_id]
+    return (f"План «{title}» начат. Чтение будет приходить каждый день в {plan['time']} "
+            f"({format_utc_offset(utc_offset)}). Остановить: /plan stop"), plan
+
+async def plan_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает команду /plan: список планов, /plan year [ЧЧ:ММ] [+3] — начать, /plan stop — остановить."""
+    if not update.message:
+        return
+    if not READING_PLAN_DAYS:
+        await update.message.reply_text("Планы чтения временно недоступны. Пожалуйста, сообщите администратору.")
+        return
+    if not context.args:
+        text, reply_markup = plans_overview(context)
+        await update.message.reply_text(text, reply_markup=reply_markup)
+        return
+
+    plan_id = context.args[0].lower()
+    if plan_id == "stop":
+        if context.user_data.pop("plan", None):
+            plan_scheduler.cancel(update.effective_user.id)
+            await update.message.reply_text("План чтения остановлен.")
+        else:
+            await update.message.reply_text("У вас нет активного плана чтения. Выбрать план: /plan")
+        return
+    if plan_id not in READING_PLANS:
+        await update.message.reply_text(f"План '{plan_id}' не найден. Доступные планы: {', '.join(READING_PLANS)}.")
+        return
+
+    hour, minute = parse_time(READING_PLAN_TIME)
+    utc_offset = parse_utc_offset(READING_PLAN_UTC_OFFSET)
+    for arg in context.args[1:]:
+        if parse_time(arg):
+            hour, minute = parse_time(arg)
+        elif parse_utc_offset(arg) is not None:
+            utc_offset = parse_utc_offset(arg)
+        else:
+            await update.message.reply_text(f"Не понимаю '{arg}'. Пример: /plan {plan_id} 06:30 +3")
+            return
+
+    text, plan = start_plan(context, update.effective_user.id, update.effective_chat.id, plan_id, hour, minute, utc_offset)
+    await update.message.reply_text(text)
+    day_text, reply_markup = render_plan_day(plan, 0)
+    await update.message.reply_text(day_text, reply_markup=reply_markup)
+
+async def today_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает команду /today: чтение на сегодня по плану пользователя."""
+    if not update.message:
+        return
+    plan = context.user_data.get("plan")
+    if not plan or plan["id"] not in READING_PLAN_DAYS:
+        await update.message.reply_text("У вас нет активного плана чтения. Выбрать план: /plan")
+        return
+    day = min(plan_day_index(plan, time.time()), len(READING_PLAN_DAYS[plan["id"]]) - 1)
+    text, reply_markup = render_plan_day(plan, day, with_read_button=day > plan["last_read"])
+    await update.message.reply_text(text, reply_markup=reply_markup)
+
 async def read_bible_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает команду /bible для чтения стихов."""
     if not context.args:
@@ -196,87 +1235,67 @@ async def read_bible_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     query_str = " ".join(context.args).strip()
-    match = re.match(r"(.+?)\s+(\d+)(?::(\d+)(?:-(\d+))?)?$", query_str, re.IGNORECASE)
+    reference = parse_reference(query_str)
 
-    if not match:
+    if not reference:
         if update.message:
             await update.message.reply_text("Неверный формат запроса. Используйте: `/bible Книга Глава:Стих` или `/bible Книга Глава` (например, `/bible Иоанн 3:16`).")
         return
 
-    book_raw, chapter_str, verse_start_str, verse_end_str = match.groups()
+    book_raw, chapter_num, verse_start, verse_end = reference
 
-    book_name_canonical = BOOK_MAPPING.get(book_raw.lower())
-    chapter_num_str = chapter_str
-    
-    verse_start = int(verse_start_str) if verse_start_str else None
-    verse_end = int(verse_end_str) if verse_end_str else verse_start
+    book_name_canonical = book_resolver.resolve(book_raw)
+    book_id = canonical_book_ids_by_name.get(book_name_canonical.lower()) if book_name_canonical else None
+    chapter_num_str = str(chapter_num)
 
     response_text = ""
+    messages_to_send = ()
+    translation = user_translation(context)
+    store = await load_translation(translation)
 
     if not book_name_canonical:
-        response_text = f"Неизвестная книга '{book_raw}'. Проверьте название или используйте сокращение."
-    elif not bible_data_processed:
+        response_text = f"Неизвестная книга '{escape_markdown(book_raw)}'. Проверьте название или используйте сокращение."
+        suggestions = book_resolver.suggest(book_raw)
+        if suggestions:
+            response_text += "\nВозможно, вы имели в виду: " + ", ".join(suggestions) + "."
+    elif store is None:
         response_text = "Данные Библии не загружены или не обработаны. Пожалуйста, сообщите администратору."
-    elif book_name_canonical not in bible_data_processed:
+    elif book_id is None or not store.has_book(book_id):
         response_text = f"Книга '{book_name_canonical}' найдена в списке алиасов, но не найдена в файле Библии. Проверьте ваш файл bible.json."
-    elif chapter_num_str not in bible_data_processed[book_name_canonical]:
+    elif not store.has_chapter(book_id, chapter_num):
         response_text = f"Глава {chapter_num_str} не найдена в книге '{book_name_canonical}'."
+    elif verse_start is None:
+        messages_to_send = render_passage(book_id, chapter_num, translation=translation)
+        if not messages_to_send: # Если вдруг глава пустая
+            response_text = f"В главе {chapter_num_str} книги '{book_name_canonical}' не найдено стихов."
+    elif verse_start == verse_end and store.verse(book_id, chapter_num, verse_start) is None:
+        response_text = f"Стих {verse_start} не найден в {book_name_canonical} {chapter_num_str} главе."
     else:
-        chapter_data = bible_data_processed[book_name_canonical][chapter_num_str]
-        
-        if verse_start is None:
-            verses = []
-            for v_num_str in sorted(chapter_data.keys(), key=int):
-                verses.append(f"{v_num_str}. {chapter_data[v_num_str]}")
-            
-            response_text = f"*{book_name_canonical} {chapter_num_str} глава:*\n" + "\n".join(verses)
-            if not verses: # Если вдруг глава пустая
-                response_text = f"В главе {chapter_num_str} книги '{book_name_canonical}' не найдено стихов."
-
-        else:
-            requested_verses = []
-            current_verse = verse_start
-            
-            while current_verse <= (verse_end or verse_start):
-                v_str = str(current_verse)
-                if v_str in chapter_data:
-                    requested_verses.append(f"{v_str}. {chapter_data[v_str]}")
-                else:
-                    if verse_start == verse_end:
-                        response_text = f"Стих {v_str} не найден в {book_name_canonical} {chapter_num_str} главе."
-                        break
-                current_verse += 1
-            
-            if not response_text:
-                 if requested_verses:
-                    verse_range_str = f":{verse_start}"
-                    if verse_end is not None and verse_end != verse_start:
-                        verse_range_str += f"-{verse_end}"
-                    
-                    response_text = f"*{book_name_canonical} {chapter_num_str}{verse_range_str}:*\n" + "\n".join(requested_verses)
-                 else:
-                    response_text = f"Стихи в диапазоне {verse_start}{'-'+str(verse_end) if verse_end != verse_start else ''} не найдены в {book_name_canonical} {chapter_num_str} главе."
+        messages_to_send = render_passage(book_id, chapter_num, verse_start, verse_end, translation=translation)
+        if not messages_to_send:
+            response_text = f"Стихи в диапазоне {verse_start}{'-'+str(verse_end) if verse_end != verse_start else ''} не найдены в {book_name_canonical} {chapter_num_str} главе."
 
     # --- Отправка текста для команды /bible ---
-    # Команда /bible отправляет только одно сообщение, не имеет inline-кнопок для навигации.
-    # Если ответ длиннее лимита, он будет обрезан Telegram'ом.
-    # (Для разрыва на части используется меню, а не прямая команда)
+    # Команда /bible не имеет inline-кнопок для навигации; длинный ответ
+    # отправляется несколькими сообщениями, уже разбитыми в render_passage.
+    if messages_to_send:
+        annotate_event(book_id=book_id, chapter=chapter_num)
+        remember_position(context, book_id, chapter_num, verse_start)
     if update.message:
-        await update.message.reply_text(response_text, parse_mode='Markdown')
+        if messages_to_send:
+            for message_chunk in messages_to_send:
+                await update.message.reply_text(message_chunk, parse_mode='Markdown')
+        else:
+            await update.message.reply_text(response_text, parse_mode='Markdown')
 
 
 async def bible_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Вызывает главное меню Библии с выбором Завета."""
-    keyboard = [
-        [InlineKeyboardButton("Ветхий Завет", callback_data="show_books:old_testament")],
-        [InlineKeyboardButton("Новый Завет", callback_data="show_books:new_testament")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
     # Определяем, откуда пришел запрос: от сообщения или от CallbackQuery
     if update.message:
-        await update.message.reply_text("Выберите раздел Библии:", reply_markup=reply_markup)
+        await update.message.reply_text(MAIN_MENU_TEXT, reply_markup=MAIN_MENU_MARKUP)
     elif update.callback_query:
-        await update.callback_query.message.edit_text("Выберите раздел Библии:", reply_markup=reply_markup)
+        await update.callback_query.message.edit_text(MAIN_MENU_TEXT, reply_markup=MAIN_MENU_MARKUP)
 
 
 async def handle_button_press(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -285,152 +1304,250 @@ async def handle_button_press(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer() # Обязательно ответить на CallbackQuery, чтобы убрать "часики"
 
     data = query.data
-    
-    # Вспомогательная функция для отображения списка книг
-    async def display_books(category_type):
-        book_buttons = []
-        if category_type == "old_testament":
-            title = "Ветхий Завет"
-            book_ids_to_show = OLD_TESTAMENT_IDS
-        elif category_type == "new_testament":
-            title = "Новый Завет"
-            book_ids_to_show = NEW_TESTAMENT_IDS
-        else:
-            await query.edit_message_text("Неизвестная категория.")
-            return
+    annotate_event(command=data.split(":")[0])
 
-        current_row = []
-        sorted_book_ids = sorted(book_ids_to_show)
-        
-        for book_id in sorted_book_ids:
-            book_name = canonical_book_names_by_id.get(book_id)
-            if book_name and book_name in bible_data_processed: # Проверяем, что книга есть в загруженной Библии
-                current_row.append(InlineKeyboardButton(book_name, callback_data=f"book:{book_id}"))
-                if len(current_row) == 2: # По 2 кнопки в ряд для книг
-                    book_buttons.append(current_row)
-                    current_row = []
-        if current_row:
-            book_buttons.append(current_row)
-        
-        book_buttons.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main_menu")])
+    # Экраны меню (главное меню, списки книг, страницы сетки глав) построены заранее
+    screen = MENU_SCREENS.get(data)
+    if screen is not None:
+        if data.startswith("book:"):
+            annotate_event(book_id=int(data.split(":")[1]))
+        text, reply_markup, parse_mode = screen
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
 
-        reply_markup = InlineKeyboardMarkup(book_buttons)
-        await query.edit_message_text(f"Выберите книгу из {title}:", reply_markup=reply_markup)
-
-
-    if data.startswith("show_books:"):
-        category = data.split(":")[1]
-        await display_books(category)
+    elif data.startswith("show_books:"):
+        await query.edit_message_text("Неизвестная категория.")
 
     elif data.startswith("book:"):
-        book_id = int(data.split(":")[1])
-        book_name_canonical = canonical_book_names_by_id.get(book_id)
+        await query.edit_message_text("Книга не найдена или не загружена.")
 
-        if not book_name_canonical or book_name_canonical not in bible_data_processed:
-            await query.edit_message_text("Книга не найдена или не загружена.")
+    elif data.startswith("translation:"):
+        code = data.split(":", 1)[1]
+        if code not in translations:
+            await query.edit_message_text("Перевод не найден.")
             return
+        context.user_data["translation"] = code
+        await query.edit_message_text(f"Перевод для /bible и меню: {translations.title(code)} ({code.upper()}).")
 
-        chapter_buttons = []
-        chapters = bible_data_processed[book_name_canonical]
-        
-        current_row = []
-        for chapter_id_str in sorted(chapters.keys(), key=int):
-            current_row.append(InlineKeyboardButton(chapter_id_str, callback_data=f"chapter:{book_id}:{chapter_id_str}"))
-            if len(current_row) == 5:
-                chapter_buttons.append(current_row)
-                current_row = []
-        if current_row:
-            chapter_buttons.append(current_row)
-        
-        category_for_back = 'old_testament' if book_id in OLD_TESTAMENT_IDS else 'new_testament'
-        chapter_buttons.append([InlineKeyboardButton("⬅️ Назад к книгам", callback_data=f"show_books:{category_for_back}")])
+    elif data.startswith("plan:"):
+        plan_id = data.split(":", 1)[1]
+        if plan_id not in READING_PLANS or plan_id not in READING_PLAN_DAYS:
+            await query.edit_message_text("План не найден.")
+            return
+        hour, minute = parse_time(READING_PLAN_TIME)
+        text, plan = start_plan(context, query.from_user.id, query.message.chat.id, plan_id, hour, minute,
+                                parse_utc_offset(READING_PLAN_UTC_OFFSET))
+        await query.edit_message_text(text + f"\nДругое время или часовой пояс: /plan {plan_id} 06:30 +3")
+        day_text, reply_markup = render_plan_day(plan, 0)
+        await query.message.reply_text(day_text, reply_markup=reply_markup)
 
-        reply_markup = InlineKeyboardMarkup(chapter_buttons)
-        await query.edit_message_text(f"Выберите главу для книги *{book_name_canonical}*:", reply_markup=reply_markup, parse_mode='Markdown')
+    elif data.startswith("plan_read:"):
+        day = int(data.split(":", 1)[1])
+        plan = context.user_data.get("plan")
+        if not plan or day >= len(READING_PLAN_DAYS.get(plan["id"], ())):
+            await query.edit_message_reply_markup(None)
+            return
+        # Прогресс — число прочитанных дней; старые дни можно отметить только по порядку
+        if day > plan["last_read"]:
+            plan["read"] += 1
+            plan["last_read"] = day
+        text, reply_markup = render_plan_day(plan, day, with_read_button=False)
+        await query.edit_message_text(f"{text}\n\n✅ Прочитано (всего дней: {plan['read']})", reply_markup=reply_markup)
 
-    elif data.startswith("chapter:"):
+    elif data.startswith("bookmark_del:"):
+        bookmark = [int(part) for part in data.split(":")[1:]]
+        bookmarks = context.user_data.get("bookmarks", [])
+        if bookmark in bookmarks:
+            bookmarks.remove(bookmark)
+        if bookmarks:
+            await query.edit_message_text("Ваши закладки:", reply_markup=bookmarks_markup(bookmarks))
+        else:
+            await query.edit_message_text("Закладок больше нет.")
+
+    elif data.startswith(("chapter:", "read:")):
+        # "chapter:" — из сетки глав (экран меню заменяется текстом главы),
+        # "read:" — из закладок и планов чтения (сообщение с кнопками остаётся)
         _, book_id_str, chapter_id_str = data.split(":")
         book_id = int(book_id_str)
         book_name_canonical = canonical_book_names_by_id.get(book_id)
 
-        if not book_name_canonical or book_name_canonical not in bible_data_processed or chapter_id_str not in bible_data_processed[book_name_canonical]:
-            await query.edit_message_text("Глава не найдена или не загружена.")
+        chapter_num = int(chapter_id_str)
+        annotate_event(book_id=book_id, chapter=chapter_num)
+        translation = user_translation(context)
+        store = await load_translation(translation)
+
+        if not book_name_canonical or store is None or not store.has_chapter(book_id, chapter_num):
+            if data.startswith("read:"):
+                await query.message.reply_text("Глава не найдена или не загружена.")
+            else:
+                await query.edit_message_text("Глава не найдена или не загружена.")
             return
 
-        chapter_data = bible_data_processed[book_name_canonical][chapter_id_str]
-        
-        verses = []
-        for v_num_str in sorted(chapter_data.keys(), key=int):
-            verses.append(f"{v_num_str}. {chapter_data[v_num_str]}")
-        
-        response_text = ""
-        if verses:
-            response_text = f"*{book_name_canonical} {chapter_id_str} глава:*\n" + "\n".join(verses)
+        # Текст главы, уже разбитый на части по лимиту Telegram (из кэша рендеринга)
+        messages_to_send = render_passage(book_id, chapter_num, translation=translation)
+        if messages_to_send:
+            remember_position(context, book_id, chapter_num)
         else:
-            response_text = f"В главе {chapter_id_str} книги '{book_name_canonical}' не найдено стихов."
-        
+            messages_to_send = (f"В главе {chapter_id_str} книги '{book_name_canonical}' не найдено стихов.",)
+
         # --- Отправка текста с учетом лимита сообщений ---
-        # Кнопка "Назад к главам" прикрепляется к последнему сообщению
-        keyboard = [[InlineKeyboardButton("⬅️ Назад к главам", callback_data=f"book:{book_id}")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        # Разделяем текст на части, если он превышает лимит Telegram
-        messages_to_send = []
-        current_message_start = 0
-        
-        full_text_content_for_split = response_text
-
-        while current_message_start < len(full_text_content_for_split):
-            chunk = full_text_content_for_split[current_message_start : current_message_start + TELEGRAM_MESSAGE_LIMIT]
-            messages_to_send.append(chunk)
-            current_message_start += TELEGRAM_MESSAGE_LIMIT
-        
+        # Кнопка "Назад к главам" (на ту же страницу сетки) прикрепляется к последнему сообщению
+        reply_markup = CHAPTER_BACK_MARKUPS.get((book_id, chapter_num))
+
         # Отправляем все части сообщения
         for i, message_chunk in enumerate(messages_to_send):
             # Если это последняя часть, прикрепляем кнопки
             if i == len(messages_to_send) - 1:
                 await query.message.reply_text(message_chunk, parse_mode='Markdown', reply_markup=reply_markup)
             else:
+                # Паузы между частями выдерживает outbound_scheduler (лимит на чат)
                 await query.message.reply_text(message_chunk, parse_mode='Markdown')
-                await asyncio.sleep(0.5) # Небольшая задержка между частями
-        
-        # Если messages_to_send пуст (например, response_text была пустой строкой),
-        # отправляем сообщение о пустой главе
-        if not messages_to_send:
-            await query.message.reply_text("Глава не содержит текста.", parse_mode='Markdown')
+
+        if data.startswith("read:"):
+            return
 
         # Удаляем предыдущее сообщение с кнопками глав
         try:
             await query.delete_message()
         except Exception:
             pass # Если сообщение уже удалено или не существует
-
-    elif data == "back_to_main_menu":
-        keyboard = [
-            [InlineKeyboardButton("Ветхий Завет", callback_data="show_books:old_testament")],
-            [InlineKeyboardButton("Новый Завет", callback_data="show_books:new_testament")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text("Выберите раздел Библии:", reply_markup=reply_markup)
     
 
-if __name__ == '__main__':
-    # Создаем экземпляр Application
-    app = Application.builder().token(TOKEN).build()
+def build_application(with_updater=True):
+    """Создаёт Application со всеми обработчиками бота.
+
+    Рабочим процессам (with_updater=False) обновления передаёт фронтальный
+    процесс, поэтому своего получения обновлений у них нет.
+    """
+    builder = Application.builder().token(TOKEN).rate_limiter(outbound_scheduler)
+    if TELEGRAM_API_BASE_URL:
+        # Локальный Bot API сервер (или поддельный Bot API из benchmarks/)
+        builder = builder.base_url(TELEGRAM_API_BASE_URL)
+    if not with_updater:
+        builder = builder.updater(None)
+    if USER_STATE_DB_PATH:
+        # В многопроцессном режиме каждый процесс загружает и записывает только своих
+        # пользователей: ID % WORKERS, по тому же ключу фронт раздаёт обновления (sharding.shard_key)
+        builder = builder.persistence(SQLitePersistence(
+            os.path.join(os.path.dirname(__file__), USER_STATE_DB_PATH),
+            update_interval=USER_STATE_UPDATE_INTERVAL,
+            shard=(WORKER_INDEX, WORKERS) if WORKERS > 1 else None,
+        ))
+    app = builder.build()
 
     # Регистрируем функцию post_init для загрузки Библии
     app.post_init = post_init
+    app.post_shutdown = post_shutdown
 
     # Добавляем обработчики команд
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("bible", read_bible_command))
-    app.add_handler(CommandHandler("bible_menu", bible_menu)) # Регистрируем глобальную функцию bible_menu
+    # (каждый обработчик обёрнут в tracked, чтобы обращения попадали в журнал событий)
+    app.add_handler(CommandHandler("start", tracked("command", "start")(start)))
+    app.add_handler(CommandHandler("bible", tracked("command", "bible")(read_bible_command)))
+    app.add_handler(CommandHandler("bible_menu", tracked("command", "bible_menu")(bible_menu))) # Регистрируем глобальную функцию bible_menu
+    app.add_handler(CommandHandler("search", tracked("command", "search")(search_command)))
+    app.add_handler(CommandHandler("translation", tracked("command", "translation")(translation_command)))
+    app.add_handler(CommandHandler("compare", tracked("command", "compare")(compare_command)))
+    app.add_handler(CommandHandler("continue", tracked("command", "continue")(continue_command)))
+    app.add_handler(CommandHandler("bookmark", tracked("command", "bookmark")(bookmark_command)))
+    app.add_handler(CommandHandler("bookmarks", tracked("command", "bookmarks")(bookmarks_command)))
+    app.add_handler(CommandHandler("plan", tracked("command", "plan")(plan_command)))
+    app.add_handler(CommandHandler("today", tracked("command", "today")(today_command)))
+    app.add_handler(CommandHandler("subscribe", tracked("command", "subscribe")(subscribe_command)))
+    app.add_handler(CommandHandler("unsubscribe", tracked("command", "unsubscribe")(unsubscribe_command)))
+    app.add_handler(CommandHandler("stats", stats_command))
+
+    # Inline-запросы обрабатываются без блокировки очереди обновлений: так новый запрос
+    # пользователя может отменить его же предыдущий, ещё ожидающий паузы в наборе
+    app.add_handler(InlineQueryHandler(tracked("inline")(inline_query), block=False))
 
     # Добавляем обработчик для всех CallbackQuery (нажатий на inline-кнопки)
-    app.add_handler(CallbackQueryHandler(handle_button_press)) # Регистрируем глобальную функцию handle_button_press
+    app.add_handler(CallbackQueryHandler(tracked("button")(handle_button_press))) # Регистрируем глобальную функцию handle_button_press
 
     # Добавляем обработчик для всех текстовых сообщений, которые НЕ являются командами
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, tracked("message")(handle_message)))
+    return app
+
+
+def run_application(app):
+    """Запускает бота через webhook, если задан WEBHOOK_URL, иначе через long polling.
+
+    В режиме webhook по сигналу остановки сервер перестаёт принимать запросы,
+    а уже полученные обновления дообрабатываются перед выходом.
+    """
+    if WEBHOOK_URL:
+        print(f"Bot Started (webhook {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH})...")
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET_TOKEN,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    else:
+        print("Bot Started...")
+        app.run_polling()
 
-    print("Bot Started...")
-    app.run_polling()
+
+# --- Многопроцессный режим ---
+
+def build_front_application(dispatcher):
+    """Application фронтального процесса: только получает обновления и раздаёт их рабочим процессам."""
+    builder = Application.builder().token(TOKEN)
+    if TELEGRAM_API_BASE_URL:
+        builder = builder.base_url(TELEGRAM_API_BASE_URL)
+    app = builder.build()
+
+    async def start_dispatcher(application):
+        await dispatcher.start()
+
+    async def stop_dispatcher(application):
+        await dispatcher.stop()
+
+    app.post_init = start_dispatcher
+    app.post_shutdown = stop_dispatcher
+    app.add_handler(TypeHandler(Update, dispatcher.dispatch))
+    return app
+
+async def serve_worker(app, sock):
+    """Жизненный цикл Application рабочего процесса: обновления приходят из сокета до его закрытия."""
+    await app.initialize()
+    await post_init(app)
+    await app.start()
+    try:
+        await serve_updates(app, sock)
+    finally:
+        # stop() дожидается обработки уже полученных обновлений
+        await app.stop()
+        await post_shutdown(app)
+        await app.shutdown()
+
+def run_worker(index, sock):
+    """Точка входа рабочего процесса (после fork)."""
+    global WORKER_INDEX
+    WORKER_INDEX = index
+    asyncio.run(serve_worker(build_application(with_updater=False), sock))
+
+def run_sharded(worker_count):
+    """Загружает данные, запускает worker_count рабочих процессов и фронтальный процесс."""
+    asyncio.run(load_data())
+    if event_log is not None:
+        asyncio.run(event_log.stop()) # соединения SQLite не должны переживать fork
+    workers = fork_workers(worker_count, run_worker)
+    print(f"Запущено рабочих процессов: {worker_count}")
+    dispatcher = UpdateDispatcher([sock for _, sock in workers])
+    # asyncio.run() выше оставил процесс без текущего цикла событий, а run_polling/run_webhook его ожидают
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    try:
+        run_application(build_front_application(dispatcher))
+    finally:
+        exit_codes = wait_workers(workers)
+        print(f"Рабочие процессы завершены: {exit_codes}, обновлений передано: {dispatcher.dispatched}")
+
+
+if __name__ == '__main__':
+    # Создаем экземпляр Application и запускаем бота
+    if WORKERS > 1:
+        run_sharded(WORKERS)
+    else:
+        run_application(build_application())
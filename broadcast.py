@@ -0,0 +1,165 @@
+"""Подписчики и массовые рассылки.
+
+SubscriberStore хранит подписанные чаты в SQLite и отдаёт их пачками по
+возрастанию chat_id (keyset-пагинация), не загружая всю таблицу в память.
+run_broadcast() рассылает сообщение всем подписчикам пачка за пачкой с
+приоритетом PRIORITY_BULK (темп задаёт OutboundScheduler), после каждой
+пачки сохраняет контрольную точку и поэтому после падения продолжает с места
+остановки. Чаты, заблокировавшие бота, удаляются из подписчиков.
+
+В многопроцессном режиме каждый рабочий процесс рассылает свою часть
+подписчиков (shard: chat_id % число процессов == номер процесса) со своей
+контрольной точкой, поэтому рассылка идёт с общим лимитом бота, а не с долей
+одного процесса.
+"""
+import asyncio
+import sqlite3
+import time
+
+from telegram.error import BadRequest, Forbidden, TelegramError
+
+from outbound import PRIORITY_BULK
+
+# chat_id бывают отрицательными (группы), поэтому обход начинается с минимального int64
+MIN_CHAT_ID = -(2 ** 63)
+
+
+def _shard_filter(shard):
+    """Условие SQL и параметры для подписчиков части shard = (номер, число частей)."""
+    if shard is None:
+        return "", ()
+    index, count = shard
+    # В SQLite остаток от деления отрицательного числа отрицателен, приводим к остатку как в Python
+    return " AND (chat_id % ? + ?) % ? = ?", (count, count, count, index)
+
+
+class SubscriberStore:
+    """Подписчики и контрольные точки рассылок в SQLite."""
+
+    def __init__(self, db_path):
+        self._db = sqlite3.connect(db_path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS subscribers (
+                chat_id INTEGER PRIMARY KEY,
+                subscribed_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                broadcast_id TEXT PRIMARY KEY,
+                last_chat_id INTEGER NOT NULL,
+                sent INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                pruned INTEGER NOT NULL DEFAULT 0,
+                finished INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            );
+        """)
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def subscribe(self, chat_id):
+        """Подписывает чат. Возвращает False, если он уже был подписан."""
+        with self._db:
+            cursor = self._db.execute("INSERT OR IGNORE INTO subscribers (chat_id, subscribed_at) VALUES (?, ?)",
+                                      (chat_id, time.time()))
+        return cursor.rowcount > 0
+
+    def unsubscribe(self, chat_id):
+        """Отписывает чат. Возвращает False, если он не был подписан."""
+        with self._db:
+            cursor = self._db.execute("DELETE FROM subscribers WHERE chat_id = ?", (chat_id,))
+        return cursor.rowcount > 0
+
+    def remove_many(self, chat_ids):
+        with self._db:
+            self._db.executemany("DELETE FROM subscribers WHERE chat_id = ?", [(chat_id,) for chat_id in chat_ids])
+
+    def count(self, shard=None):
+        condition, params = _shard_filter(shard)
+        return self._db.execute("SELECT COUNT(*) FROM subscribers WHERE 1" + condition, params).fetchone()[0]
+
+    def iter_batches(self, after_chat_id=MIN_CHAT_ID, batch_size=500, shard=None):
+        """Генератор списков chat_id больше after_chat_id (только части shard, если задана), по batch_size штук."""
+        condition, params = _shard_filter(shard)
+        while True:
+            rows = self._db.execute(
+                "SELECT chat_id FROM subscribers WHERE chat_id > ?" + condition + " ORDER BY chat_id LIMIT ?",
+                (after_chat_id, *params, batch_size),
+            ).fetchall()
+            if not rows:
+                return
+            batch = [row[0] for row in rows]
+            yield batch
+            after_chat_id = batch[-1]
+
+    def get_checkpoint(self, broadcast_id):
+        """Словарь с прогрессом рассылки или None, если она ещё не начиналась."""
+        row = self._db.execute(
+            "SELECT last_chat_id, sent, failed, pruned, finished FROM broadcasts WHERE broadcast_id = ?",
+            (broadcast_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {"last_chat_id": row[0], "sent": row[1], "failed": row[2], "pruned": row[3], "finished": bool(row[4])}
+
+    def save_checkpoint(self, broadcast_id, last_chat_id, sent, failed, pruned, finished):
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO broadcasts (broadcast_id, last_chat_id, sent, failed, pruned, finished, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (broadcast_id, last_chat_id, sent, failed, pruned, int(finished), time.time()),
+            )
+
+
+def _is_chat_gone(error):
+    """True, если чат больше не может получать сообщения бота."""
+    if isinstance(error, Forbidden):
+        return True
+    return isinstance(error, BadRequest) and "chat not found" in error.message.lower()
+
+
+async def run_broadcast(bot, store, broadcast_id, messages, parse_mode=None, batch_size=500, concurrency=30,
+                        shard=None):
+    """Рассылает сообщения messages (список частей) всем подписчикам (или их части shard).
+
+    Повторный вызов с тем же broadcast_id продолжает рассылку с последней
+    сохранённой пачки, а завершённую рассылку не повторяет.
+    Возвращает словарь с итогами (как в get_checkpoint).
+    """
+    checkpoint = store.get_checkpoint(broadcast_id) or {
+        "last_chat_id": MIN_CHAT_ID, "sent": 0, "failed": 0, "pruned": 0, "finished": False,
+    }
+    if checkpoint["finished"]:
+        return checkpoint
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def deliver(chat_id):
+        async with semaphore:
+            try:
+                for message_text in messages:
+                    await bot.send_message(chat_id, message_text, parse_mode=parse_mode,
+                                           rate_limit_args={"priority": PRIORITY_BULK})
+            except TelegramError as e:
+                return e
+            return None
+
+    for batch in store.iter_batches(checkpoint["last_chat_id"], batch_size, shard):
+        results = await asyncio.gather(*(deliver(chat_id) for chat_id in batch))
+        gone = [chat_id for chat_id, error in zip(batch, results) if error is not None and _is_chat_gone(error)]
+        failed = sum(1 for error in results if error is not None)
+        if gone:
+            store.remove_many(gone)
+        checkpoint["sent"] += len(batch) - failed
+        checkpoint["failed"] += failed - len(gone)
+        checkpoint["pruned"] += len(gone)
+        checkpoint["last_chat_id"] = batch[-1]
+        store.save_checkpoint(broadcast_id, checkpoint["last_chat_id"], checkpoint["sent"],
+                              checkpoint["failed"], checkpoint["pruned"], finished=False)
+
+    checkpoint["finished"] = True
+    store.save_checkpoint(broadcast_id, checkpoint["last_chat_id"], checkpoint["sent"],
+                          checkpoint["failed"], checkpoint["pruned"], finished=True)
+    return checkpoint
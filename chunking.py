@@ -0,0 +1,98 @@
+"""Разбиение длинных ответов на сообщения Telegram.
+
+Текст собирается из блоков (заголовок, стихи, результаты поиска), и блоки
+жадно укладываются в сообщения целиком: сообщение заканчивается только на
+границе блока, поэтому стих никогда не разрезается пополам, а разметка
+каждого блока остаётся сбалансированной. Жадная укладка блоков по порядку
+даёт наименьшее возможное число сообщений. Разрезается только блок, который
+сам по себе длиннее лимита, — по пробелу, не посередине символа.
+
+Длина считается в единицах UTF-16, как её считает Telegram (символы вне
+BMP, например эмодзи, занимают две единицы). Лимит применяется к тексту
+вместе с символами разметки, то есть с запасом: Telegram считает длину уже
+после разбора разметки.
+"""
+
+# Максимальная длина сообщения в Telegram (4096 единиц UTF-16)
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Символы, которые нужно экранировать в тексте для parse_mode='Markdown'
+MARKDOWN_SPECIAL_CHARS = "_*`["
+
+
+def utf16_length(text):
+    """Длина текста в единицах UTF-16 (так длину сообщений считает Telegram)."""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def escape_markdown(text):
+    """Экранирует текст для parse_mode='Markdown', чтобы он не менял разметку."""
+    if not any(char in text for char in MARKDOWN_SPECIAL_CHARS):
+        return text
+    return "".join("\\" + char if char in MARKDOWN_SPECIAL_CHARS else char for char in text)
+
+
+def _cut_position(block, limit):
+    """Позиция (в символах Python), до которой block укладывается в limit единиц UTF-16.
+
+    Предпочтительно режем по последнему пробелу; без пробелов — по лимиту,
+    но не сразу после экранирующего обратного слэша.
+    """
+    units = 0
+    cut = 0
+    last_space = -1
+    for position, char in enumerate(block):
+        units += 2 if ord(char) > 0xFFFF else 1
+        if units > limit:
+            break
+        cut = position + 1
+        if char.isspace():
+            last_space = position
+    if last_space > 0:
+        return last_space
+    if cut > 1 and block[cut - 1] == "\\":
+        cut -= 1
+    return max(cut, 1)
+
+
+def split_block(block, limit=TELEGRAM_MESSAGE_LIMIT):
+    """Разрезает слишком длинный блок на части не длиннее limit (по пробелам)."""
+    parts = []
+    while utf16_length(block) > limit:
+        cut = _cut_position(block, limit)
+        parts.append(block[:cut].rstrip())
+        block = block[cut:].lstrip()
+    if block:
+        parts.append(block)
+    return parts
+
+
+def pack_blocks(blocks, limit=TELEGRAM_MESSAGE_LIMIT, separator="\n"):
+    """Жадно укладывает блоки по порядку в как можно меньшее число сообщений.
+
+    Блоки внутри сообщения соединяются separator. Возвращает список сообщений,
+    каждое не длиннее limit единиц UTF-16.
+    """
+    separator_length = utf16_length(separator)
+    messages = []
+    current = []
+    current_length = 0
+    for block in blocks:
+        block_length = utf16_length(block)
+        if block_length > limit:
+            pieces = split_block(block, limit)
+        else:
+            pieces = (block,)
+        for piece in pieces:
+            piece_length = block_length if len(pieces) == 1 else utf16_length(piece)
+            if current and current_length + separator_length + piece_length <= limit:
+                current.append(piece)
+                current_length += separator_length + piece_length
+            else:
+                if current:
+                    messages.append(separator.join(current))
+                current = [piece]
+                current_length = piece_length
+    if current:
+        messages.append(separator.join(current))
+    return messages
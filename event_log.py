@@ -0,0 +1,242 @@
+"""Журнал событий бота (кто, что запросил, сколько обрабатывалось) в SQLite.
+
+Обработчики только кладут событие в кольцевой буфер в памяти (log() ничего
+не ждёт и не обращается к диску), а фоновая задача раз в flush_interval
+секунд или при накоплении batch_size событий записывает их пачкой одной
+транзакцией в SQLite (WAL) в отдельном потоке. Если запись не успевает за
+потоком событий, буфер сначала начинает прореживать события (оставляет
+каждое sample_every-е), а заполнившись, вытесняет самые старые — обработка
+обновлений при этом никогда не блокируется.
+
+Обработчик можно обернуть в EventLog.track(), тогда событие с задержкой
+обработки записывается автоматически, а сам обработчик дополняет его через
+annotate_event(book_id=..., chapter=...).
+"""
+import asyncio
+import collections
+import contextvars
+import functools
+import sqlite3
+import time
+
+# Начиная с какой заполненности буфера (доля от capacity) события прореживаются
+SAMPLE_WATERMARK = 0.5
+# Сколько символов текста сообщения сохранять
+MAX_TEXT_LENGTH = 200
+
+# Поля события, которое сейчас обрабатывается (см. EventLog.track)
+_current_event = contextvars.ContextVar("current_event", default=None)
+
+
+def annotate_event(**fields):
+    """Дополняет событие текущего обработчика (book_id, chapter, command, text)."""
+    event = _current_event.get()
+    if event is not None:
+        event.update(fields)
+
+
+class EventLog:
+    """Асинхронный журнал событий с пакетной записью в SQLite."""
+
+    def __init__(self, db_path, capacity=10_000, batch_size=500, flush_interval=1.0, sample_every=10):
+        self.db_path = db_path
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sample_every = sample_every
+        self._buffer = collections.deque(maxlen=capacity) # кольцевой буфер кортежей-строк
+        self._sample_counter = 0
+        self._wakeup = None
+        self._task = None
+        self._stopping = False
+        self._writer = None # соединение только для потока записи
+        self._reader = None # соединение для запросов из цикла событий
+        # Метрики
+        self.logged = 0
+        self.written = 0
+        self.sampled_out = 0 # отброшено прореживанием
+        self.dropped = 0 # вытеснено из переполненного буфера
+        self.write_errors = 0
+
+    @property
+    def pending(self):
+        return len(self._buffer)
+
+    # --- Запуск и остановка ---
+
+    def open(self):
+        """Открывает базу (создаёт таблицы). Запросы доступны сразу, запись — после start()."""
+        self._writer = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._writer.execute("PRAGMA synchronous=NORMAL")
+        self._writer.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY,
+                ts REAL NOT NULL,
+                kind TEXT NOT NULL,
+                command TEXT,
+                user_id INTEGER,
+                chat_id INTEGER,
+                book_id INTEGER,
+                chapter INTEGER,
+                latency_ms REAL,
+                text TEXT
+            );
+            CREATE TABLE IF NOT EXISTS chapter_hits (
+                book_id INTEGER NOT NULL,
+                chapter INTEGER NOT NULL,
+                hits INTEGER NOT NULL,
+                PRIMARY KEY (book_id, chapter)
+            );
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                first_name TEXT,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL
+            );
+        """)
+        self._writer.commit()
+        self._reader = sqlite3.connect(self.db_path)
+
+    def start(self):
+        """Запускает фоновую запись. Вызывать из работающего цикла событий."""
+        if self._writer is None:
+            self.open()
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Дописывает накопленные события и закрывает базу."""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._reader.close()
+            self._writer = self._reader = None
+
+    # --- Запись ---
+
+    def log(self, kind, command=None, user=None, chat_id=None, book_id=None, chapter=None, latency=None, text=None):
+        """Кладёт событие в буфер. Возвращает False, если событие отброшено прореживанием.
+
+        user — объект telegram.User (или None); latency — секунды.
+        """
+        self.logged += 1
+        fill = len(self._buffer) / self.capacity
+        if fill >= SAMPLE_WATERMARK:
+            self._sample_counter += 1
+            if self._sample_counter % self.sample_every:
+                self.sampled_out += 1
+                return False
+        if fill >= 1:
+            self.dropped += 1 # deque(maxlen) вытеснит самое старое событие
+        self._buffer.append((
+            time.time(), kind, command,
+            user.id if user else None, user.username if user else None, user.first_name if user else None,
+            chat_id, book_id, chapter,
+            latency * 1000 if latency is not None else None,
+            text[:MAX_TEXT_LENGTH] if text else None,
+        ))
+        if self._wakeup is not None and len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def track(self, kind, command=None):
+        """Декоратор обработчика PTB: записывает событие kind с задержкой обработки."""
+        def decorator(callback):
+            @functools.wraps(callback)
+            async def wrapper(update, context):
+                event = {"command": command}
+                token = _current_event.set(event)
+                started = time.perf_counter()
+                try:
+                    return await callback(update, context)
+                finally:
+                    latency = time.perf_counter() - started
+                    _current_event.reset(token)
+                    self.log(kind, user=update.effective_user,
+                             chat_id=update.effective_chat.id if update.effective_chat else None,
+                             latency=latency, **event)
+            return wrapper
+        return decorator
+
+    async def _flush_loop(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+        await self.flush()
+
+    async def flush(self):
+        """Записывает всё накопленное пачками по batch_size."""
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+                self.written += len(batch)
+            except sqlite3.Error as e:
+                self.write_errors += 1
+                print(f"Ошибка записи журнала событий ({len(batch)} событий потеряно): {e}")
+
+    def _write_batch(self, batch):
+        with self._writer:
+            self._writer.executemany(
+                "INSERT INTO events (ts, kind, command, user_id, chat_id, book_id, chapter, latency_ms, text) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(ts, kind, command, user_id, chat_id, book_id, chapter, latency_ms, text)
+                 for ts, kind, command, user_id, _, _, chat_id, book_id, chapter, latency_ms, text in batch],
+            )
+            # Счётчики популярности обновляются в той же транзакции, чтобы запросы
+            # популярности не сканировали весь журнал
+            hits = collections.Counter((row[7], row[8]) for row in batch if row[7] is not None and row[8] is not None)
+            self._writer.executemany(
+                "INSERT INTO chapter_hits (book_id, chapter, hits) VALUES (?, ?, ?) "
+                "ON CONFLICT (book_id, chapter) DO UPDATE SET hits = hits + excluded.hits",
+                [(book_id, chapter, count) for (book_id, chapter), count in hits.items()],
+            )
+            users = {row[3]: row for row in batch if row[3] is not None} # последнее событие каждого пользователя
+            self._writer.executemany(
+                "INSERT INTO users (user_id, username, first_name, first_seen, last_seen) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET username = excluded.username, "
+                "first_name = excluded.first_name, last_seen = excluded.last_seen",
+                [(user_id, username, first_name, ts, ts)
+                 for ts, _, _, user_id, username, first_name, *_ in users.values()],
+            )
+
+    # --- Запросы ---
+
+    def popular_chapters(self, limit=20):
+        """[(book_id, chapter, запросов)] по убыванию популярности."""
+        return self._reader.execute(
+            "SELECT book_id, chapter, hits FROM chapter_hits ORDER BY hits DESC LIMIT ?", (limit,)
+        ).fetchall()
+
+    def popular_books(self, limit=10):
+        """[(book_id, запросов)] по убыванию популярности (сумма по главам)."""
+        return self._reader.execute(
+            "SELECT book_id, SUM(hits) AS total FROM chapter_hits GROUP BY book_id ORDER BY total DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+
+    def user_count(self):
+        return self._reader.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def stats(self):
+        """Снимок метрик для мониторинга."""
+        return {
+            "pending": len(self._buffer),
+            "capacity": self.capacity,
+            "logged": self.logged,
+            "written": self.written,
+            "sampled_out": self.sampled_out,
+            "dropped": self.dropped,
+            "write_errors": self.write_errors,
+        }
@@ -0,0 +1,319 @@
+"""Метрики бота в текстовом формате Prometheus и выборочный профилировщик.
+
+Счётчики (Counter), измеряемые значения (Gauge) и гистограммы (Histogram)
+регистрируются в общем реестре REGISTRY при создании, как в prometheus_client,
+и обновляются без блокировок (всё работает в одном цикле событий). Локальный
+HTTP-сервер (start_http_server) отдаёт:
+
+    GET /metrics         — все метрики в текстовом формате Prometheus 0.0.4
+    GET /profile/start   — включает выборочный профилировщик
+    GET /profile/stop    — выключает его и отдаёт профиль в формате collapsed stacks
+                           (flamegraph.pl, speedscope), копия сохраняется в файл
+
+Профилировщик из отдельного потока несколько сотен раз в секунду снимает стеки
+всех потоков через sys._current_frames() и считает одинаковые стеки, поэтому
+код бота для профилирования не меняется, а накладные расходы невелики.
+"""
+import asyncio
+import bisect
+import collections
+import functools
+import os
+import sys
+import threading
+import time
+
+# Границы корзин гистограмм задержек по умолчанию, секунды
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class MetricsRegistry:
+    """Набор метрик, которые отдаются одной страницей /metrics."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {} # кортеж значений меток -> значение
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labelnames)
+
+    def samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())]
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик."""
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Текущее значение; function (без меток) вычисляет его при каждом чтении /metrics."""
+    type = "gauge"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY, function=None):
+        super().__init__(name, help, labelnames, registry)
+        self._function = function
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        if self._function is not None:
+            try:
+                return [f"{self.name} {_format_value(float(self._function()))}"]
+            except Exception:
+                return [] # источник значения ещё не инициализирован
+        return super().samples()
+
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам (в /metrics — накопительные _bucket, _sum и _count)."""
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            # Счётчики по корзинам (последняя — +Inf), сумма, количество
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def samples(self):
+        lines = []
+        for key, (bucket_counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, extra=(("le", _format_value(float(bound))),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+# --- Обработчики ---
+
+HANDLER_REQUESTS = Counter("tgbot_handler_requests_total", "Обработанные обновления по обработчикам и исходу",
+                           ("handler", "outcome"))
+HANDLER_LATENCY = Histogram("tgbot_handler_latency_seconds", "Время работы обработчика", ("handler",))
+HANDLER_IN_FLIGHT = Gauge("tgbot_handler_in_flight", "Обработчики, выполняющиеся сейчас", ("handler",))
+
+
+def instrument_handler(label):
+    """Декоратор обработчика PTB: счётчик, гистограмма задержки и число выполняющихся.
+
+    label — имя обработчика или функция label(update), например тип кнопки по callback_data.
+    """
+    def decorator(callback):
+        @functools.wraps(callback)
+        async def wrapper(update, context):
+            handler = label(update) if callable(label) else label
+            HANDLER_IN_FLIGHT.inc(handler=handler)
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                result = await callback(update, context)
+                outcome = "ok"
+                return result
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                raise
+            finally:
+                HANDLER_LATENCY.observe(time.perf_counter() - started, handler=handler)
+                HANDLER_REQUESTS.inc(handler=handler, outcome=outcome)
+                HANDLER_IN_FLIGHT.dec(handler=handler)
+        return wrapper
+    return decorator
+
+
+# --- Задержка цикла событий ---
+
+EVENT_LOOP_LAG = Histogram("tgbot_event_loop_lag_seconds", "Насколько позже срока просыпается цикл событий",
+                           buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+EVENT_LOOP_LAG_LAST = Gauge("tgbot_event_loop_lag_last_seconds", "Последнее измерение задержки цикла событий")
+
+
+async def monitor_event_loop_lag(interval=0.5):
+    """Фоновая задача: засыпает на interval и измеряет, насколько позже проснулась."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        EVENT_LOOP_LAG.observe(lag)
+        EVENT_LOOP_LAG_LAST.set(lag)
+
+
+# --- Выборочный профилировщик ---
+
+class SamplingProfiler:
+    """Снимает стеки всех потоков из фонового потока и считает одинаковые (collapsed stacks)."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._stacks = collections.Counter()
+        self._thread = None
+        self._stop = threading.Event()
+        self.samples = 0
+        self.started_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return False
+        self._stacks.clear()
+        self.samples = 0
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Останавливает профилировщик и возвращает профиль: строки "кадр;кадр;... число"."""
+        if self._thread is None:
+            return ""
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                frames.append(names.get(thread_id, str(thread_id)))
+                self._stacks[";".join(reversed(frames))] += 1
+            self.samples += 1
+
+
+# --- HTTP-сервер ---
+
+async def start_http_server(host, port, profiler=None, profile_dir="."):
+    """Запускает HTTP-сервер метрик (и профилировщика, если он передан). Возвращает asyncio.Server."""
+
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass # заголовки не нужны
+            parts = request_line.decode('latin-1').split()
+            path = parts[1].split("?", 1)[0] if len(parts) > 1 else "/"
+            status, body = "200 OK", ""
+            if path == "/metrics":
+                body = REGISTRY.render()
+            elif path == "/profile/start" and profiler is not None:
+                body = "profiler started\n" if profiler.start() else "profiler already running\n"
+            elif path == "/profile/stop" and profiler is not None:
+                if not profiler.running:
+                    status, body = "409 Conflict", "profiler is not running\n"
+                else:
+                    body = profiler.stop()
+                    file_path = os.path.join(profile_dir, time.strftime("profile-%Y%m%d-%H%M%S.folded"))
+                    # Профиль уже снят: если сохранить копию не удалось, он всё равно отдаётся в ответе
+                    try:
+                        os.makedirs(profile_dir, exist_ok=True)
+                        with open(file_path, "w", encoding="utf-8") as f:
+                            f.write(body)
+                        print(f"Профиль сохранён в {file_path} ({profiler.samples} выборок)")
+                    except OSError as e:
+                        print(f"Ошибка: Не удалось сохранить профиль в {file_path}: {e}")
+            else:
+                status, body = "404 Not Found", "not found\n"
+            data = body.encode('utf-8')
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode('latin-1') + data)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,237 @@
+"""Планировщик исходящих запросов к Bot API.
+
+OutboundScheduler подключается к Application как rate limiter, поэтому через
+него проходят все вызовы Bot API из всех обработчиков. Отправки в чат
+ограничиваются двумя ведрами токенов: общим (~30 сообщений/с на бота) и
+отдельным для каждого чата (~1 сообщение/с в личном чате с небольшим
+запасом на всплеск, 20 сообщений/мин в группе) — по лимитам из Bot FAQ Telegram.
+Интерактивные ответы обслуживаются раньше массовых рассылок, а на 429
+(RetryAfter) чат приостанавливается на указанное время и запрос повторяется.
+Лимиты касаются только новых сообщений в чате (send*, copyMessage,
+forwardMessage): правка и удаление сообщений, ответы на нажатия кнопок и
+inline-запросы уходят сразу.
+
+Приоритет массовой отправки задаётся при вызове метода бота:
+    await bot.send_message(chat_id, text, rate_limit_args={"priority": PRIORITY_BULK})
+"""
+import asyncio
+import heapq
+import itertools
+import time
+
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import BaseRateLimiter
+
+from metrics import Counter, Gauge, Histogram
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+# Сколько ведер чатов держать, прежде чем выбросить простаивающие
+CHAT_BUCKETS_SOFT_LIMIT = 10_000
+# Методы Bot API без префикса send, которые тоже отправляют в чат новое сообщение
+MESSAGE_FORWARD_ENDPOINTS = frozenset({"copyMessage", "copyMessages", "forwardMessage", "forwardMessages"})
+
+
+def is_message_send(endpoint):
+    """Отправляет ли метод новое сообщение в чат (только на них действуют лимиты Telegram)."""
+    return (endpoint.startswith("send") and endpoint != "sendChatAction") or endpoint in MESSAGE_FORWARD_ENDPOINTS
+
+# Метрики Prometheus (см. metrics.py)
+API_REQUESTS = Counter("tgbot_bot_api_requests_total", "Вызовы Bot API по методу и исходу", ("method", "outcome"))
+API_LATENCY = Histogram("tgbot_bot_api_latency_seconds", "Время ответа Bot API на один запрос", ("method",))
+API_QUEUE_WAIT = Histogram("tgbot_bot_api_queue_wait_seconds", "Ожидание очереди лимитов перед запросом",
+                           ("priority",))
+API_IN_FLIGHT = Gauge("tgbot_bot_api_in_flight", "Запросы к Bot API, ожидающие ответа")
+API_WAITING = Gauge("tgbot_bot_api_waiting", "Запросы, ожидающие очереди лимитов")
+
+
+class TokenBucket:
+    """Ведро токенов с очередью ожидающих по приоритету (меньше — раньше)."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate # токенов в секунду
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._waiters = [] # куча (приоритет, порядковый номер, future)
+        self._counter = itertools.count()
+        self._timer = None
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    def is_idle(self):
+        self._refill()
+        return not self._waiters and self._tokens >= self.capacity
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, priority=PRIORITY_INTERACTIVE):
+        self._refill()
+        if not self._waiters and self._tokens >= 1:
+            self._tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        self._schedule()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Токен уже был выдан, но ожидающий отменён — возвращаем токен
+                self._tokens += 1
+                self._wake()
+            raise
+
+    def pause(self, seconds):
+        """Запрещает выдачу токенов на seconds секунд (после RetryAfter)."""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._schedule()
+
+    def _schedule(self):
+        if self._timer is None and self._waiters:
+            delay = max(0.0, (1 - self._tokens) / self.rate)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._wake)
+
+    def _wake(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._refill()
+        while self._waiters and self._tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._tokens -= 1
+            future.set_result(None)
+        self._schedule()
+
+
+class OutboundScheduler(BaseRateLimiter):
+    """Rate limiter для Application: общий и по-чатовые лимиты, приоритеты, повтор после 429."""
+
+    def __init__(self, global_rate=30.0, private_chat_rate=1.0, private_chat_burst=3,
+                 group_chat_rate=20 / 60, group_chat_burst=3, max_retries=3):
+        # Запас на всплеск входит в лимит: ведро пополняется на global_rate - burst в секунду,
+        # поэтому в любом окне в 1 с уходит не больше burst + (global_rate - burst) = global_rate
+        # сообщений (при global_rate < 2 — не больше burst + global_rate / 2)
+        burst = max(1.0, global_rate / 10)
+        self.global_rate = global_rate
+        self._global = TokenBucket(max(global_rate - burst, global_rate / 2), burst)
+        self._private_chat_rate = private_chat_rate
+        self._private_chat_burst = private_chat_burst
+        self._group_chat_rate = group_chat_rate
+        self._group_chat_burst = group_chat_burst
+        self.max_retries = max_retries
+        self._chat_buckets = {}
+        # Метрики
+        self.waiting = 0 # запросов ждут своей очереди прямо сейчас
+        self.max_waiting = 0
+        self.sent = 0
+        self.retries = 0
+        self.latency_count = 0 # задержка от постановки в очередь до ответа Bot API
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        self._chat_buckets.clear()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= CHAT_BUCKETS_SOFT_LIMIT:
+                self._chat_buckets = {key: value for key, value in self._chat_buckets.items()
+                                      if not value.is_idle()}
+            is_private = isinstance(chat_id, int) and chat_id > 0
+            if is_private:
+                bucket = TokenBucket(self._private_chat_rate, self._private_chat_burst)
+            else:
+                bucket = TokenBucket(self._group_chat_rate, self._group_chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority = (rate_limit_args or {}).get("priority", PRIORITY_INTERACTIVE)
+        chat_id = data.get("chat_id")
+        # Лимиты применяются только к новым сообщениям в конкретный чат; editMessageText,
+        # deleteMessage, answerCallbackQuery и прочие вызовы уходят сразу: иначе в группе
+        # (20 сообщений в минуту) каждое нажатие кнопки меню ждало бы несколько секунд
+        chat_bucket = self._chat_bucket(chat_id) if chat_id is not None and is_message_send(endpoint) else None
+        enqueued_at = time.monotonic()
+        attempt = 0
+        while True:
+            if chat_bucket is not None:
+                self.waiting += 1
+                self.max_waiting = max(self.max_waiting, self.waiting)
+                API_WAITING.set(self.waiting)
+                queued_at = time.monotonic()
+                try:
+                    await chat_bucket.acquire(priority)
+                    await self._global.acquire(priority)
+                finally:
+                    self.waiting -= 1
+                    API_WAITING.set(self.waiting)
+                API_QUEUE_WAIT.observe(time.monotonic() - queued_at, priority=priority)
+            try:
+                result = await self._call(callback, args, kwargs, endpoint)
+            except RetryAfter as exc:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                if chat_bucket is not None:
+                    chat_bucket.pause(exc.retry_after)
+                else:
+                    await asyncio.sleep(exc.retry_after)
+                continue
+            latency = time.monotonic() - enqueued_at
+            self.sent += 1
+            self.latency_count += 1
+            self.latency_sum += latency
+            self.latency_max = max(self.latency_max, latency)
+            return result
+
+    @staticmethod
+    async def _call(callback, args, kwargs, endpoint):
+        """Один запрос к Bot API с метриками времени ответа и исхода по методу."""
+        API_IN_FLIGHT.inc()
+        started = time.monotonic()
+        outcome = "error"
+        try:
+            result = await callback(*args, **kwargs)
+            outcome = "ok"
+            return result
+        except RetryAfter:
+            outcome = "retry_after"
+            raise
+        except TelegramError:
+            outcome = "api_error"
+            raise
+        finally:
+            API_IN_FLIGHT.dec()
+            API_LATENCY.observe(time.monotonic() - started, method=endpoint)
+            API_REQUESTS.inc(method=endpoint, outcome=outcome)
+
+    def stats(self):
+        """Снимок метрик для мониторинга."""
+        return {
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "sent": self.sent,
+            "retries": self.retries,
+            "chats": len(self._chat_buckets),
+            "latency_avg": self.latency_sum / self.latency_count if self.latency_count else 0.0,
+            "latency_max": self.latency_max,
+        }
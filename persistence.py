@@ -0,0 +1,204 @@
+"""Состояние пользователей (context.user_data) в SQLite между перезапусками.
+
+SQLitePersistence подключается к Application как persistence
+python-telegram-bot. При запуске сохранённые данные пользователей читаются в
+память, и обработчики работают только со словарём context.user_data, не
+обращаясь к диску. Раз в update_interval секунд PTB передаёт данные
+пользователей, от которых были обновления; update_user_data() только
+сравнивает их с последней записанной версией и откладывает изменившиеся, а
+фоновая задача записывает все отложенные записи одной транзакцией в
+отдельном потоке. При остановке Application недописанное сохраняется в flush().
+
+В многопроцессном режиме (shard) процесс загружает и записывает только
+пользователей с ID % число процессов == номер процесса; обновления раздаются
+процессам по тому же ключу (sharding.shard_key). Данные чужих пользователей,
+если они всё же появились в процессе, не записываются: иначе неполный словарь
+перезаписал бы в базе настоящее состояние пользователя.
+
+Данные пользователя должны сериализоваться в JSON (кортежи станут списками).
+"""
+import asyncio
+import json
+import sqlite3
+import time
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+
+def _serialize(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+
+
+class SQLitePersistence(BasePersistence):
+    """Persistence только для user_data: кэш в памяти с отложенной пакетной записью в SQLite."""
+
+    def __init__(self, db_path, update_interval=60, shard=None):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.db_path = db_path
+        # (номер процесса, число процессов): загружать только пользователей своего процесса
+        self.shard = shard
+        self._db = None # соединение только для потока записи (и чтения при запуске)
+        self._pending = {} # ID пользователя -> JSON для записи (None — удалить)
+        self._digests = {} # ID пользователя -> hash() JSON последней записанной версии
+        self._write_task = None
+        # Метрики
+        self.written = 0
+        self.unchanged = 0 # передано PTB, но не изменилось с последней записи
+        self.foreign = 0 # не записано: пользователь другого процесса
+        self.write_errors = 0
+
+    def owns(self, user_id):
+        """Хранит ли этот процесс состояние пользователя user_id."""
+        if self.shard is None:
+            return True
+        index, count = self.shard
+        return user_id % count == index
+
+    def _open(self):
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS user_data (
+                user_id INTEGER PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+        self._db.commit()
+
+    # --- Чтение при запуске ---
+
+    async def get_user_data(self):
+        if self._db is None:
+            self._open()
+        query = "SELECT user_id, data FROM user_data"
+        params = ()
+        if self.shard is not None:
+            index, count = self.shard
+            query += " WHERE user_id % ? = ?"
+            params = (count, index)
+        user_data = {}
+        for user_id, data in self._db.execute(query, params):
+            user_data[user_id] = json.loads(data)
+            self._digests[user_id] = hash(data)
+        print(f"Состояние пользователей загружено из {self.db_path}: {len(user_data)} пользователей")
+        return user_data
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    # --- Запись ---
+
+    async def update_user_data(self, user_id, data):
+        if not self.owns(user_id):
+            self.foreign += 1
+            return
+        serialized = _serialize(data)
+        if self._digests.get(user_id) == hash(serialized):
+            self.unchanged += 1
+            return
+        self._pending[user_id] = serialized
+        self._schedule_write()
+
+    async def drop_user_data(self, user_id):
+        if not self.owns(user_id):
+            return
+        self._pending[user_id] = None
+        self._schedule_write()
+
+    def _schedule_write(self):
+        # Все update_user_data() одного прохода PTB выполняются до того, как задача
+        # начнёт писать, поэтому изменения за интервал уходят в базу одной транзакцией
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_pending())
+
+    async def _write_pending(self):
+        while self._pending:
+            batch, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except sqlite3.Error as e:
+                self.write_errors += 1
+                print(f"Ошибка записи состояния пользователей ({len(batch)} записей, повтор при следующем сохранении): {e}")
+                for user_id, serialized in batch.items():
+                    self._pending.setdefault(user_id, serialized)
+                return
+            for user_id, serialized in batch.items():
+                if serialized is None:
+                    self._digests.pop(user_id, None)
+                else:
+                    self._digests[user_id] = hash(serialized)
+            self.written += len(batch)
+
+    def _write_batch(self, batch):
+        now = time.time()
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO user_data (user_id, data, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET data = excluded.data, updated = excluded.updated",
+                [(user_id, serialized, now) for user_id, serialized in batch.items() if serialized is not None],
+            )
+            self._db.executemany(
+                "DELETE FROM user_data WHERE user_id = ?",
+                [(user_id,) for user_id, serialized in batch.items() if serialized is None],
+            )
+
+    async def flush(self):
+        """Дописывает отложенные изменения и закрывает базу (PTB вызывает при остановке)."""
+        if self._write_task is not None:
+            await self._write_task
+            self._write_task = None
+        await self._write_pending()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    # Остальные виды данных не хранятся
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    def stats(self):
+        """Снимок метрик для мониторинга."""
+        return {
+            "users": len(self._digests),
+            "pending": len(self._pending),
+            "written": self.written,
+            "unchanged": self.unchanged,
+            "foreign": self.foreign,
+            "write_errors": self.write_errors,
+        }
@@ -0,0 +1,181 @@
+"""Планы чтения ("Библия за год", "Новый Завет за 90 дней") и планировщик их доставки.
+
+build_plan() делит главы выбранных книг по порядку на дни так, чтобы объём
+чтения (число стихов) в каждый день был примерно одинаковым: короткие главы
+объединяются, а длинная глава (например, Псалом 118) занимает день одна.
+
+DeliveryScheduler — таймеры по ключу (ID пользователя) в одной куче с одной
+задачей asyncio на все таймеры: она спит до ближайшего срока, и ни отдельных
+задач на пользователя, ни периодического обхода всех пользователей нет.
+Перенос и отмена таймера не ищут старую запись в куче: она помечается
+устаревшей и пропускается, когда доходит до вершины.
+"""
+import asyncio
+import heapq
+import itertools
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+# Дольше этого планировщик не спит, чтобы переводы системных часов не сдвигали доставку надолго
+MAX_SLEEP = 60.0
+
+_UTC_OFFSET_PATTERN = re.compile(r"^(?:UTC|GMT)?([+-])(\d{1,2})(?::?(\d{2}))?$", re.IGNORECASE)
+_TIME_PATTERN = re.compile(r"^(\d{1,2}):(\d{2})$")
+
+
+def build_plan(store, book_ids, days):
+    """Делит главы книг book_ids (по порядку) на days дней. Возвращает [[(BookId, глава), ...], ...].
+
+    Глава попадает в день по середине своего интервала в накопленном числе
+    стихов, поэтому дни получаются непрерывными и равными по объёму. Дни не
+    пропускаются (после очень длинной главы следующая идёт на следующий день),
+    так что план короче days, только если глав меньше, чем дней.
+    """
+    chapters = [(book_id, chapter, len(store.verses(book_id, chapter)))
+                for book_id in book_ids if store.has_book(book_id)
+                for chapter in store.chapters(book_id)]
+    total = sum(weight for _, _, weight in chapters) or 1
+    plan = [[] for _ in range(days)]
+    passed = 0
+    previous = -1
+    for position, (book_id, chapter, weight) in enumerate(chapters):
+        day = min(days - 1, int((passed + weight / 2) * days / total), previous + 1)
+        # Оставшимся дням должно хватить глав
+        day = max(day, previous, days - (len(chapters) - position))
+        plan[day].append((book_id, chapter))
+        passed += weight
+        previous = day
+    return [day for day in plan if day]
+
+
+def parse_utc_offset(text):
+    """Смещение часового пояса в минутах из "+3", "-5", "+5:30", "UTC+3" или None."""
+    match = _UTC_OFFSET_PATTERN.match(text.strip())
+    if not match:
+        return None
+    sign, hours, minutes = match.groups()
+    offset = int(hours) * 60 + int(minutes or 0)
+    if offset > 14 * 60:
+        return None
+    return -offset if sign == "-" else offset
+
+
+def format_utc_offset(minutes):
+    sign = "-" if minutes < 0 else "+"
+    hours, rest = divmod(abs(minutes), 60)
+    return f"UTC{sign}{hours}" + (f":{rest:02d}" if rest else "")
+
+
+def parse_time(text):
+    """(часы, минуты) из "ЧЧ:ММ" или None."""
+    match = _TIME_PATTERN.match(text.strip())
+    if not match:
+        return None
+    hour, minute = int(match.group(1)), int(match.group(2))
+    if hour > 23 or minute > 59:
+        return None
+    return hour, minute
+
+
+def local_date(timestamp, utc_offset):
+    """Дата по местному времени пользователя (смещение в минутах)."""
+    return datetime.fromtimestamp(timestamp, timezone(timedelta(minutes=utc_offset))).date()
+
+
+def delivery_time(day, hour, minute, utc_offset):
+    """Метка времени UTC для местного времени hour:minute в дату day."""
+    tz = timezone(timedelta(minutes=utc_offset))
+    return datetime(day.year, day.month, day.day, hour, minute, tzinfo=tz).timestamp()
+
+
+class DeliveryScheduler:
+    """Таймеры по ключу на одной куче; срабатывания обрабатывает одна задача run()."""
+
+    def __init__(self):
+        self._heap = [] # (время срабатывания, порядковый номер, ключ)
+        self._current = {} # ключ -> порядковый номер актуального таймера
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        # Метрики
+        self.fired = 0
+
+    def __len__(self):
+        return len(self._current)
+
+    def __contains__(self, key):
+        return key in self._current
+
+    def schedule(self, key, when):
+        """Ставит (или переносит) таймер key на время when (time.time())."""
+        sequence = next(self._sequence)
+        self._current[key] = sequence
+        if not self._heap or when < self._heap[0][0]:
+            self._wakeup.set() # новый таймер раньше того, до которого спит run()
+        heapq.heappush(self._heap, (when, sequence, key))
+        # Переносы оставляют в куче устаревшие записи; если их стало больше половины, перестраиваем
+        if len(self._heap) > 1024 and len(self._heap) > 2 * len(self._current):
+            self._heap = [entry for entry in self._heap if self._current.get(entry[2]) == entry[1]]
+            heapq.heapify(self._heap)
+
+    def cancel(self, key):
+        self._current.pop(key, None)
+
+    def next_due(self):
+        """Время ближайшего актуального таймера или None."""
+        while self._heap:
+            when, sequence, key = self._heap[0]
+            if self._current.get(key) == sequence:
+                return when
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now):
+        """Снимает и возвращает ключи всех таймеров со сроком не позже now (по порядку сроков)."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, sequence, key = heapq.heappop(self._heap)
+            if self._current.get(key) == sequence:
+                del self._current[key]
+                due.append(key)
+        return due
+
+    async def run(self, callback, concurrency=30):
+        """Вызывает await callback(key) для каждого сработавшего таймера, не больше concurrency одновременно.
+
+        callback может снова поставить таймер для того же ключа (следующая доставка).
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        running = set()
+
+        async def fire(key):
+            try:
+                await callback(key)
+            finally:
+                semaphore.release()
+
+        try:
+            while True:
+                when = self.next_due()
+                delay = MAX_SLEEP if when is None else min(MAX_SLEEP, when - time.time())
+                if delay > 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                for key in self.pop_due(time.time()):
+                    await semaphore.acquire()
+                    self.fired += 1
+                    task = asyncio.create_task(fire(key))
+                    running.add(task)
+                    task.add_done_callback(running.discard)
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+    def stats(self):
+        """Снимок метрик для мониторинга."""
+        return {"timers": len(self._current), "heap": len(self._heap), "fired": self.fired}
@@ -0,0 +1,230 @@
+"""Разбор ссылок на Писание и распознавание названий книг.
+
+BookResolver строится один раз из словаря алиасов (BOOK_MAPPING) и хранит
+нормализованные алиасы в префиксном дереве. Поиск идёт в три шага:
+точное совпадение, однозначный префикс (например, "иоан" -> Иоанн) и
+нечёткое совпадение с ограниченным расстоянием Дамерау-Левенштейна
+("откровенее" -> Откровение, "быите" -> Бытие). Для нечёткого поиска заранее
+строится индекс вариантов алиасов с удалёнными буквами (symmetric delete), поэтому
+стоимость запроса зависит от длины запроса, а не от размера таблицы алиасов.
+"""
+import re
+
+# Минимальная длина запроса для поиска по префиксу
+MIN_PREFIX_LENGTH = 2
+# Нечёткий поиск выполняется только для запросов длиннее этого значения
+MIN_FUZZY_LENGTH = 3
+# Наибольшее допустимое число опечаток (для длинных запросов)
+MAX_EDIT_DISTANCE = 2
+
+_REFERENCE_RE = re.compile(r"^(.*?\D)\s*(\d+)(?:[:,.](\d+)(?:\s*[-–—]\s*(\d+))?)?$")
+_SEPARATORS_RE = re.compile(r"[.\-_–—]")
+_DIGIT_PREFIX_RE = re.compile(r"^(\d)\s*(?=\D)")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_book_name(text):
+    """Приводит название книги к каноническому для поиска виду.
+
+    Нижний регистр, "ё" -> "е", точки и дефисы -> пробелы, номер книги отделяется
+    пробелом ("1кор" -> "1 кор"), повторяющиеся пробелы схлопываются.
+    """
+    text = text.lower().replace('ё', 'е')
+    text = _SEPARATORS_RE.sub(' ', text)
+    text = _SPACES_RE.sub(' ', text).strip()
+    return _DIGIT_PREFIX_RE.sub(r'\1 ', text)
+
+
+def parse_reference(query):
+    """Разбирает ссылку вида "Книга Глава[:Стих[-Стих]]".
+
+    Возвращает (книга, глава, первый стих, последний стих) — номера как int,
+    отсутствующие стихи как None — или None, если строка не похожа на ссылку.
+    Допускаются "Ин3:16", "Ин 3,16" и диапазоны через тире.
+    """
+    match = _REFERENCE_RE.match(query.strip())
+    if not match:
+        return None
+    book_raw, chapter_str, verse_start_str, verse_end_str = match.groups()
+    book_raw = book_raw.strip()
+    if not book_raw:
+        return None
+    verse_start = int(verse_start_str) if verse_start_str else None
+    verse_end = int(verse_end_str) if verse_end_str else verse_start
+    return book_raw, int(chapter_str), verse_start, verse_end
+
+
+def max_edit_distance(length):
+    """Допустимое число опечаток для запроса заданной длины."""
+    if length <= MIN_FUZZY_LENGTH:
+        return 0
+    if length <= 6:
+        return 1
+    return MAX_EDIT_DISTANCE
+
+
+def _deletions(word, max_distance):
+    """Сам word и все его варианты с max_distance и менее удалёнными буквами.
+
+    Варианты короче MIN_FUZZY_LENGTH не нужны: такие запросы не ищутся нечётко.
+    """
+    variants = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        next_frontier = set()
+        for variant in frontier:
+            if len(variant) <= MIN_FUZZY_LENGTH:
+                continue
+            for i in range(len(variant)):
+                next_frontier.add(variant[:i] + variant[i + 1:])
+        variants |= next_frontier
+        frontier = next_frontier
+    return variants
+
+
+def edit_distance(a, b, max_distance):
+    """Расстояние Дамерау-Левенштейна (перестановка соседних букв — одна правка).
+
+    Если расстояние больше max_distance, возвращается max_distance + 1.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    before_previous_row = None
+    previous_row = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        row = [i]
+        for j, char_b in enumerate(b, 1):
+            cost = min(row[j - 1] + 1, previous_row[j] + 1, previous_row[j - 1] + (char_a != char_b))
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                cost = min(cost, before_previous_row[j - 2] + 1)
+            row.append(cost)
+        if min(row) > max_distance:
+            return max_distance + 1
+        before_previous_row, previous_row = previous_row, row
+    return min(previous_row[-1], max_distance + 1)
+
+
+class _TrieNode:
+    __slots__ = ("children", "book", "prefix_book")
+
+    def __init__(self):
+        self.children = {}
+        self.book = None # Каноническое название, если здесь заканчивается алиас
+        self.prefix_book = None # Единственная книга среди всех алиасов поддерева, иначе None
+
+
+_AMBIGUOUS = object()
+
+
+class BookResolver:
+    """Распознаёт название книги по пользовательскому вводу."""
+
+    def __init__(self, book_mapping):
+        """book_mapping: алиас (str) -> каноническое название книги (str)."""
+        self._root = _TrieNode()
+        self._aliases = {} # Нормализованный алиас -> каноническое название
+        self._deletes = {} # Алиас с удалёнными буквами -> нормализованные алиасы
+        for alias, book_name_canonical in book_mapping.items():
+            self._add_alias(normalize_book_name(alias), book_name_canonical)
+        self._finalize(self._root)
+
+    @property
+    def alias_count(self):
+        return len(self._aliases)
+
+    def _add_alias(self, alias, book_name_canonical):
+        node = self._root
+        for char in alias:
+            node = node.children.setdefault(char, _TrieNode())
+        node.book = book_name_canonical
+        if alias not in self._aliases:
+            for variant in _deletions(alias, max_edit_distance(len(alias) + MAX_EDIT_DISTANCE)):
+                self._deletes.setdefault(variant, []).append(alias)
+        self._aliases[alias] = book_name_canonical
+
+    def _finalize(self, root):
+        # Обход в обратном порядке без рекурсии: книга поддерева однозначна,
+        # если все алиасы в нём ведут к одной канонической книге.
+        order = []
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(node.children.values())
+        for node in reversed(order):
+            book = node.book
+            for child in node.children.values():
+                child_book = child.prefix_book
+                if child_book is None:
+                    continue
+                if book is None:
+                    book = child_book
+                elif book != child_book:
+                    book = _AMBIGUOUS
+            node.prefix_book = book
+        for node in order:
+            if node.prefix_book is _AMBIGUOUS:
+                node.prefix_book = None
+
+    def _find_node(self, normalized):
+        node = self._root
+        for char in normalized:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def _fuzzy(self, normalized, max_distance):
+        """Все книги в пределах max_distance: список (расстояние, книга)."""
+        if max_distance <= 0 or not normalized:
+            return []
+        results = {}
+        checked = set()
+        for variant in _deletions(normalized, max_distance):
+            for alias in self._deletes.get(variant, ()):
+                if alias in checked:
+                    continue
+                checked.add(alias)
+                distance = edit_distance(normalized, alias, max_distance)
+                book = self._aliases[alias]
+                if distance <= max_distance and distance < results.get(book, max_distance + 1):
+                    results[book] = distance
+        return sorted((distance, book) for book, distance in results.items())
+
+    def resolve(self, text):
+        """Возвращает каноническое название книги или None, если распознать однозначно нельзя."""
+        normalized = normalize_book_name(text)
+        if not normalized:
+            return None
+        node = self._find_node(normalized)
+        if node is not None:
+            if node.book is not None:
+                return node.book
+            if len(normalized) >= MIN_PREFIX_LENGTH and node.prefix_book is not None:
+                return node.prefix_book
+        candidates = self._fuzzy(normalized, max_edit_distance(len(normalized)))
+        if not candidates:
+            return None
+        if len(candidates) > 1 and candidates[1][0] == candidates[0][0]:
+            return None
+        return candidates[0][1]
+
+    def suggest(self, text, limit=5):
+        """Возможные книги для нераспознанного ввода, от наиболее вероятной."""
+        normalized = normalize_book_name(text)
+        if not normalized:
+            return []
+        suggestions = []
+        node = self._find_node(normalized)
+        if node is not None and len(normalized) >= MIN_PREFIX_LENGTH:
+            stack = [node]
+            while stack:
+                current = stack.pop()
+                if current.book is not None and current.book not in suggestions:
+                    suggestions.append(current.book)
+                stack.extend(current.children.values())
+            suggestions.sort()
+        for _, book in self._fuzzy(normalized, max(1, max_edit_distance(len(normalized)))):
+            if book not in suggestions:
+                suggestions.append(book)
+        return suggestions[:limit]
@@ -0,0 +1,312 @@
+"""Полнотекстовый поиск по стихам через инвертированный индекс.
+
+Индекс строится по BibleStore: каждый стих разбивается на слова, слова
+приводятся к основе простым русским стеммером, и для каждой основы хранится
+список стихов (по сквозному индексу стиха) с позициями слова в стихе.
+Списки сжаты: номера стихов и позиции записаны приращениями в varint.
+
+Запрос — это слова (все должны встретиться в стихе, AND) и фразы в кавычках
+(слова подряд). Результаты ранжируются по BM25 и возвращаются top-K.
+Индекс сохраняется на диск и при следующем запуске просто читается.
+"""
+import heapq
+import math
+import os
+import re
+import struct
+import sys
+from array import array
+
+from cache import LRUCache
+
+INDEX_MAGIC = b"TGSIDX01"
+# magic, verse_count, text_size (отпечаток хранилища), n_terms, terms_len, postings_len
+_HEADER = struct.Struct("<8sIIIII")
+
+# Параметры BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r"\w+")
+_PHRASE_RE = re.compile(r'"([^"]+)"|«([^»]+)»')
+
+# Окончания по убыванию длины; отрезается первое подходящее, если остаётся основа не короче 3 букв
+_ENDINGS = sorted("""
+    иями ями ами ией иям ием иях ого его ому ему ыми ими ость ости остью
+    ешь ишь ете ите ают яют ует уют ала яла ила ало ило али или ыли
+    ая яя ое ее ые ие ый ий ой ей ом ем ам ям ах ях ов ев ью ию ия ии
+    ть ти ла ло ли ет ит ут ют ат ят ал ил ыл ул
+    а я о е ы и у ю ь й
+""".split(), key=len, reverse=True)
+_REFLEXIVE = ("ся", "сь")
+MIN_STEM_LENGTH = 3
+
+# Служебные слова пропускаются в AND-запросах (но не внутри фраз)
+STOP_WORDS = frozenset("""
+    и в во не на с со что а но к ко у по за о об от из до же ли бы то как так
+    он она оно они его ее их мы вы я ты мне тебе нам вам все это для при
+""".split())
+
+
+def tokenize(text):
+    """Слова текста в нижнем регистре, "ё" -> "е"."""
+    return _WORD_RE.findall(text.lower().replace('ё', 'е'))
+
+
+def stem(word):
+    """Отрезает типичное русское окончание: "любовью" -> "любов", "сказал" -> "сказ"."""
+    for suffix in _REFLEXIVE:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM_LENGTH:
+            word = word[:-len(suffix)]
+            break
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def _encode_varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_postings(blob, start, end):
+    """Декодирует список словопозиций: {индекс стиха: (позиции...)}."""
+    postings = {}
+    pos = start
+    verse = 0
+    while pos < end:
+        values = []
+        # Номер стиха (приращение), число вхождений и приращения позиций
+        for _ in range(2):
+            shift = value = 0
+            while True:
+                byte = blob[pos]
+                pos += 1
+                value |= (byte & 0x7F) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+            values.append(value)
+        verse += values[0]
+        positions = []
+        position = 0
+        for _ in range(values[1]):
+            shift = value = 0
+            while True:
+                byte = blob[pos]
+                pos += 1
+                value |= (byte & 0x7F) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+            position += value
+            positions.append(position)
+        postings[verse] = tuple(positions)
+    return postings
+
+
+def _uint_bytes(typecode, values):
+    arr = array(typecode, values)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _uint_array(typecode, raw):
+    arr = array(typecode)
+    arr.frombytes(raw)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr
+
+
+def build_index(bible_store, index_path):
+    """Строит индекс по всем стихам хранилища и сохраняет его в index_path."""
+    term_postings = {}
+    doc_lengths = []
+    stems_by_word = {}
+    for verse_index in range(bible_store.verse_count):
+        stems = []
+        for word in tokenize(bible_store.verse_text_at(verse_index)):
+            term = stems_by_word.get(word)
+            if term is None:
+                term = stems_by_word[word] = stem(word)
+            stems.append(term)
+        doc_lengths.append(min(len(stems), 0xFFFF))
+        positions_by_term = {}
+        for position, term in enumerate(stems):
+            positions_by_term.setdefault(term, []).append(position)
+        for term, positions in positions_by_term.items():
+            term_postings.setdefault(term, []).append((verse_index, positions))
+
+    terms = sorted(term_postings)
+    term_offsets = []
+    doc_freqs = []
+    postings_blob = bytearray()
+    for term in terms:
+        term_offsets.append(len(postings_blob))
+        doc_freqs.append(len(term_postings[term]))
+        previous_verse = 0
+        for verse_index, positions in term_postings[term]:
+            _encode_varint(verse_index - previous_verse, postings_blob)
+            _encode_varint(len(positions), postings_blob)
+            previous_position = 0
+            for position in positions:
+                _encode_varint(position - previous_position, postings_blob)
+                previous_position = position
+            previous_verse = verse_index
+    term_offsets.append(len(postings_blob))
+    terms_blob = "\n".join(terms).encode('utf-8')
+
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(INDEX_MAGIC, bible_store.verse_count, bible_store.text_size,
+                             len(terms), len(terms_blob), len(postings_blob)))
+        f.write(_uint_bytes("H", doc_lengths))
+        f.write(_uint_bytes("I", term_offsets))
+        f.write(_uint_bytes("I", doc_freqs))
+        f.write(terms_blob)
+        f.write(postings_blob)
+    os.replace(tmp_path, index_path)
+
+
+class SearchIndex:
+    """Загруженный с диска индекс. Открывается через open_index()."""
+
+    def __init__(self, index_path, postings_cache_size=256, results_cache_size=1024):
+        with open(index_path, 'rb') as f:
+            data = f.read()
+        magic, verse_count, text_size, n_terms, terms_len, postings_len = _HEADER.unpack_from(data, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"Файл {index_path} не является поисковым индексом.")
+        self.verse_count = verse_count
+        self.text_size = text_size
+        offset = _HEADER.size
+        self._doc_lengths = _uint_array("H", data[offset:offset + verse_count * 2])
+        offset += verse_count * 2
+        self._term_offsets = _uint_array("I", data[offset:offset + (n_terms + 1) * 4])
+        offset += (n_terms + 1) * 4
+        self._doc_freqs = _uint_array("I", data[offset:offset + n_terms * 4])
+        offset += n_terms * 4
+        terms = data[offset:offset + terms_len].decode('utf-8').split("\n") if n_terms else []
+        self._term_ids = {term: i for i, term in enumerate(terms)}
+        offset += terms_len
+        self._postings = data[offset:offset + postings_len]
+        avg_length = (sum(self._doc_lengths) / verse_count) if verse_count else 0.0
+        # Знаменатель BM25 для каждого стиха считаем заранее
+        self._length_norms = [BM25_K1 * (1 - BM25_B + BM25_B * length / (avg_length or 1))
+                              for length in self._doc_lengths]
+        # Распакованные списки частых слов и ответы на частые запросы держим в памяти
+        self._postings_cache = LRUCache(postings_cache_size)
+        self.results_cache = LRUCache(results_cache_size)
+
+    @property
+    def term_count(self):
+        return len(self._term_ids)
+
+    def _term_postings(self, term):
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            return {}
+        postings = self._postings_cache.get(term_id)
+        if postings is None:
+            postings = _decode_postings(self._postings, self._term_offsets[term_id], self._term_offsets[term_id + 1])
+            self._postings_cache.put(term_id, postings)
+        return postings
+
+    def _idf(self, term):
+        term_id = self._term_ids.get(term)
+        doc_freq = self._doc_freqs[term_id] if term_id is not None else 0
+        return math.log(1 + (self.verse_count - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    @staticmethod
+    def parse_query(query):
+        """Разбирает запрос: (список основ для AND, список фраз — списков основ)."""
+        phrases = []
+        for match in _PHRASE_RE.finditer(query):
+            stems = [stem(word) for word in tokenize(match.group(1) or match.group(2))]
+            if stems:
+                phrases.append(stems)
+        rest = _PHRASE_RE.sub(" ", query)
+        words = tokenize(rest)
+        terms = [stem(word) for word in words if word not in STOP_WORDS]
+        if not terms and not phrases:
+            # Запрос только из служебных слов ищем как есть
+            terms = [stem(word) for word in words]
+        return list(dict.fromkeys(terms)), phrases
+
+    def search(self, query, limit=10):
+        """Возвращает (число найденных стихов, [(индекс стиха, оценка), ...] top-limit)."""
+        terms, phrases = self.parse_query(query)
+        if not terms and not phrases:
+            return 0, []
+        cache_key = (tuple(terms), tuple(map(tuple, phrases)), limit)
+        result = self.results_cache.get(cache_key)
+        if result is None:
+            result = self._search(terms, phrases, limit)
+            self.results_cache.put(cache_key, result)
+        return result
+
+    def _search(self, terms, phrases, limit):
+        required = set(terms)
+        for phrase in phrases:
+            required.update(phrase)
+        # Пересекаем списки, начиная с самого короткого
+        order = sorted(required, key=lambda term: self._doc_freqs[self._term_ids[term]] if term in self._term_ids else 0)
+        postings_by_term = {}
+        candidates = None
+        for term in order:
+            postings = postings_by_term[term] = self._term_postings(term)
+            if candidates is None:
+                candidates = set(postings)
+            else:
+                candidates.intersection_update(postings.keys())
+            if not candidates:
+                return 0, []
+
+        phrase_hits = {}
+        for phrase in phrases:
+            phrase_postings = [postings_by_term[term] for term in phrase]
+            matched = set()
+            for verse_index in candidates:
+                following = [set(postings[verse_index]) for postings in phrase_postings[1:]]
+                count = sum(1 for start in phrase_postings[0][verse_index]
+                            if all(start + offset in positions for offset, positions in enumerate(following, 1)))
+                if count:
+                    matched.add(verse_index)
+                    phrase_hits[verse_index] = phrase_hits.get(verse_index, 0) + count
+            candidates = matched
+            if not candidates:
+                return 0, []
+
+        scores = dict.fromkeys(candidates, 0.0)
+        length_norms = self._length_norms
+        for term in required:
+            idf = self._idf(term) * (BM25_K1 + 1)
+            postings = postings_by_term[term]
+            for verse_index in candidates:
+                tf = len(postings[verse_index])
+                scores[verse_index] += idf * tf / (tf + length_norms[verse_index])
+        # Точное совпадение фразы ценнее, чем просто все слова в стихе
+        for verse_index, count in phrase_hits.items():
+            scores[verse_index] += count
+        scored = [(score, -verse_index) for verse_index, score in scores.items()]
+        top = heapq.nlargest(limit, scored)
+        return len(candidates), [(-negative_index, score) for score, negative_index in top]
+
+
+def open_index(bible_store, index_path):
+    """Открывает индекс, пересобирая его, если его нет или он построен по другому хранилищу."""
+    if os.path.exists(index_path):
+        try:
+            index = SearchIndex(index_path)
+            if (index.verse_count, index.text_size) == (bible_store.verse_count, bible_store.text_size):
+                return index
+        except (ValueError, struct.error):
+            pass
+    print(f"Построение поискового индекса {index_path}...")
+    build_index(bible_store, index_path)
+    return SearchIndex(index_path)
@@ -0,0 +1,128 @@
+"""Многопроцессный режим бота (WORKERS > 1).
+
+Фронтальный процесс получает обновления (webhook или polling) и пересылает
+их JSON по паре сокетов одному из N рабочих процессов: номер процесса —
+ID пользователя % N (для обновлений без пользователя, например постов
+каналов, — chat_id % N). Так все обновления одного пользователя, в личном чате
+и в группах, обрабатываются по порядку тем же процессом, который загрузил его
+состояние (SQLitePersistence с shard), а лимиты личного чата и отмена
+устаревших inline-запросов работают без общего состояния. Обновления одной
+группы от разных пользователей могут попасть в разные процессы, поэтому лимит
+на групповой чат делится между процессами.
+
+Данные Библии загружаются в родительском процессе до fork: mmap-хранилище
+разделяется через страничный кэш ОС, а индексы, меню и прогретый кэш — по
+принципу copy-on-write (перед fork вызывается gc.freeze(), чтобы сборщик
+мусора не трогал унаследованные объекты и не копировал их страницы).
+"""
+import asyncio
+import gc
+import json
+import os
+import signal
+import socket
+import traceback
+
+from telegram import Update
+
+# Наибольшая длина строки с обновлением в канале фронт -> рабочий процесс
+MAX_UPDATE_SIZE = 1 << 20
+
+
+def shard_key(update):
+    """Ключ шардирования обновления: пользователь, иначе чат, иначе update_id.
+
+    Должен совпадать с ключом, по которому процесс загружает состояние
+    пользователей (SQLitePersistence.owns): в группе chat_id не совпадает с ID
+    пользователя, и шардирование по чату отправило бы обновление процессу, у
+    которого нет данных этого пользователя.
+    """
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return update.update_id
+
+
+def fork_workers(count, worker_main):
+    """Запускает count рабочих процессов через fork.
+
+    worker_main(index, sock) выполняется в дочернем процессе, который затем
+    завершается. Возвращает список (pid, сокет) для родительского процесса.
+    """
+    gc.freeze()
+    workers = []
+    for index in range(count):
+        parent_sock, child_sock = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            parent_sock.close()
+            for _, other_sock in workers:
+                other_sock.close()
+            # Останавливает рабочий процесс фронт (закрывая сокет), а не сигнал,
+            # пришедший всей группе процессов от Ctrl+C
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            exit_code = 0
+            try:
+                worker_main(index, child_sock)
+            except BaseException:
+                traceback.print_exc()
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        child_sock.close()
+        workers.append((pid, parent_sock))
+    return workers
+
+
+def wait_workers(workers):
+    """Ждёт завершения рабочих процессов. Возвращает {pid: код выхода}."""
+    exit_codes = {}
+    for pid, sock in workers:
+        sock.close()
+        _, status = os.waitpid(pid, 0)
+        exit_codes[pid] = os.waitstatus_to_exitcode(status)
+    return exit_codes
+
+
+class UpdateDispatcher:
+    """Фронтальная сторона: раздаёт обновления рабочим процессам по shard_key."""
+
+    def __init__(self, worker_sockets):
+        self._sockets = worker_sockets
+        self._writers = []
+        self.dispatched = [0] * len(worker_sockets)
+
+    async def start(self):
+        for sock in self._sockets:
+            _, writer = await asyncio.open_connection(sock=sock)
+            self._writers.append(writer)
+
+    async def stop(self):
+        for writer in self._writers:
+            writer.close()
+        await asyncio.gather(*(writer.wait_closed() for writer in self._writers), return_exceptions=True)
+        self._writers = []
+
+    async def dispatch(self, update, context=None):
+        """Пересылает обновление; подходит как callback для TypeHandler(Update, ...)."""
+        index = shard_key(update) % len(self._writers)
+        writer = self._writers[index]
+        writer.write(json.dumps(update.to_dict(), ensure_ascii=False).encode('utf-8') + b"\n")
+        self.dispatched[index] += 1
+        # Если рабочий процесс не успевает, фронт ждёт, пока освободится буфер сокета
+        await writer.drain()
+
+
+async def serve_updates(application, sock):
+    """Сторона рабочего процесса: читает обновления из сокета в очередь Application до EOF."""
+    reader, writer = await asyncio.open_connection(sock=sock, limit=MAX_UPDATE_SIZE)
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            await application.update_queue.put(Update.de_json(json.loads(line), application.bot))
+    finally:
+        writer.close()
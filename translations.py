@@ -0,0 +1,114 @@
+"""Реестр переводов Библии с ленивой загрузкой.
+
+Каждый перевод — отдельный bible.json с теми же BookId, который компилируется
+в своё mmap-хранилище (см. bible_store.py). Перевод открывается при первом
+обращении (сборка хранилища и открытие идут в отдельном потоке, чтобы не
+блокировать цикл событий), а когда суммарный размер открытых хранилищ
+превышает бюджет памяти, закрываются давно не использовавшиеся переводы.
+Основной перевод бота закреплён и не выгружается.
+"""
+import asyncio
+import os
+import time
+
+from bible_store import open_store
+
+
+class Translation:
+    """Описание перевода: код, название и пути к исходному JSON и хранилищу."""
+
+    def __init__(self, code, title, json_path, store_path=None):
+        self.code = code
+        self.title = title
+        self.json_path = json_path
+        self.store_path = store_path or os.path.splitext(json_path)[0] + ".bin"
+
+
+class TranslationRegistry:
+    """Переводы по коду; открытые хранилища живут, пока укладываются в бюджет памяти."""
+
+    def __init__(self, aliases_path, memory_budget=64 * 2 ** 20, idle_seconds=600):
+        self.aliases_path = aliases_path
+        self.memory_budget = memory_budget # байт на все открытые хранилища
+        self.idle_seconds = idle_seconds # раньше этого перевод не выгружается
+        self._translations = {} # код -> Translation, в порядке регистрации
+        self._stores = {} # код -> открытый BibleStore
+        self._last_used = {} # код -> time.monotonic() последнего обращения
+        self._pinned = set()
+        self._locks = {}
+        # Метрики
+        self.loads = 0
+        self.evictions = 0
+
+    def register(self, translation, store=None):
+        """Добавляет перевод. Уже открытое хранилище store закрепляется и не выгружается."""
+        self._translations[translation.code] = translation
+        if store is not None:
+            self._stores[translation.code] = store
+            self._last_used[translation.code] = time.monotonic()
+            self._pinned.add(translation.code)
+
+    def codes(self):
+        return list(self._translations)
+
+    def __contains__(self, code):
+        return code in self._translations
+
+    def title(self, code):
+        return self._translations[code].title
+
+    def get(self, code):
+        """Открытое хранилище перевода; перед этим перевод должен быть загружен через load()."""
+        store = self._stores[code]
+        self._last_used[code] = time.monotonic()
+        return store
+
+    async def load(self, code):
+        """Возвращает хранилище перевода, при необходимости открывая (и собирая) его."""
+        if code in self._stores:
+            return self.get(code)
+        lock = self._locks.setdefault(code, asyncio.Lock())
+        async with lock:
+            if code not in self._stores:
+                translation = self._translations[code]
+                print(f"Загрузка перевода {code} ({translation.title}) из {translation.store_path}...")
+                store = await asyncio.to_thread(open_store, translation.json_path, self.aliases_path,
+                                                translation.store_path)
+                self._stores[code] = store
+                self.loads += 1
+        store = self.get(code)
+        self.evict_idle(keep=code)
+        return store
+
+    def loaded_bytes(self):
+        return sum(os.path.getsize(store.path) for store in self._stores.values())
+
+    def evict_idle(self, keep=None):
+        """Выгружает давно не использовавшиеся переводы, пока открытые хранилища не уложатся в бюджет.
+
+        Перевод keep (только что запрошенный) не выгружается, поэтому сразу после
+        load() он доступен через get(). Хранилище не закрывается явно: обработчик, который ещё держит ссылку на
+        него, дочитает данные, а mmap освободится вместе с последней ссылкой.
+        """
+        total = self.loaded_bytes()
+        now = time.monotonic()
+        for code in sorted(self._stores, key=self._last_used.get):
+            if total <= self.memory_budget:
+                break
+            if code in self._pinned or code == keep or now - self._last_used[code] < self.idle_seconds:
+                continue
+            store = self._stores.pop(code)
+            total -= os.path.getsize(store.path)
+            self.evictions += 1
+            print(f"Перевод {code} выгружен из памяти (не использовался {now - self._last_used[code]:.0f} с).")
+
+    def stats(self):
+        """Снимок метрик для мониторинга."""
+        return {
+            "translations": len(self._translations),
+            "loaded": len(self._stores),
+            "loaded_bytes": self.loaded_bytes(),
+            "memory_budget": self.memory_budget,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }